@@ -4,16 +4,46 @@ Sistema: API-Validador-Formatos-Datos-Abiertos
 Autor: Mtro. Francisco Daniel Martínez Martínez
 Versión: v8.9.3 (Flask 3 fix: startup via before_request + send_file compat + rutas absolutas)
 """
-import io, os, re, json, csv, time
-from datetime import datetime, timedelta
-from flask import Flask, request, render_template, send_file, after_this_request, current_app
+from __future__ import annotations  # anotaciones como texto: pl.DataFrame no obliga a importar polars
+import io, os, re, json, csv, time, codecs, base64, tempfile, threading, multiprocessing, hashlib, zipfile
+import queue, atexit, cProfile, hmac, mmap, random, sqlite3, importlib, importlib.util, secrets
+from bisect import bisect_left
+from contextlib import contextmanager
+from itertools import islice
+from functools import lru_cache
+from typing import TYPE_CHECKING
+from datetime import date, datetime, timedelta
+from flask import Flask, request, render_template, send_file, after_this_request, current_app, jsonify, url_for, g
+from werkzeug.exceptions import ClientDisconnected
 from werkzeug.utils import secure_filename
-import polars as pl
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import cm
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from inspect import signature
+
+if TYPE_CHECKING:  # solo para anotaciones: el pool se importa al crearlo
+    from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import fcntl  # bloqueo entre workers (POSIX)
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# ---------------- IMPORTACIONES DIFERIDAS ----------------
+# polars y reportlab se importan en el primer uso (reportlab dentro de las funciones del PDF):
+# un worker nuevo atiende "/" o /estado sin pagarlas. Con VALIDADOR_PRECARGA=1 (gunicorn
+# --preload) se importan en el maestro y los workers las heredan por fork (ver precargar).
+class ModuloDiferido:
+    """Módulo que se importa al leer su primer atributo; el candado cubre hilos simultáneos."""
+    def __init__(self, nombre):
+        self._nombre = nombre
+        self._modulo = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        if self._modulo is None:
+            with self._lock:
+                if self._modulo is None:
+                    self._modulo = importlib.import_module(self._nombre)
+        return getattr(self._modulo, attr)
+
+pl = ModuloDiferido("polars")
 
 # ---------------- BASE Y DIRECTORIOS (ABSOLUTOS) ----------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -25,18 +55,307 @@ RESULTS_FOLDER  = P("resultados")
 LOGOS_FOLDER    = P("logos")
 LOGS_FOLDER     = P("logs")
 REPORTS_FOLDER  = P("reportes")
+CACHE_FOLDER    = P("cache")
+METRICAS_FOLDER = P("metricas")
+PERFILES_FOLDER = P("perfiles")
+ANALITICA_FOLDER = P("analitica")
 ALLOWED_EXTENSIONS = {"csv", "xls", "xlsx"}
 
+# Cambiar al modificar cualquier validador u observación: invalida la caché de resultados
+VERSION_REGLAS = "8.9.3-2"
+
 # Crear directorios necesarios
-for folder in [UPLOAD_FOLDER, RESULTS_FOLDER, LOGOS_FOLDER, LOGS_FOLDER, REPORTS_FOLDER]:
+for folder in [UPLOAD_FOLDER, RESULTS_FOLDER, LOGOS_FOLDER, LOGS_FOLDER, REPORTS_FOLDER, CACHE_FOLDER,
+               METRICAS_FOLDER, PERFILES_FOLDER, ANALITICA_FOLDER]:
     os.makedirs(folder, exist_ok=True)
 
 app = Flask(__name__)
 app.config["MAX_CONTENT_LENGTH"] = 256 * 1024 * 1024  # 256MB
+app.config["VALIDACION_STREAMING"] = True  # CSV vía pl.scan_csv sobre el temporal (memoria acotada)
+# ver EXCEL_LECTORES; "calamine" requiere fastexcel (opcional)
+app.config["EXCEL_BACKEND"] = "calamine" if importlib.util.find_spec("fastexcel") else "openpyxl"
+app.config["JOBS_MAX_WORKERS"] = 2         # validaciones simultáneas por proceso web
+app.config["JOBS_MAX_PENDIENTES"] = 8      # en cola + en proceso; más allá responde 429
+app.config["JOBS_TIMEOUT_S"] = 300         # tiempo máximo por trabajo
+app.config["JOBS_MARGEN_S"] = 30           # vencido por más de esto, /estado lo da por perdido (ver leer_job)
+app.config["AUDITORIA_ASINCRONA"] = True    # log/reporte escritos por un hilo en lotes (ver EscritorAuditoria)
+app.config["AUDITORIA_FSYNC"] = False
+app.config["RESULTADOS_BACKEND"] = "sqlite"  # ver ALMACENES_RESULTADOS ("memoria": un solo worker)
+app.config["RESULTADOS_DB"] = os.path.join(RESULTS_FOLDER, "resultados.sqlite3")
+app.config["RESULTADOS_TTL_H"] = 24         # FINAL y estado de trabajos vencen tras este tiempo
+app.config["RESULTADOS_PURGA_S"] = 600      # cada cuánto borra vencidos el hilo de purga
+app.config["METRICAS_VOLCADO_S"] = 5       # cada cuánto vuelca cada worker sus métricas para /metrics
+app.config["PDF_STREAMING"] = True         # /descargar/pdf: PDF escrito a disco y servido por ruta (ver construir_pdf_archivo)
+app.config["CACHE_HABILITADA"] = True      # resultados por hash del contenido (ver CacheDisco)
+app.config["CACHE_MAX_ENTRADAS"] = 1000
+app.config["CACHE_MAX_MB"] = 512
+app.config["MUESTRA_FILAS"] = 100_000        # modo "muestra": filas revisadas por archivo
+app.config["PERFIL_MAX_NULOS"] = 0.5        # perfil=1: proporción de vacíos por columna que se reporta
+app.config["INCREMENTAL_BLOQUE_MB"] = 4      # incremental=1: tamaño objetivo de cada bloque de filas
+app.config["CARGA_MAX_MB"] = 2048          # /api/v1/cargas: tamaño del archivo completo
+app.config["CARGA_PARTE_MB"] = 8           # tamaño sugerido de cada PUT (cada parte respeta MAX_CONTENT_LENGTH)
+app.config["LOTE_MAX_ARCHIVOS"] = 100      # /validar/lote: archivos por petición (incluye los del ZIP)
+app.config["LOTE_MAX_MB_DESCOMPRIMIDOS"] = 1024
+app.config["LOTE_MAX_WORKERS"] = os.cpu_count() or 2
+app.config["REGLAS_ARCHIVO"] = P("reglas.json")  # reglas de nombres de archivo/columnas (ver ReglasNombres)
+# Header X-Perfilar con este valor: la petición se perfila con cProfile en PERFILES_FOLDER
+app.config["PERFILADO_TOKEN"] = os.environ.get("VALIDADOR_PERFILADO_TOKEN")  # None = deshabilitado
+# Header X-Analitica con este valor: /api/v1/analitica (los reportes incluyen IPs)
+app.config["ANALITICA_TOKEN"] = os.environ.get("VALIDADOR_ANALITICA_TOKEN")  # None = deshabilitado
+app.config["ANALITICA_DIAS"] = 90            # periodo por omisión de /api/v1/analitica
+
+CHUNK_SIZE = 1024 * 1024  # 1MB por bloque al copiar/inspeccionar uploads
+FILAS_INFERENCIA = 10_000  # filas con las que Polars infiere los tipos del CSV
+
+# ---------------- MÉTRICAS ----------------
+# Histogramas y contadores en formato de texto de Prometheus (/metrics). Cada proceso web
+# acumula en memoria y un hilo vuelca su estado cada METRICAS_VOLCADO_S segundos (y al
+# salir) a METRICAS_FOLDER/metricas_{pid}_{sufijo}.json; /metrics suma los archivos de
+# todos los workers más metricas_historico.json, donde se consolidan los de procesos que
+# ya terminaron.
+BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+METRICAS_DEF = {  # nombre: (tipo, ayuda, buckets)
+    "validador_etapa_segundos": ("histogram", "Duración de cada etapa de la validación.", BUCKETS_SEGUNDOS),
+    "validador_validacion_segundos": ("histogram", "Tiempo de procesamiento por archivo.", BUCKETS_SEGUNDOS),
+    "validador_regla_segundos": ("histogram", "Duración de cada regla de nombres de archivo/columnas.",
+                                 BUCKETS_SEGUNDOS),
+    "validador_filas": ("histogram", "Filas por archivo validado.",
+                        (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)),
+    "validador_columnas": ("histogram", "Columnas por archivo validado.", (1, 5, 10, 25, 50, 100, 250, 500, 1000)),
+    "validador_bytes_por_segundo": ("histogram", "Bytes del archivo entre el tiempo de validación.",
+                                    (1e5, 1e6, 1e7, 5e7, 1e8, 2.5e8, 5e8, 1e9)),
+    "validador_validaciones_total": ("counter", "Archivos validados por estado y caché.", None),
+    "validador_bytes_total": ("counter", "Bytes de archivos validados.", None),
+}
+# Etapas de ejecutar_validacion (las que cuentan para bytes/s); además: json, auditoria y pdf
+ETAPAS_VALIDACION = ("carga", "archivo", "columnas", "datos", "perfil", "conteo")
+
+class Metricas:
+    """Series por (nombre, etiquetas). Histograma: [conteo por bucket..., +Inf, suma]; contador: [valor]."""
+    def __init__(self, definiciones):
+        self.definiciones = definiciones
+        self._lock = threading.Lock()
+        self._volcado_lock = threading.Lock()
+        self._series = {}
+        self._pid, self._archivo = os.getpid(), None
+        self._version, self._volcada = 0, 0
+
+    def _serie(self, nombre, etiquetas):
+        if self._pid != os.getpid():
+            # Proceso hijo de un fork: lo heredado ya lo cuenta el archivo del padre
+            self._series, self._pid, self._archivo = {}, os.getpid(), None
+            self._version = self._volcada = 0
+        self._version += 1
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        serie = self._series.get(clave)
+        if serie is None:
+            buckets = self.definiciones[nombre][2]
+            serie = self._series[clave] = [0] * (len(buckets) + 1) + [0.0] if buckets else [0.0]
+        return serie
+
+    def observar(self, nombre, valor, **etiquetas):
+        buckets = self.definiciones[nombre][2]
+        with self._lock:
+            serie = self._serie(nombre, etiquetas)
+            serie[bisect_left(buckets, valor)] += 1
+            serie[-1] += valor
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        with self._lock:
+            self._serie(nombre, etiquetas)[-1] += valor
+
+    def volcar(self, folder=None):
+        """
+        Escribe las series si cambiaron desde el último volcado. El archivo lleva un sufijo
+        aleatorio por proceso: un pid reutilizado no pisa (ni hace bajar) los contadores del
+        proceso que terminó.
+        """
+        with self._volcado_lock:
+            with self._lock:
+                if self._pid != os.getpid() or self._version == self._volcada:
+                    return
+                if self._archivo is None:
+                    self._archivo = f"metricas_{self._pid}_{secrets.token_hex(4)}.json"
+                version = self._version
+                data = [[nombre, dict(etiquetas), list(serie)] for (nombre, etiquetas), serie in self._series.items()]
+            _escribir_json(os.path.join(folder or METRICAS_FOLDER, self._archivo), data)
+            self._volcada = version
+
+METRICAS = Metricas(METRICAS_DEF)
+
+class VolcadoMetricas(threading.Thread):
+    """Hilo por proceso que vuelca METRICAS cada 'intervalo_s' (solo si hubo observaciones nuevas)."""
+    def __init__(self, metricas, intervalo_s):
+        super().__init__(name="volcado-metricas", daemon=True)
+        self.metricas = metricas
+        self.intervalo_s = intervalo_s
+        self._alto = threading.Event()
+
+    def run(self):
+        while not self._alto.wait(self.intervalo_s):
+            self.volcar()
+
+    def volcar(self):
+        try:
+            self.metricas.volcar()
+        except OSError as e:
+            app.logger.warning(f"No fue posible volcar métricas: {e}")
+
+    def detener(self):
+        self._alto.set()
+        self.volcar()
+
+_volcado = None
+_volcado_lock = threading.Lock()
+
+def get_volcado_metricas():
+    """Hilo de volcado del proceso actual (se recrea tras un fork: los hilos no sobreviven)."""
+    global _volcado
+    with _volcado_lock:
+        if _volcado is None or _volcado.pid != os.getpid():
+            _volcado = VolcadoMetricas(METRICAS, app.config["METRICAS_VOLCADO_S"])
+            _volcado.pid = os.getpid()
+            _volcado.start()
+            atexit.register(_volcado.detener)
+        return _volcado
+
+@contextmanager
+def _cronometro(metrica, etiqueta, clave, nombre, medicion):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - t0
+        if medicion is None:
+            METRICAS.observar(metrica, segundos, **{etiqueta: nombre})
+        else:
+            medicion.setdefault(clave, {})[nombre] = round(segundos, 6)
+
+def medir(etapa, medicion=None):
+    """
+    Cronometra un bloque. Sin 'medicion' observa validador_etapa_segundos de inmediato;
+    con 'medicion' (dict) solo guarda medicion["etapas"][etapa] y la observación la hace
+    registrar_validacion, ya en el proceso web (ejecutar_validacion puede correr en un hijo).
+    """
+    return _cronometro("validador_etapa_segundos", "etapa", "etapas", etapa, medicion)
+
+def medir_regla(regla_id, medicion=None):
+    """Como medir, por regla de nombres: validador_regla_segundos / medicion["reglas"]."""
+    return _cronometro("validador_regla_segundos", "regla", "reglas", regla_id, medicion)
+
+def _etiquetas_prometheus(etiquetas, **extra) -> str:
+    pares = list(etiquetas) + list(extra.items())
+    if not pares:
+        return ""
+    escapar = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in pares) + "}"
+
+METRICAS_HISTORICO = "metricas_historico.json"
+_RE_VOLCADO = re.compile(r"^metricas_(\d+)(_[0-9a-f]+)?\.json$")
+
+def _leer_json_metricas(path, vacio):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return vacio
+
+def _sumar_series(total, series):
+    for nombre, etiquetas, serie in series:
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        acumulada = total.get(clave)
+        if acumulada is None:
+            total[clave] = list(serie)
+        elif len(acumulada) == len(serie):  # otro largo: buckets de una versión anterior
+            total[clave] = [a + b for a, b in zip(acumulada, serie)]
+    return total
+
+def _proceso_vivo(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+@contextmanager
+def _candado_metricas(folder, exclusivo=False):
+    """flock sobre METRICAS_FOLDER: consolidar_metricas (exclusivo) no cambia archivos a media lectura."""
+    with open(os.path.join(folder, ".metricas.lock"), "a") as candado:
+        if fcntl is not None:
+            fcntl.flock(candado.fileno(), fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)  # se libera al cerrar
+        yield
+
+def consolidar_metricas(folder=None):
+    """
+    Suma a METRICAS_HISTORICO los volcados de procesos que ya terminaron y los borra: los
+    archivos no crecen con cada reinicio de worker y los contadores no bajan. El histórico
+    anota qué archivos ya sumó ("sumados") para no contarlos dos veces si el borrado falla.
+    """
+    folder = folder or METRICAS_FOLDER
+    ruta = os.path.join(folder, METRICAS_HISTORICO)
+    with _candado_metricas(folder, exclusivo=True):
+        historico = _leer_json_metricas(ruta, {"series": [], "sumados": []})
+        sumados = set(historico["sumados"])
+        terminados = []
+        for nombre_archivo in os.listdir(folder):
+            m = _RE_VOLCADO.match(nombre_archivo)
+            if m and nombre_archivo not in sumados and not _proceso_vivo(int(m.group(1))):
+                terminados.append(nombre_archivo)
+        if not terminados and not sumados:
+            return
+        total = _sumar_series({}, historico["series"])
+        for nombre_archivo in terminados:
+            _sumar_series(total, _leer_json_metricas(os.path.join(folder, nombre_archivo), []))
+        sumados.update(terminados)
+        series = [[nombre, dict(etiquetas), serie] for (nombre, etiquetas), serie in total.items()]
+        _escribir_json(ruta, {"series": series, "sumados": sorted(sumados)})
+        pendientes = []
+        for nombre_archivo in sorted(sumados):
+            try:
+                os.remove(os.path.join(folder, nombre_archivo))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                pendientes.append(nombre_archivo)
+        _escribir_json(ruta, {"series": series, "sumados": pendientes})
+
+def exponer_metricas(folder=None) -> str:
+    """Suma los volcados de todos los procesos y los escribe en formato de texto de Prometheus."""
+    folder = folder or METRICAS_FOLDER
+    with _candado_metricas(folder):
+        historico = _leer_json_metricas(os.path.join(folder, METRICAS_HISTORICO), {"series": [], "sumados": []})
+        total = _sumar_series({}, historico["series"])
+        for nombre_archivo in os.listdir(folder):
+            if _RE_VOLCADO.match(nombre_archivo) and nombre_archivo not in historico["sumados"]:
+                _sumar_series(total, _leer_json_metricas(os.path.join(folder, nombre_archivo), []))
+
+    lineas = []
+    for nombre, (tipo, ayuda, buckets) in METRICAS_DEF.items():
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+        for (n, etiquetas), serie in sorted(total.items()):
+            if n != nombre:
+                continue
+            if buckets is None:
+                lineas.append(f"{nombre}{_etiquetas_prometheus(etiquetas)} {serie[-1]:g}")
+                continue
+            if len(serie) != len(buckets) + 2:
+                continue
+            acumulado = 0
+            for limite, conteo in zip([f"{b:g}" for b in buckets] + ["+Inf"], serie[:-1]):
+                acumulado += conteo
+                lineas.append(f"{nombre}_bucket{_etiquetas_prometheus(etiquetas, le=limite)} {acumulado}")
+            lineas.append(f"{nombre}_sum{_etiquetas_prometheus(etiquetas)} {serie[-1]:.6f}")
+            lineas.append(f"{nombre}_count{_etiquetas_prometheus(etiquetas)} {acumulado}")
+    return "\n".join(lineas) + "\n"
 
 # ---------------- UTILIDAD SEND_FILE (compat Flask 1/2/3) ----------------
-_sf_params = signature(send_file).parameters
-_HAS_DOWNLOAD_NAME = "download_name" in _sf_params
+@lru_cache(maxsize=None)
+def _has_download_name() -> bool:
+    """Se consulta en la primera descarga, no al importar (inspect es costoso en frío)."""
+    from inspect import signature
+    return "download_name" in signature(send_file).parameters
 
 def send_file_compat(fileobj_or_path, filename, **kwargs):
     """
@@ -46,52 +365,158 @@ def send_file_compat(fileobj_or_path, filename, **kwargs):
     args = dict(kwargs)
     args["as_attachment"] = True
     args["mimetype"] = args.get("mimetype", "application/pdf")
-    if _HAS_DOWNLOAD_NAME:
+    if _has_download_name():
         args["download_name"] = filename
     else:
         args["attachment_filename"] = filename  # Compat Flask 1.x
     return send_file(fileobj_or_path, **args)
 
 # ---------------- MANEJO DE LOGS Y REPORTES ----------------
-def get_current_log_file():
-    """Archivo de log mensual actual"""
-    current_date = datetime.now()
+def get_current_log_file(fecha=None):
+    """Archivo de log mensual actual (o el del mes de 'fecha')"""
+    current_date = fecha or datetime.now()
     log_filename = f"validaciones_{current_date.year}_{current_date.month:02d}.log"
     return os.path.join(LOGS_FOLDER, log_filename)
 
-def get_current_report_file():
-    """Archivo de reporte semanal actual"""
-    current_date = datetime.now()
-    week_number = current_date.isocalendar()[1]
-    report_filename = f"reporte_{current_date.year}_{week_number:02d}.csv"
+def get_current_report_file(fecha=None):
+    """Archivo de reporte semanal actual (o el de la semana ISO de 'fecha')"""
+    current_date = fecha or datetime.now()
+    iso_year, week_number, _ = current_date.isocalendar()
+    report_filename = f"reporte_{iso_year}_{week_number:02d}.csv"
     return os.path.join(REPORTS_FOLDER, report_filename)
 
-def write_to_log(ip_address, filename, file_size_kb, processing_time, status):
-    log_file = get_current_log_file()
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+REPORT_HEADER = [
+    "Fecha", "Hora", "IP", "Archivo", "Peso_KB",
+    "Tiempo_Procesamiento_s", "Estado", "Cantidad_Observaciones", "Cache",
+    "Filas", "Columnas", "Bytes_por_s", "T_Carga_s", "T_Archivo_s", "T_Columnas_s", "T_Datos_s", "T_JSON_s"
+]
+
+def _linea_csv(campos) -> str:
+    buf = io.StringIO()
+    csv.writer(buf).writerow(campos)
+    return buf.getvalue()
+
+def _escribir_lineas(path, lineas, encabezado=None, fsync=False):
+    """
+    Agrega las líneas bajo un flock exclusivo, así no se mezclan con las de otros workers.
+    Con 'encabezado' (CSV): lo escribe si el archivo está vacío o lo actualiza si cambió.
+    """
+    with open(path, "a+", newline="", encoding="utf-8") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            if encabezado is not None:
+                f.seek(0)
+                primera = f.readline()
+                if not primera:
+                    f.write(encabezado)
+                elif primera != encabezado:
+                    # Reporte creado con columnas anteriores: se reescribe solo el encabezado
+                    resto = f.read()
+                    f.seek(0)
+                    f.truncate()
+                    f.write(encabezado + resto)
+            f.write("".join(lineas))
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class EscritorAuditoria(threading.Thread):
+    """
+    Hilo por proceso que escribe log y reporte fuera de la petición: junta las entradas
+    de la cola y las agrega por archivo en un solo write bajo flock. El archivo se decide
+    al encolar (fecha de la entrada), así la rotación mensual/semanal es exacta aunque el
+    lote se escriba después del cambio de mes o semana.
+    """
+    def __init__(self, max_lote=1000, espera_s=0.2, fsync=False):
+        super().__init__(name="escritor-auditoria", daemon=True)
+        self.max_lote = max_lote
+        self.espera_s = espera_s
+        self.fsync = fsync
+        self._cola = queue.Queue()
+        self._cerrado = threading.Event()
+
+    def registrar(self, path, linea, encabezado=None):
+        self._cola.put((path, linea, encabezado))
+
+    def run(self):
+        while not (self._cerrado.is_set() and self._cola.empty()):
+            try:
+                lote = [self._cola.get(timeout=self.espera_s)]
+            except queue.Empty:
+                continue
+            while len(lote) < self.max_lote:
+                try:
+                    lote.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            self._escribir_lote(lote)
+            for _ in lote:
+                self._cola.task_done()
+
+    def _escribir_lote(self, lote):
+        por_archivo = {}
+        for path, linea, encabezado in lote:
+            por_archivo.setdefault((path, encabezado), []).append(linea)
+        for (path, encabezado), lineas in por_archivo.items():
+            try:
+                _escribir_lineas(path, lineas, encabezado, self.fsync)
+            except Exception as e:
+                app.logger.warning(f"Error al escribir auditoría en {path}: {e}")
+
+    def flush(self):
+        """Bloquea hasta que todo lo encolado esté escrito."""
+        self._cola.join()
+
+    def cerrar(self):
+        self._cerrado.set()
+        self.join(timeout=10)
+
+_escritor = None
+_escritor_lock = threading.Lock()
+
+def get_escritor():
+    """Escritor del proceso actual (se recrea tras un fork: los hilos no sobreviven)."""
+    global _escritor
+    with _escritor_lock:
+        if _escritor is None or _escritor.pid != os.getpid():
+            _escritor = EscritorAuditoria(fsync=app.config["AUDITORIA_FSYNC"])
+            _escritor.pid = os.getpid()
+            _escritor.start()
+            atexit.register(_escritor.cerrar)
+        return _escritor
+
+def _auditar(path, linea, encabezado=None):
+    if app.config["AUDITORIA_ASINCRONA"]:
+        get_escritor().registrar(path, linea, encabezado)
+    else:
+        _escribir_lineas(path, [linea], encabezado, app.config["AUDITORIA_FSYNC"])
+
+def write_to_log(ip_address, filename, file_size_kb, processing_time, status, cache="-"):
+    now = datetime.now()
+    timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
     log_entry = (
         f"{timestamp} | IP={ip_address} | Archivo={filename} | "
-        f"Peso={file_size_kb} KB | Tiempo de Procesamiento={processing_time}s | Estado={status}\n"
+        f"Peso={file_size_kb} KB | Tiempo de Procesamiento={processing_time}s | Estado={status} | "
+        f"Cache={cache}\n"
     )
-    with open(log_file, "a", encoding="utf-8") as f:
-        f.write(log_entry)
-
-def update_weekly_report(ip_address, filename, file_size_kb, processing_time, status, observations_count):
-    report_file = get_current_report_file()
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    file_exists = os.path.isfile(report_file)
-    with open(report_file, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow([
-                "Fecha", "Hora", "IP", "Archivo", "Peso_KB",
-                "Tiempo_Procesamiento_s", "Estado", "Cantidad_Observaciones"
-            ])
-        date_part, time_part = timestamp.split(" ")
-        writer.writerow([
-            date_part, time_part, ip_address, filename, file_size_kb,
-            processing_time, status, observations_count
-        ])
+    _auditar(get_current_log_file(now), log_entry)
+
+def update_weekly_report(ip_address, filename, file_size_kb, processing_time, status, observations_count,
+                         cache="-", medicion=None):
+    now = datetime.now()
+    date_part, time_part = now.strftime("%Y-%m-%d %H:%M:%S").split(" ")
+    medicion = medicion or {}
+    etapas = medicion.get("etapas", {})
+    _auditar(get_current_report_file(now), _linea_csv([
+        date_part, time_part, ip_address, filename, file_size_kb,
+        processing_time, status, observations_count, cache,
+        medicion.get("filas", ""), medicion.get("columnas", ""), medicion.get("bytes_por_s", ""),
+        *(etapas.get(e, "") for e in ("carga", "archivo", "columnas", "datos", "json")),
+    ]), encabezado=_linea_csv(REPORT_HEADER))
 
 def count_total_observations(final_dict):
     total = 0
@@ -101,13 +526,12 @@ def count_total_observations(final_dict):
     return total
 
 def cleanup_temp_files(token):
-    """Elimina JSON/PDF temporales tras la descarga"""
+    """Elimina el resultado, el estado del trabajo y el PDF temporal tras la descarga"""
     try:
-        json_file = os.path.join(RESULTS_FOLDER, f"final_{token}.json")
-        pdf_file  = os.path.join(RESULTS_FOLDER, f"informe_{token}.pdf")
-        for p in (json_file, pdf_file):
-            if os.path.exists(p):
-                os.remove(p)
+        get_resultados().eliminar(token)
+        pdf_file = ruta_informe(token)
+        if os.path.exists(pdf_file):
+            os.remove(pdf_file)
         current_app.logger.info(f"Archivos temporales eliminados para token: {token}")
     except Exception as e:
         current_app.logger.warning(f"Error al eliminar temporales [{token}]: {e}")
@@ -116,50 +540,396 @@ def cleanup_temp_files(token):
 def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def is_utf8(file_bytes: bytes) -> bool:
+# Bytes 0x80-0x9F: controles C1 en Latin-1, comillas/guiones/€ en CP1252 (salvo estos cinco)
+_SIN_C1 = bytes(b for b in range(256) if not 0x80 <= b < 0xA0)
+_C1_NO_CP1252 = frozenset((0x81, 0x8D, 0x8F, 0x90, 0x9D))
+
+def inspeccionar_codificacion(origen, chunk_size=CHUNK_SIZE) -> dict:
+    """
+    Valida UTF-8 sobre un memoryview del upload (mmap si 'origen' es una ruta): cada bloque
+    se decodifica en C y se descarta, nunca existe el texto completo.
+    Regresa {"utf8", "offset", "linea", "encoding"}: offset y línea (desde 1) del primer
+    byte inválido; encoding "utf-8", "cp1252", "latin-1" o None cuando el archivo mezcla
+    UTF-8 válido con bytes inválidos (no hay una codificación única que lo lea bien).
+    """
+    if isinstance(origen, str):
+        with open(origen, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return {"utf8": True, "offset": None, "linea": None, "encoding": "utf-8"}
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return _inspeccionar_buffer(mm, chunk_size)
+    return _inspeccionar_buffer(origen, chunk_size)
+
+def _inspeccionar_buffer(buf, chunk_size):
+    chunk_size = max(chunk_size, 4)  # un bloque siempre contiene una secuencia completa
+    with memoryview(buf) as mv:
+        n, offset, invalido, multibyte = mv.nbytes, 0, None, False
+        while offset < n:
+            with mv[offset:offset + chunk_size] as bloque:
+                try:
+                    # final=False: una secuencia cortada al final del bloque se retoma en el siguiente
+                    texto, consumidos = codecs.utf_8_decode(bloque, "strict", offset + chunk_size >= n)
+                except UnicodeDecodeError as e:
+                    invalido = offset + e.start
+                    multibyte = multibyte or not bloque[:e.start].tobytes().isascii()
+                    break
+            multibyte = multibyte or not texto.isascii()
+            offset += consumidos
+        if invalido is None:
+            return {"utf8": True, "offset": None, "linea": None, "encoding": "utf-8"}
+
+        linea = 1
+        for a in range(0, invalido, chunk_size):
+            linea += mv[a:min(a + chunk_size, invalido)].tobytes().count(b"\n")
+        encoding = None
+        if not multibyte:
+            c1 = set()
+            for a in range(invalido, n, chunk_size):
+                c1.update(mv[a:a + chunk_size].tobytes().translate(None, _SIN_C1))
+            encoding = "cp1252" if c1 and not (c1 & _C1_NO_CP1252) else "latin-1"
+    return {"utf8": False, "offset": invalido, "linea": linea, "encoding": encoding}
+
+def mensaje_codificacion(codificacion: dict) -> str:
+    msg = (f"La codificación no es la correcta, debe ser 'UTF-8'. Primer byte no válido en la línea "
+           f"{codificacion['linea']} (byte {codificacion['offset'] + 1} del archivo)")
+    if codificacion["encoding"]:
+        msg += f"; la codificación detectada es {codificacion['encoding'].upper()}"
+    return msg + "."
+
+def ruta_utf8(path: str) -> str:
+    """Copia en UTF-8 de un upload con otra codificación (la borra ejecutar_validacion)."""
+    return f"{path}.utf8"
+
+def transcodificar_a_utf8(path: str, encoding: str, chunk_size: int = CHUNK_SIZE) -> str:
+    """Por bloques: Latin-1/CP1252 son de un byte, ningún carácter queda partido entre bloques."""
+    destino = ruta_utf8(path)
+    with open(path, "rb") as src, open(destino, "wb") as dst:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+            dst.write(chunk.decode(encoding).encode("utf-8"))
+    return destino
+
+def guardar_upload(file_storage) -> tuple:
+    """
+    Copia el upload por bloques a un temporal en UPLOAD_FOLDER.
+    Regresa (ruta, bytes, sha256 hex); el hash se calcula en la misma pasada.
+    """
+    stream = getattr(file_storage, "stream", file_storage)
+    fd, path = tempfile.mkstemp(prefix="upload_", dir=UPLOAD_FOLDER)
+    size, digest = 0, hashlib.sha256()
     try:
-        file_bytes.decode("utf-8")
-        return True
-    except UnicodeDecodeError:
-        return False
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, size, digest.hexdigest()
+
+# DataFrame (carga completa) o LazyFrame (modo streaming): los validadores aceptan ambos
+def _columnas(df) -> list:
+    return df.collect_schema().names() if isinstance(df, pl.LazyFrame) else df.columns
+
+def _sin_filas(df) -> bool:
+    if isinstance(df, pl.LazyFrame):
+        return df.head(1).collect().is_empty()
+    return df.is_empty()
+
+def _alguno(df, exprs) -> tuple:
+    """any() de cada expresión booleana. En LazyFrame el max() va después del select para
+    que el motor de streaming solo acumule máscaras booleanas y no las columnas de texto."""
+    if isinstance(df, pl.LazyFrame):
+        return df.select(exprs).max().collect(streaming=True).row(0)
+    return df.select([e.any() for e in exprs]).row(0)
+
+def _alguno_y_filas(df, exprs) -> tuple:
+    """Como _alguno pero regresa también el número de filas evaluadas: (fila_any, filas)."""
+    if isinstance(df, pl.LazyFrame):
+        fila = df.select(exprs + [pl.lit(1, dtype=pl.UInt32).alias("__filas")]).sum().collect(streaming=True).row(0)
+        return tuple(bool(v) for v in fila[:-1]), fila[-1] or 0
+    return df.select([e.any() for e in exprs]).row(0), df.height
+
+# ---------------- LECTORES DE EXCEL ----------------
+# Cada lector recibe ruta o file-like y regresa un DataFrame de columnas Utf8 con la
+# primera hoja (None -> "", fechas como '%Y-%m-%d %H:%M:%S'), o None si está vacía.
+EXCEL_LECTORES = {}
+EXCEL_LOTE_FILAS = 10_000
+_NONE = type(None)
+
+def registrar_lector_excel(nombre):
+    def decorador(fn):
+        EXCEL_LECTORES[nombre] = fn
+        return fn
+    return decorador
+
+def _celdas_a_texto(valores: tuple) -> pl.Series:
+    """Convierte una columna de celdas a Utf8; los tipos homogéneos van por Polars."""
+    tipos = set(map(type, valores))
+    if tipos <= {str}:
+        return pl.Series(valores, dtype=pl.Utf8)
+    if tipos <= {str, _NONE}:
+        return pl.Series(valores, dtype=pl.Utf8).fill_null("")
+    if tipos <= {datetime, _NONE}:
+        return pl.Series(valores, dtype=pl.Datetime).dt.strftime('%Y-%m-%d %H:%M:%S').fill_null("")
+    if tipos <= {int, _NONE}:
+        try:
+            return pl.Series(valores, dtype=pl.Int64).cast(pl.Utf8).fill_null("")
+        except (OverflowError, TypeError):
+            pass
+    return pl.Series([
+        "" if v is None else v.strftime('%Y-%m-%d %H:%M:%S') if isinstance(v, datetime) else str(v)
+        for v in valores
+    ], dtype=pl.Utf8)
+
+def _lote_a_df(headers: list, lote: list) -> pl.DataFrame:
+    n = len(headers)
+    if any(len(fila) != n for fila in lote):
+        # Hojas sin <dimension> (p.ej. escritas en modo write_only) omiten las celdas vacías
+        # al final de la fila: se completan con None; filas más largas que el encabezado no
+        if any(len(fila) > n for fila in lote):
+            raise ValueError("data does not match the number of columns")
+        lote = [fila + (None,) * (n - len(fila)) for fila in lote]
+    columnas = zip(*lote) if lote else [()] * n
+    # Lista de Series (no dict): Polars renombra los encabezados vacíos a column_N como antes
+    return pl.DataFrame([pl.Series(h, _celdas_a_texto(col)) for h, col in zip(headers, columnas)])
+
+@registrar_lector_excel("openpyxl")
+def leer_excel_openpyxl(origen):
+    """Primera hoja en modo read-only, por lotes de EXCEL_LOTE_FILAS filas."""
+    import openpyxl
+    # Con una ruta openpyxl exige extensión .xlsx y el temporal del upload no la lleva
+    fuente = open(origen, "rb") if isinstance(origen, str) else origen
+    wb = openpyxl.load_workbook(fuente, read_only=True, data_only=True)
+    try:
+        filas = wb[wb.sheetnames[0]].iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return None
+        headers = [str(h) if h is not None else "" for h in encabezado]
+        if not headers:
+            return pl.DataFrame()
+        lotes = []
+        while True:
+            lote = list(islice(filas, EXCEL_LOTE_FILAS))
+            if not lote:
+                break
+            lotes.append(_lote_a_df(headers, lote))
+        return pl.concat(lotes, rechunk=True) if lotes else _lote_a_df(headers, [])
+    finally:
+        wb.close()
+        if fuente is not origen:
+            fuente.close()
+
+def _flotantes_a_texto(serie: pl.Series) -> pl.Series:
+    """Como str() de openpyxl: enteros sin ".0" (ahí llegan como int) y notación científica de Python."""
+    entero = (serie == serie.round(0)) & (serie.abs() < 1e16)
+    texto = pl.select(
+        pl.when(entero).then(serie.cast(pl.Int64, strict=False).cast(pl.Utf8)).otherwise(serie.cast(pl.Utf8))
+    ).to_series()
+    # Fuera de [1e-4, 1e16) Python escribe 1e-05 / 1e+16 y Polars 0.00001 / 1e16: pocos valores, con str()
+    cientifica = ~entero & (serie != 0) & ((serie.abs() < 1e-4) | (serie.abs() >= 1e16))
+    if cientifica.any():
+        texto = texto.scatter(cientifica.arg_true(), [str(v) for v in serie.filter(cientifica)])
+    return texto.fill_null("")
+
+def _columna_a_texto(serie: pl.Series) -> pl.Series:
+    """Columna tipada de fastexcel -> el mismo texto que _celdas_a_texto con las celdas de openpyxl."""
+    dtype = serie.dtype
+    if dtype == pl.Utf8:
+        return serie.fill_null("")
+    if dtype == pl.Boolean:
+        return pl.select(pl.when(serie).then(pl.lit("True")).when(~serie).then(pl.lit("False"))).to_series().fill_null("")
+    if dtype.is_float():
+        return _flotantes_a_texto(serie)
+    if dtype in (pl.Datetime, pl.Date):
+        serie = serie.cast(pl.Datetime)
+        # Celdas solo con hora: openpyxl entrega datetime.time (calamine, el 31/12/1899)
+        hora = serie.dt.date() == date(1899, 12, 31)
+        return pl.select(
+            pl.when(hora).then(serie.dt.strftime('%H:%M:%S')).otherwise(serie.dt.strftime('%Y-%m-%d %H:%M:%S'))
+        ).to_series().fill_null("")
+    return pl.Series(["" if v is None else str(v) for v in serie.to_list()], dtype=pl.Utf8)
+
+def _encabezados_renombrados(columnas) -> bool:
+    """fastexcel renombra vacíos (__UNNAMED__N) y repetidos (a, a_1): hay que leer los originales."""
+    vistos = set()
+    for c in columnas:
+        base = re.fullmatch(r"(.*)_\d+", c.name)
+        if c.column_name_from != "looked_up" or c.name == "" or (base and base.group(1) in vistos):
+            return True
+        vistos.add(c.name)
+    return False
 
-def split_words_underscore(name: str) -> int:
-    return len([p for p in name.split("_") if p])
+@registrar_lector_excel("calamine")
+def leer_excel_calamine(origen):
+    """
+    Primera hoja con fastexcel (calamine, en Rust): tipos inferidos con todas las filas y
+    conversión a Utf8 por columna en Polars, con el texto de leer_excel_openpyxl. En columnas
+    mixtas fastexcel ya entrega texto: los booleanos salen true/false y los flotantes fuera de
+    [1e-4, 1e16) sin notación científica (no cambia ninguna observación). También lee .xls.
+    """
+    import fastexcel
+    fuente = origen if isinstance(origen, str) else origen.read()
+    hoja = fastexcel.read_excel(fuente).load_sheet(0, schema_sample_rows=None)
+    columnas = hoja.available_columns()
+    if not columnas:
+        return None
+    headers = [c.name for c in columnas]
+    if _encabezados_renombrados(columnas):
+        fila = fastexcel.read_excel(fuente).load_sheet(0, header_row=None, n_rows=1).to_polars()
+        headers = [_columna_a_texto(serie)[0] for serie in fila.get_columns()]
+    df = hoja.to_polars()
+    # Lista de Series como en _lote_a_df: vacíos -> column_N y repetidos fallan igual que con openpyxl
+    return pl.DataFrame([pl.Series(h, _columna_a_texto(serie)) for h, serie in zip(headers, df.get_columns())])
+
+# ---------------- REGLAS DE NOMBRES ----------------
+# validar_nombre_archivo y validar_nombres_columnas aplican las reglas declaradas en
+# REGLAS_ARCHIVO (JSON), compiladas una vez por proceso. Cada tipo de regla compila su
+# configuración a (función sobre el nombre del archivo, función sobre pl.Series de nombres
+# de columna). En los mensajes de columnas, {columnas} se sustituye por los nombres que no
+# cumplen separados por " | ". Cambiar el JSON requiere reiniciar el servicio.
+TIPOS_REGLA = {}
+
+def registrar_tipo_regla(nombre):
+    def decorador(fn):
+        TIPOS_REGLA[nombre] = fn
+        return fn
+    return decorador
+
+def _sintaxis_sin_rust(patron):
+    """
+    Construcción que re acepta y el regex de Rust (Polars) rechaza, o None. Se revisa sin
+    Polars para no ejecutar consultas antes del fork (ver precargar); ReglasNombres.probar_en_polars
+    confirma cada patrón en el primer uso de cada proceso.
+    """
+    i, n = 0, len(patron)
+    while i < n:
+        c = patron[i]
+        if c == "\\":
+            sig = patron[i + 1:i + 2]
+            if sig.isdigit():
+                return f"referencias a grupos u octales (\\{sig})"
+            if sig == "Z":
+                return "\\Z (use \\z)"
+            i += 2
+        elif c == "[":
+            # Dentro de una clase "(?=" es literal: se salta hasta el "]" que la cierra
+            i += 2 if patron.startswith(("[]", "[^"), i) else 1
+            i += 1 if patron.startswith("]", i) and patron[i - 1] == "^" else 0
+            while i < n and patron[i] != "]":
+                i += 2 if patron[i] == "\\" else 1
+            i += 1
+        else:
+            for prefijo, nombre in (("(?=", "lookahead"), ("(?!", "lookahead"), ("(?<=", "lookbehind"),
+                                    ("(?<!", "lookbehind"), ("(?P=", "referencias a grupos"),
+                                    ("(?>", "grupos atómicos"), ("(?(", "condicionales")):
+                if patron.startswith(prefijo, i):
+                    return nombre
+            i += 1
+    return None
+
+@registrar_tipo_regla("regex")
+def _regla_regex(cfg):
+    patron = re.compile(cfg["patron"])
+    no_soportado = _sintaxis_sin_rust(cfg["patron"])
+    if no_soportado:
+        raise ValueError(f"regex: Polars no admite {no_soportado} en '{cfg['patron']}'.")
+    return (lambda texto: patron.search(texto) is not None,
+            lambda serie: serie.str.contains(cfg["patron"]))
+
+@registrar_tipo_regla("contiene")
+def _regla_contiene(cfg):
+    buscado = cfg["texto"]
+    return (lambda texto: buscado in texto,
+            lambda serie: serie.str.contains(buscado, literal=True))
+
+@registrar_tipo_regla("max_palabras")
+def _regla_max_palabras(cfg):
+    """Más de 'maximo' partes no vacías al separar por 'separador' (un carácter)."""
+    separador, maximo = cfg["separador"], int(cfg["maximo"])
+    if len(separador) != 1:
+        raise ValueError("max_palabras: 'separador' debe ser un solo carácter.")
+    palabra = f"[^{re.escape(separador)}]+"
+    return (lambda texto: len([p for p in texto.split(separador) if p]) > maximo,
+            lambda serie: serie.str.count_matches(palabra) > maximo)
+
+class Regla:
+    def __init__(self, cfg):
+        tipo = cfg.get("tipo")
+        if tipo not in TIPOS_REGLA:
+            raise ValueError(f"Regla '{cfg.get('id')}': tipo desconocido '{tipo}'.")
+        self.id = cfg["id"]
+        self.mensaje = cfg["mensaje"]
+        try:
+            self.evaluar_texto, self.evaluar_serie = TIPOS_REGLA[tipo](cfg)
+        except (re.error, ValueError) as e:
+            raise ValueError(f"Regla '{self.id}': {e}") from e
+
+class ReglasNombres:
+    """reglas.json compilado; 'huella' (hash del archivo) forma parte de la clave de caché."""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            contenido = f.read()
+        cfg = json.loads(contenido)
+        self.huella = hashlib.sha256(contenido).hexdigest()[:16]
+        self.archivo = [Regla(r) for r in cfg["archivo"]["reglas"]]
+        self.archivo_sin_observaciones = cfg["archivo"]["sin_observaciones"]
+        self.columnas = [Regla(r) for r in cfg["columnas"]["reglas"]]
+        self.columnas_sin_observaciones = cfg["columnas"]["sin_observaciones"]
+        self.probadas_pid = None
+
+    def probar_en_polars(self):
+        """Evalúa cada regla de columnas sobre una Series en Polars; ValueError con la que falle."""
+        for regla in self.columnas:
+            try:
+                regla.evaluar_serie(pl.Series([""], dtype=pl.Utf8))
+            except Exception as e:
+                raise ValueError(f"Regla '{regla.id}': no se puede evaluar en Polars: {e}") from e
+        self.probadas_pid = os.getpid()
+
+@lru_cache(maxsize=None)
+def _compilar_reglas(path) -> ReglasNombres:
+    return ReglasNombres(path)
+
+def get_reglas() -> ReglasNombres:
+    """Reglas compiladas; la primera llamada de cada proceso (ya después del fork) las prueba en Polars."""
+    reglas = _compilar_reglas(app.config["REGLAS_ARCHIVO"])
+    if reglas.probadas_pid != os.getpid():
+        reglas.probar_en_polars()
+    return reglas
+
+# Un error en reglas.json detiene el arranque, no la primera validación. Solo con re: una
+# consulta de Polars aquí arrancaría su pool de hilos antes del fork de gunicorn --preload
+_compilar_reglas(app.config["REGLAS_ARCHIVO"])
 
 # ---------------- VALIDADORES ----------------
-def validar_formato_y_carga(file_storage, filename, ext):
+def validar_formato_y_carga(file_storage, filename, ext, streaming=False, codificacion=None):
+    """
+    file_storage puede ser un file-like o la ruta del upload ya guardado en disco.
+    Con streaming=True y una ruta CSV regresa un pl.LazyFrame (pl.scan_csv) en lugar
+    de cargar el archivo completo. codificacion: resultado de inspeccionar_codificacion
+    ya calculado (cargas por partes); si es None se inspecciona aquí.
+    """
     obs = []
+    es_ruta = isinstance(file_storage, str)
     if ext in ("xls", "xlsx"):
         try:
-            import openpyxl
-            if hasattr(file_storage, "seek"):
+            if not es_ruta and hasattr(file_storage, "seek"):
                 file_storage.seek(0)
-            wb = openpyxl.load_workbook(file_storage, read_only=True, data_only=True)
-            ws = wb[wb.sheetnames[0]]
-            rows = list(ws.values)
+            lector = EXCEL_LECTORES[app.config.get("EXCEL_BACKEND", "openpyxl")]
+            df = lector(file_storage)
 
-            if not rows:
+            if df is None:
                 obs.append("El archivo Excel está vacío.")
                 return obs, pl.DataFrame()
 
-            headers = [str(h) if h is not None else "" for h in rows[0]]
-            data = rows[1:] if len(rows) > 1 else []
-
-            # Conversión segura a cadena (y fechas)
-            safe_data = []
-            for row in data:
-                safe_row = []
-                for cell in row:
-                    if cell is None:
-                        safe_row.append("")
-                    elif isinstance(cell, datetime):
-                        safe_row.append(cell.strftime('%Y-%m-%d %H:%M:%S'))
-                    else:
-                        safe_row.append(str(cell))
-                safe_data.append(safe_row)
-
-            df = pl.DataFrame(safe_data, schema=headers, orient="row") if headers else pl.DataFrame()
-
             empty_headers = [h for h in df.columns if (h is None or str(h).strip() in ("", " "))]
             if empty_headers:
                 obs.append(f"Se encuentran {len(empty_headers)} variables sin nombre. Revisar el contenido de estas variables.")
@@ -170,67 +940,484 @@ def validar_formato_y_carga(file_storage, filename, ext):
             return obs, pl.DataFrame()
 
     # CSV
-    if hasattr(file_storage, "seek"):
-        file_storage.seek(0)
-    file_bytes = file_storage.read()
-    if not is_utf8(file_bytes):
-        obs.append("La codificación no es la correcta, debe ser 'UTF-8'.")
-    stream = io.BytesIO(file_bytes)
-    try:
-        df = pl.read_csv(stream, infer_schema_length=10000, ignore_errors=True)
+    if es_ruta:
+        source = file_storage
+    else:
+        if hasattr(file_storage, "seek"):
+            file_storage.seek(0)
+        source = file_storage.read()
+    # Con la codificación detectada el CSV se lee completo y con sus valores reales; antes las
+    # filas con bytes inválidos quedaban en null y no se revisaban
+    encoding = "utf8"
+    codificacion = codificacion or inspeccionar_codificacion(source)
+    if not codificacion["utf8"]:
+        obs.append(mensaje_codificacion(codificacion))
+        if codificacion["encoding"] is None:
+            encoding = "utf8-lossy"
+        elif es_ruta:
+            source = transcodificar_a_utf8(source, codificacion["encoding"])
+        else:
+            source = source.decode(codificacion["encoding"]).encode("utf-8")
+    if not es_ruta:
+        source = io.BytesIO(source)
+    try:
+        if streaming and es_ruta:
+            df = pl.scan_csv(source, infer_schema_length=FILAS_INFERENCIA, ignore_errors=True, encoding=encoding)
+            df.collect_schema()  # lee encabezados e inferencia; errores de formato salen aquí
+        else:
+            df = pl.read_csv(source, infer_schema_length=FILAS_INFERENCIA, ignore_errors=True, encoding=encoding)
     except Exception as e:
         obs.append(f"No fue posible leer el CSV: {e}")
         df = pl.DataFrame()
 
-    empty_headers = [h for h in df.columns if (h is None or str(h).strip() in ("", " "))]
+    empty_headers = [h for h in _columnas(df) if (h is None or str(h).strip() in ("", " "))]
     if empty_headers:
         obs.append(f"Se encuentran {len(empty_headers)} variables sin nombre. Revisar el contenido de estas variables.")
     return obs, df
 
-def validar_nombre_archivo(nom_arch: str):
+def validar_nombre_archivo(nom_arch: str, medicion=None):
+    reglas = get_reglas()
     obs = []
-    if re.search(r"[ñáéíóúüÑÁÉÍÓÚÜ]", nom_arch):
-        obs.append("El nombre del archivo contiene caracteres especiales (ñ, tildes, diéresis).")
-    if " " in nom_arch:
-        obs.append("El nombre del archivo no debe tener espacios. Se recomienda usar guiones bajos para separar palabras.")
-    return obs or ["No se encontraron observaciones con el nombre del archivo."]
-
-def validar_nombres_columnas(df: pl.DataFrame):
-    if df.is_empty():
-        return ["No se encontraron observaciones de los nombres de las columnas."]
+    for regla in reglas.archivo:
+        with medir_regla(regla.id, medicion):
+            if regla.evaluar_texto(nom_arch):
+                obs.append(regla.mensaje)
+    return obs or [reglas.archivo_sin_observaciones]
+
+def validar_nombres_columnas(df, medicion=None):
+    reglas = get_reglas()
+    if _sin_filas(df):
+        return [reglas.columnas_sin_observaciones]
     obs = []
-    cols = df.columns
-    especiales = [c for c in cols if re.search(r"[ñáéíóúüÑÁÉÍÓÚÜ]", c or "")]
-    if especiales:
-        obs.append("Nombre de columnas con caracteres especiales: " + " | ".join(especiales))
-    largas = [c for c in cols if split_words_underscore(c or "") > 5]
-    if largas:
-        obs.append("Nombre de columnas con más de 5 palabras: " + " | ".join(largas))
-    return obs or ["No se encontraron observaciones de los nombres de las columnas."]
-
-def validar_datos(df: pl.DataFrame):
-    if df.is_empty():
+    nombres = pl.Series(_columnas(df), dtype=pl.Utf8).fill_null("")
+    for regla in reglas.columnas:
+        with medir_regla(regla.id, medicion):
+            fallan = nombres.filter(regla.evaluar_serie(nombres))
+        if len(fallan):
+            obs.append(regla.mensaje.replace("{columnas}", " | ".join(fallan.to_list())))
+    return obs or [reglas.columnas_sin_observaciones]
+
+# Espacio al inicio del valor. Equivale al re.match(r'^\s|\s$') histórico (re.match solo
+# evalúa la posición 0); \x1c-\x1f completa la clase \s de Python frente a la de Rust.
+_PATRON_ESPACIOS = r"^[\s\x1c-\x1f]"
+
+def _expr_espacios(i: int) -> pl.Expr:
+    return pl.nth(i).cast(pl.Utf8, strict=False).str.contains(_PATRON_ESPACIOS)
+
+# Modos de validar_datos: "completo" revisa todas las filas; "primer-hallazgo" deja de
+# revisar cada columna en cuanto encuentra un valor con espacios; "muestra" revisa unas
+# MUESTRA_FILAS filas en MUESTRA_BLOQUES bloques de posición aleatoria (semilla fija) del
+# CSV, sin leer el resto del archivo.
+MODO_COMPLETO, MODO_PRIMER_HALLAZGO, MODO_MUESTRA = "completo", "primer-hallazgo", "muestra"
+MODOS_VALIDACION = (MODO_COMPLETO, MODO_PRIMER_HALLAZGO, MODO_MUESTRA)
+PRIMER_HALLAZGO_BLOQUE = 65_536
+PRIMER_HALLAZGO_BLOQUE_MAX = 1_048_576
+MUESTRA_BLOQUES = 32
+
+def _primer_hallazgo(df, candidatas):
+    """
+    Revisa por bloques crecientes (x4, hasta PRIMER_HALLAZGO_BLOQUE_MAX) solo las columnas
+    sin hallazgo todavía; termina cuando no quedan columnas o filas.
+    """
+    pendientes, encontradas = list(candidatas), set()
+    offset, bloque = 0, PRIMER_HALLAZGO_BLOQUE
+    while pendientes:
+        fila, n = _alguno_y_filas(df.slice(offset, bloque), [_expr_espacios(i).alias(str(i)) for i in pendientes])
+        encontradas.update(i for i, hit in zip(pendientes, fila) if hit)
+        pendientes = [i for i, hit in zip(pendientes, fila) if not hit]
+        if n < bloque:
+            break
+        offset += bloque
+        bloque = min(bloque * 4, PRIMER_HALLAZGO_BLOQUE_MAX)
+    return [i for i in candidatas if i in encontradas]
+
+def _primer_hallazgo_csv(path, schema, candidatas):
+    """
+    Como _primer_hallazgo pero sobre el CSV en disco, en una sola pasada: lotes de
+    PRIMER_HALLAZGO_BLOQUE filas (pl.read_csv_batched, con los tipos ya inferidos) que se
+    dejan de pedir cuando todas las columnas tienen hallazgo. Sobre pl.scan_csv cada slice
+    volvería a leer el archivo desde el inicio. Regresa (índices con hallazgo, filas o None
+    si se detuvo antes del final), o None si el CSV no se pudo leer así (el llamador usa el
+    LazyFrame).
+    """
+    encontradas, filas = set(), 0
+    try:
+        lector = pl.read_csv_batched(path, columns=list(candidatas), schema_overrides=dict(schema),
+                                     batch_size=PRIMER_HALLAZGO_BLOQUE, ignore_errors=True,
+                                     encoding="utf8-lossy")
+        while len(encontradas) < len(candidatas):
+            lotes = lector.next_batches(1)
+            if not lotes:
+                return [i for i in candidatas if i in encontradas], filas
+            for lote in lotes:
+                filas += lote.height
+                nombres, _ = _columnas_con_espacios(lote)
+                encontradas.update(i for i, c in zip(candidatas, lote.columns) if c in nombres)
+    except Exception:
+        return None
+    return list(candidatas), None
+
+def _muestrear(df: pl.DataFrame, n: int) -> tuple:
+    """Regresa (muestra aleatoria con semilla fija, filas_totales, filas_muestra)."""
+    if df.height <= n:
+        return df, df.height, df.height
+    return df.sample(n, seed=0), df.height, n
+
+def _contar_comillas(mm, desde, hasta, tramo=16 * 1024 * 1024) -> int:
+    return sum(mm[i:min(i + tramo, hasta)].count(b'"') for i in range(desde, hasta, tramo))
+
+def _bloque_csv(mm, desde, objetivo, hay_comillas) -> tuple:
+    """(datos, fin, comillas) de las filas completas desde 'desde' hasta pasar 'objetivo' bytes."""
+    total = len(mm)
+    fin = _fin_de_linea(mm, min(desde + objetivo, total - 1))
+    datos = mm[desde:fin]
+    comillas = datos.count(b'"') if hay_comillas else 0
+    while comillas % 2 and fin < total:  # el corte quedó dentro de un campo: se extiende
+        extra = mm[fin:_fin_de_linea(mm, fin)]
+        comillas += extra.count(b'"')
+        datos += extra
+        fin += len(extra)
+    return datos, fin, comillas
+
+def _muestra_csv(path, schema, n):
+    """
+    Muestra de unas n filas del CSV en disco sin leerlo completo: un bloque de filas
+    consecutivas en una posición aleatoria (semilla fija) de cada uno de MUESTRA_BLOQUES
+    tramos del archivo, con el tamaño que dan los bytes por fila del inicio. Cada bloque
+    empieza y termina en un fin de línea fuera de comillas, como en validar_datos_incremental;
+    si el archivo tiene comillas, la paridad hasta el bloque se cuenta sin parsear.
+    Regresa (índices con hallazgo, filas revisadas, filas estimadas del archivo), o None si
+    el archivo no tiene más de n filas o un bloque no se pudo leer (el llamador revisa todo).
+    """
+    leer = _columnas_texto(schema)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            total = len(mm)
+            inicio = _fin_de_linea(mm, 0)
+            if inicio >= total:
+                return None
+            hay_comillas = mm.find(b'"', inicio) != -1
+            datos, fin, _ = _bloque_csv(mm, inicio, 1024 * 1024, hay_comillas)
+            try:
+                bytes_fila = (fin - inicio) / max(1, _validar_bloque(datos, schema, leer)[0])
+            except Exception:
+                return None
+            estimadas = round((total - inicio) / bytes_fila)
+            if estimadas <= n:
+                return None
+            objetivo = max(1, int(n / MUESTRA_BLOQUES * bytes_fila))
+            tramo = (total - inicio) / MUESTRA_BLOQUES
+            rng = random.Random(0)
+            contado, comillas = inicio, 0  # comillas en [inicio, contado)
+            hits, filas, fin = set(), 0, inicio
+            for j in range(MUESTRA_BLOQUES):
+                desde = inicio + int(j * tramo) + rng.randrange(max(1, int(tramo) - objetivo))
+                desde = _fin_de_linea(mm, max(desde, fin) - 1)
+                if hay_comillas:
+                    comillas += _contar_comillas(mm, contado, desde)
+                    while comillas % 2 and desde < total:  # cayó dentro de un campo: siguiente línea
+                        siguiente = _fin_de_linea(mm, desde)
+                        comillas += mm[desde:siguiente].count(b'"')
+                        desde = siguiente
+                if desde >= total:
+                    break
+                datos, fin, q = _bloque_csv(mm, desde, objetivo, hay_comillas)
+                comillas += q
+                contado = fin
+                try:
+                    filas_bloque, hits_bloque = _validar_bloque(datos, schema, leer)
+                except Exception:
+                    return None
+                filas += filas_bloque
+                hits.update(hits_bloque)
+    return sorted(hits), filas, max(estimadas, filas)
+
+def _columnas_con_espacios(df, modo=MODO_COMPLETO, fuente=None):
+    """
+    Evalúa todas las columnas en un solo select (paralelizable por Polars).
+    Regresa (columnas, filas); filas es None si no se recorrió el archivo completo.
+    fuente: ruta del CSV detrás del LazyFrame (primer-hallazgo lo recorre por bloques).
+    """
+    schema = df.collect_schema()
+    columnas, tipos = schema.names(), schema.dtypes()
+    candidatas = [i for i, dt in enumerate(tipos) if not (dt.is_numeric() or dt == pl.Boolean)]
+    if not candidatas:
+        return [], None
+    try:
+        if modo == MODO_PRIMER_HALLAZGO:
+            if fuente is not None and isinstance(df, pl.LazyFrame):
+                resultado = _primer_hallazgo_csv(fuente, schema, candidatas)
+                if resultado is not None:
+                    return [columnas[i] for i in resultado[0]], resultado[1]
+            return [columnas[i] for i in _primer_hallazgo(df, candidatas)], None
+        fila, filas = _alguno_y_filas(df, [_expr_espacios(i).alias(str(i)) for i in candidatas])
+        return [columnas[i] for i, hit in zip(candidatas, fila) if hit], filas
+    except Exception:
+        # Alguna columna no admite el cast: se evalúa una por una, omitiendo las que fallen
+        resultado = []
+        for i in candidatas:
+            try:
+                if _alguno(df, [_expr_espacios(i)])[0]:
+                    resultado.append(columnas[i])
+            except Exception:
+                continue
+        return resultado, None
+
+def validar_datos(df, modo=MODO_COMPLETO, muestra_filas=None, medicion=None, fuente=None):
+    """
+    medicion (dict, opcional): recibe "filas" cuando la pasada recorre el archivo completo.
+    fuente: ruta del CSV que leyó pl.scan_csv (ver _primer_hallazgo_csv).
+    """
+    if _sin_filas(df):
         return ["No se encontraron observaciones sobre los datos."]
+    if modo != MODO_MUESTRA:
+        columnas, filas = _columnas_con_espacios(df, modo, fuente)
+        if medicion is not None and filas is not None:
+            medicion["filas"] = filas
+        obs = [f"La columna {c} tiene valores con espacios al inicio o final." for c in columnas]
+        return obs or ["No se encontraron observaciones sobre los datos."]
+
+    n = muestra_filas or app.config["MUESTRA_FILAS"]
+    if fuente is not None:
+        # CSV: el costo es leer el archivo, así que la muestra se lee directo de disco
+        muestra = _muestra_csv(fuente, df.collect_schema(), n)
+        if muestra is None:
+            return validar_datos(df, medicion=medicion)
+        indices, n, total = muestra
+        columnas = _columnas(df)
+        con_espacios = [columnas[i] for i in indices]
+        detalle = f"muestra de {n:,} de ~{total:,} filas"
+    else:
+        if isinstance(df, pl.LazyFrame):
+            return validar_datos(df, medicion=medicion)
+        df_muestra, total, n = _muestrear(df, n)
+        if n >= total:
+            return validar_datos(df, medicion=medicion)
+        con_espacios = _columnas_con_espacios(df_muestra)[0]
+        detalle = f"muestra de {n:,} de {total:,} filas"
+    obs = [f"La columna {c} tiene valores con espacios al inicio o final ({detalle})." for c in con_espacios]
+    # Regla del tres: sin hallazgos en n filas, la proporción real es < 1 - 0.05^(1/n) con 95% de confianza
+    cota = 1 - 0.05 ** (1 / n)
+    return obs or [f"No se encontraron observaciones sobre los datos en una {detalle}: con 95% de confianza, "
+                   f"menos del {cota:.3%} de los valores de cada columna tiene espacios al inicio o final."]
+
+# ---------------- PERFIL DE CALIDAD DE DATOS ----------------
+# perfil=1 agrega a FINAL["datos"] columnas con muchos vacíos, columnas que mezclan números y
+# texto, números guardados como texto, formatos de fecha distintos y filas duplicadas. Todo
+# sale de una sola lectura: un select de máscaras booleanas por revisión (más el hash de cada
+# fila) corre en streaming y los conteos y filas de ejemplo se agregan sobre ese resultado
+# compacto, sin volver a leer el texto.
+# Los patrones toleran espacios alrededor (esos ya los reporta validar_datos) en lugar de
+# hacer strip_chars, que copiaría cada valor; solo se usan como is_match (DFA, sin capturas)
+_RE_NUMERO = r"^\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*$"
+_RE_CLAVE = r"^\s*0\d"  # claves con cero a la izquierda ("09"): texto a propósito, no número
+FORMATOS_FECHA = (
+    ("AAAA-MM-DD", r"^\s*\d{4}-\d{1,2}-\d{1,2}"),
+    ("AAAA/MM/DD", r"^\s*\d{4}/\d{1,2}/\d{1,2}"),
+    ("DD/MM/AAAA", r"^\s*\d{1,2}/\d{1,2}/\d{4}"),
+    ("DD-MM-AAAA", r"^\s*\d{1,2}-\d{1,2}-\d{4}"),
+)
+
+def _revisiones_perfil(schema, excel=False) -> dict:
+    """
+    {alias: expresión booleana} de cada revisión; alias = "índice de columna:revisión".
+    excel: los lectores de Excel dejan las celdas vacías como "", que también cuentan como vacías.
+    """
+    revisiones = {}
+    for i, dt in enumerate(schema.dtypes()):
+        revisiones[f"{i}:nulos"] = pl.nth(i).is_null()
+        if excel and dt == pl.Utf8:
+            revisiones[f"{i}:nulos"] = pl.nth(i).is_null() | (pl.nth(i) == "")
+        if dt == pl.Utf8:
+            texto = pl.nth(i).str
+            es_numero = texto.contains(_RE_NUMERO)
+            revisiones[f"{i}:numero"] = es_numero
+            revisiones[f"{i}:texto"] = ~es_numero & texto.contains(r"\S")
+            revisiones[f"{i}:clave"] = texto.contains(_RE_CLAVE)
+            for k, (_, patron) in enumerate(FORMATOS_FECHA):
+                revisiones[f"{i}:fecha{k}"] = texto.contains(patron)
+    return revisiones
+
+def _estadisticas_perfil(df, revisiones) -> dict:
+    """
+    Una lectura: {alias: (conteo, primera fila, última fila)} más "__filas" y "__duplicadas"
+    (filas iguales a una anterior, por hash). Las filas van desde 0.
+    """
+    n = len(df.collect_schema())
+    # Siempre lazy: la eliminación de subexpresiones comunes evalúa es_numero una sola vez
+    mascaras = df.lazy().select(*(e.alias(a) for a, e in revisiones.items()),
+                         pl.struct(*(pl.nth(i) for i in range(n))).hash(seed=0).alias("__hash"))
+    mascaras = mascaras.with_row_index("__fila").collect(streaming=True)  # bits y enteros por fila, no el texto
+    repetida = ~pl.col("__hash").is_first_distinct()
+    aggs = [pl.len().alias("__filas"), repetida.sum().alias("__duplicadas"),
+            pl.col("__fila").filter(repetida).min().alias("__duplicadas:min"),
+            pl.col("__fila").filter(repetida).max().alias("__duplicadas:max")]
+    for a in revisiones:
+        aggs += [pl.col(a).sum().alias(a), pl.col("__fila").filter(pl.col(a)).min().alias(f"{a}:min"),
+                 pl.col("__fila").filter(pl.col(a)).max().alias(f"{a}:max")]
+    fila = mascaras.select(aggs).row(0, named=True)
+    stats = {a: (fila[a] or 0, fila[f"{a}:min"], fila[f"{a}:max"]) for a in list(revisiones) + ["__duplicadas"]}
+    stats["__filas"] = fila["__filas"]
+    return stats
+
+def _ejemplos(primera, ultima) -> str:
+    """Filas de ejemplo en numeración de datos (la primera fila después del encabezado es la 1)."""
+    if primera is None:
+        return ""
+    if primera == ultima:
+        return f"; p. ej. fila {primera + 1:,}"
+    return f"; p. ej. filas {primera + 1:,} y {ultima + 1:,}"
+
+def perfilar_datos(df, medicion=None, excel=False) -> list:
+    """
+    Hallazgos de calidad de datos (ver _revisiones_perfil) con conteos y filas de ejemplo.
+    medicion (dict, opcional): recibe "filas". excel: el DataFrame viene de EXCEL_LECTORES, donde
+    toda columna es Utf8 a propósito; no se reportan números guardados como texto.
+    """
+    schema = df.collect_schema()
+    if not schema.names():
+        return []
+    revisiones = _revisiones_perfil(schema, excel)
+    stats = _estadisticas_perfil(df, revisiones)
+    filas = stats["__filas"]
+    if medicion is not None:
+        medicion["filas"] = filas
+    if filas == 0:
+        return []
     obs = []
-    cols_texto = df.columns
-    for c in cols_texto:
-        try:
-            serie_str = df[c].cast(pl.Utf8, strict=False)
-            has_spaces = serie_str.drop_nulls().map_elements(
-                lambda x: bool(re.match(r'^\s|\s$', str(x))) if x is not None else False,
-                return_dtype=pl.Boolean
-            ).any()
-            if has_spaces:
-                obs.append(f"La columna {c} tiene valores con espacios al inicio o final.")
-        except Exception:
+    for i, (c, dt) in enumerate(zip(schema.names(), schema.dtypes())):
+        nulos = stats[f"{i}:nulos"]
+        if nulos[0] and nulos[0] / filas >= app.config["PERFIL_MAX_NULOS"]:
+            obs.append(f"La columna {c} tiene {nulos[0] / filas:.1%} de valores vacíos "
+                       f"({nulos[0]:,} de {filas:,} filas{_ejemplos(*nulos[1:])}).")
+        if dt != pl.Utf8:
             continue
-    return obs or ["No se encontraron observaciones sobre los datos."]
+        numeros, textos, claves = stats[f"{i}:numero"], stats[f"{i}:texto"], stats[f"{i}:clave"]
+        if numeros[0] and textos[0]:
+            minoria = numeros if numeros[0] <= textos[0] else textos
+            obs.append(f"La columna {c} mezcla números ({numeros[0]:,}) y texto ({textos[0]:,})"
+                       f"{_ejemplos(*minoria[1:])}.")
+        elif numeros[0] and not claves[0] and not excel:
+            obs.append(f"La columna {c} tiene solo números pero está guardada como texto "
+                       f"({numeros[0]:,} valores{_ejemplos(*numeros[1:])}).")
+        fechas = [(nombre, stats[f"{i}:fecha{k}"]) for k, (nombre, _) in enumerate(FORMATOS_FECHA)
+                  if stats[f"{i}:fecha{k}"][0]]
+        if len(fechas) > 1:
+            minoria = min(fechas, key=lambda f: f[1][0])[1]
+            detalle = ", ".join(f"{nombre} ({conteo[0]:,})" for nombre, conteo in fechas)
+            obs.append(f"La columna {c} tiene fechas en formatos distintos: {detalle}{_ejemplos(*minoria[1:])}.")
+    duplicadas = stats["__duplicadas"]
+    if duplicadas[0]:
+        cuantas = "1 fila duplicada" if duplicadas[0] == 1 else f"{duplicadas[0]:,} filas duplicadas"
+        obs.append(f"El archivo tiene {cuantas}{_ejemplos(*duplicadas[1:])}.")
+    return obs
 
 # ---------------- PDF PARA ARCHIVOS VÁLIDOS/OBSERVADOS ----------------
-def construir_pdf(final_dict: dict, nombre_archivo: str, token: str) -> bytes:
-    pdf_buffer = io.BytesIO()
+LOGO_DPI = 200  # resolución de los logos dentro de su caja en el PDF
+FORM_ENCABEZADO_PIE = "encabezado_pie"
+
+@lru_cache(maxsize=None)
+def _logo(nombre: str, ancho_cm: float, alto_cm: float):
+    """
+    ImageReader del logo reducido a LOGO_DPI para su caja. Se decodifica una vez por
+    proceso y la versión reducida queda en la caché en disco: un worker nuevo no vuelve
+    a escalar el original. None si no existe o no se puede leer.
+    """
+    path = os.path.join(LOGOS_FOLDER, nombre)
+    try:
+        from PIL import Image
+        from reportlab.lib.utils import ImageReader
+        caja = (round(ancho_cm / 2.54 * LOGO_DPI), round(alto_cm / 2.54 * LOGO_DPI))
+        st = os.stat(path)
+        clave = hashlib.sha256(f"logo|{nombre}|{caja}|{st.st_mtime_ns}|{st.st_size}".encode("utf-8")).hexdigest()
+        cache = get_cache()
+        reducido = cache.get_bytes(clave, "png") if cache is not None else None
+        if reducido is not None:
+            img = Image.open(io.BytesIO(reducido))
+            img.load()
+            return ImageReader(img)
+        img = Image.open(path)
+        img.load()
+        img.thumbnail(caja, Image.LANCZOS)
+        if cache is not None:
+            buf = io.BytesIO()
+            img.save(buf, "PNG")
+            cache.put_bytes(clave, buf.getvalue(), "png")
+        return ImageReader(img)
+    except Exception:
+        return None
+
+def definir_encabezado_pie(c):
+    """Logos de encabezado y pie como form XObject: se dibujan una vez por documento."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import cm
+    width, height = letter
+    ancho_pagina_cm = width / cm
+    c.beginForm(FORM_ENCABEZADO_PIE)
+    for nombre, x, y, w, h in (
+        ("superiorizquierdo.png", 2.2 * cm, height - 3.0 * cm, 7.0 * cm, 2.0 * cm),
+        ("superiorderecho.png", width - 7.5 * cm, height - 3.0 * cm, 7.0 * cm, 2.0 * cm),
+        ("inferior.png", 0, 0.5 * cm, width, 2.5 * cm),
+    ):
+        logo = _logo(nombre, ancho_pagina_cm if w == width else w / cm, h / cm)
+        if logo is not None:
+            try:
+                c.drawImage(logo, x, y, width=w, height=h, preserveAspectRatio=True, mask="auto")
+            except Exception:
+                pass
+    c.endForm()
+
+@lru_cache(maxsize=None)
+def _ancho_glifo(ch: str, font_name: str, font_size: float) -> float:
+    from reportlab.pdfbase import pdfmetrics
+    return pdfmetrics.stringWidth(ch, font_name, font_size)
+
+@lru_cache(maxsize=16384)
+def ancho_texto(texto: str, font_name: str, font_size: float) -> float:
+    """Ancho de texto a partir de anchos de glifo en caché (fuentes estándar sin kerning)."""
+    return sum(_ancho_glifo(ch, font_name, font_size) for ch in texto)
+
+def partir_lineas(text: str, max_width: float, font_name: str, font_size: float) -> list:
+    """
+    Ajuste de línea por palabras; las palabras más anchas que la línea se parten por
+    caracteres. Cada palabra se mide una sola vez y el ancho de la línea se acumula.
+    """
+    espacio = _ancho_glifo(" ", font_name, font_size)
+    lines, current_line, current_width = [], [], 0.0
+    for word in text.split(' '):
+        word_width = ancho_texto(word, font_name, font_size)
+        test_width = current_width + espacio + word_width if current_line else word_width
+        if test_width <= max_width:
+            current_line.append(word)
+            current_width = test_width
+            continue
+        if current_line:
+            lines.append(' '.join(current_line))
+        if word_width > max_width:
+            temp_word, temp_width = "", 0.0
+            for ch in word:
+                ch_width = _ancho_glifo(ch, font_name, font_size)
+                if temp_width + ch_width <= max_width:
+                    temp_word += ch
+                    temp_width += ch_width
+                else:
+                    if temp_word:
+                        lines.append(temp_word)
+                    temp_word, temp_width = ch, ch_width
+            current_line, current_width = ([temp_word], temp_width) if temp_word else ([], 0.0)
+        else:
+            current_line, current_width = [word], word_width
+    if current_line:
+        lines.append(' '.join(current_line))
+    return lines
+
+def dibujar_informe(c, final_dict: dict, nombre_archivo: str):
+    """Dibuja el acuse de un archivo sobre el canvas c (una o más páginas, la última abierta)."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import cm
     width, height = letter
-    c = canvas.Canvas(pdf_buffer, pagesize=letter)
 
     left_margin = 2.2 * cm
     right_margin = 2.2 * cm
@@ -239,29 +1426,10 @@ def construir_pdf(final_dict: dict, nombre_archivo: str, token: str) -> bytes:
     line_height = 0.5 * cm
     available_width = width - left_margin - right_margin
 
-    header_left = os.path.join(LOGOS_FOLDER, "superiorizquierdo.png")
-    header_right = os.path.join(LOGOS_FOLDER, "superiorderecho.png")
-    footer_img = os.path.join(LOGOS_FOLDER, "inferior.png")
-
     def draw_header_footer():
-        try:
-            if os.path.exists(header_left):
-                c.drawImage(header_left, left_margin, height - 3.0 * cm,
-                            width=7.0 * cm, height=2.0 * cm, preserveAspectRatio=True, mask="auto")
-        except Exception:
-            pass
-        try:
-            if os.path.exists(header_right):
-                c.drawImage(header_right, width - 7.5 * cm, height - 3.0 * cm,
-                            width=7.0 * cm, height=2.0 * cm, preserveAspectRatio=True, mask="auto")
-        except Exception:
-            pass
-        try:
-            if os.path.exists(footer_img):
-                c.drawImage(footer_img, 0, 0.5 * cm,
-                            width=width, height=2.5 * cm, preserveAspectRatio=True, mask="auto")
-        except Exception:
-            pass
+        if not c.hasForm(FORM_ENCABEZADO_PIE):
+            definir_encabezado_pie(c)
+        c.doForm(FORM_ENCABEZADO_PIE)
 
     def nueva_pagina():
         c.showPage()
@@ -303,32 +1471,7 @@ def construir_pdf(final_dict: dict, nombre_archivo: str, token: str) -> bytes:
     def draw_wrapped_text(text, x, y, max_width, font_name="Helvetica", font_size=10.5):
         if not text:
             return y
-        words = str(text).split(' ')
-        lines, current_line = [], []
-        for word in words:
-            test_line = ' '.join(current_line + [word]) if current_line else word
-            if c.stringWidth(test_line, font_name, font_size) <= max_width:
-                current_line.append(word)
-            else:
-                if current_line:
-                    lines.append(' '.join(current_line))
-                if c.stringWidth(word, font_name, font_size) > max_width:
-                    temp_word, chars = "", list(word)
-                    for ch in chars:
-                        temp_test = temp_word + ch
-                        if c.stringWidth(temp_test, font_name, font_size) <= max_width:
-                            temp_word += ch
-                        else:
-                            if temp_word:
-                                lines.append(temp_word)
-                            temp_word = ch
-                    if temp_word:
-                        current_line = [temp_word]
-                else:
-                    current_line = [word]
-        if current_line:
-            lines.append(' '.join(current_line))
-        for line in lines:
+        for line in partir_lineas(str(text), max_width, font_name, font_size):
             if y < bottom_margin + 1.5 * cm:
                 y = nueva_pagina()
             c.drawString(x, y, line)
@@ -405,20 +1548,1160 @@ def construir_pdf(final_dict: dict, nombre_archivo: str, token: str) -> bytes:
     c.drawCentredString(width / 2, bottom_margin + 2.3 * cm, "Datos Abiertos")
     c.drawCentredString(width / 2, bottom_margin + 1.6 * cm, "Dirección de Innovación y Análisis de Datos")
 
-    c.save()
+def construir_pdf(final_dict: dict, nombre_archivo: str, token: str | None = None) -> bytes:
+    """Sin token solo regresa los bytes: la copia de auditoría es la de /descargar/pdf/<token>."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    pdf_buffer = io.BytesIO()
+    with medir("pdf"):
+        c = canvas.Canvas(pdf_buffer, pagesize=letter)
+        dibujar_informe(c, final_dict, nombre_archivo)
+
+        c.save()
     pdf_buffer.seek(0)  # importante
     pdf_bytes = pdf_buffer.getvalue()
 
     # (Opcional) Guardar PDF temporal para auditoría
+    if token is None:
+        return pdf_bytes
     try:
-        pdf_path = os.path.join(RESULTS_FOLDER, f"informe_{token}.pdf")
-        with open(pdf_path, "wb") as f:
+        with open(ruta_informe(token), "wb") as f:
             f.write(pdf_bytes)
     except Exception:
         pass
 
     return pdf_bytes
 
+def ruta_informe(token) -> str:
+    return os.path.join(RESULTS_FOLDER, f"informe_{token}.pdf")
+
+def construir_pdf_archivo(final_dict: dict, nombre_archivo: str, destino: str) -> str:
+    """
+    Como construir_pdf pero reportlab escribe el documento directo en 'destino' al guardar:
+    sin BytesIO ni copia en bytes. Se escribe a un temporal y se renombra (sin PDFs a medias).
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    fd, tmp = tempfile.mkstemp(suffix=".pdf.tmp", dir=RESULTS_FOLDER)  # único también entre hilos
+    os.close(fd)
+    try:
+        with medir("pdf"):
+            c = canvas.Canvas(tmp, pagesize=letter)
+            dibujar_informe(c, final_dict, nombre_archivo)
+            c.save()
+        os.replace(tmp, destino)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return destino
+
+def construir_pdf_lote(informes) -> bytes:
+    """Un solo PDF con el acuse de cada archivo; informes = [(final_dict, nombre_archivo), ...]."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    pdf_buffer = io.BytesIO()
+    with medir("pdf"):
+        c = canvas.Canvas(pdf_buffer, pagesize=letter)
+        for i, (final_dict, nombre_archivo) in enumerate(informes):
+            if i:
+                c.showPage()
+            dibujar_informe(c, final_dict, nombre_archivo)
+        c.save()
+    return pdf_buffer.getvalue()
+
+# ---------------- VALIDACIÓN COMPLETA ----------------
+def _validar_contenido(df, upload_path, filename, ext, modo, muestra_filas, m, incremental, dataset, perfil,
+                       parcial) -> tuple:
+    """Etapas de ejecutar_validacion que leen las filas; regresa (columnas_obs, datos_obs)."""
+    with medir("columnas", m):
+        columnas_obs = validar_nombres_columnas(df, m)
+    with medir("datos", m):
+        datos_obs = None
+        fuente = None
+        if ext == "csv":
+            fuente = ruta_utf8(upload_path) if os.path.exists(ruta_utf8(upload_path)) else upload_path
+        if incremental and ext == "csv" and modo == MODO_COMPLETO:
+            datos_obs = validar_datos_incremental(fuente, df.collect_schema(), dataset or filename, m)
+        elif parcial.get("datos") and modo == MODO_COMPLETO:
+            datos_obs = datos_de_partes(parcial["datos"], df.collect_schema(), m)
+        if datos_obs is None:
+            datos_obs = validar_datos(df, modo, muestra_filas, medicion=m, fuente=fuente)
+    if perfil:
+        with medir("perfil", m):
+            hallazgos = perfilar_datos(df, m, excel=ext in ("xls", "xlsx"))
+        if hallazgos:
+            datos_obs = [o for o in datos_obs if not o.startswith("No se encontraron")] + hallazgos
+    m["columnas"] = len(_columnas(df))
+    if "filas" not in m and modo != MODO_COMPLETO and isinstance(df, pl.LazyFrame):
+        m["filas"] = None  # no recorrió el archivo completo: contarlas sería leerlo todo
+    elif "filas" not in m:
+        # sin columnas de texto: en LazyFrame se cuentan aparte (solo saltos de línea)
+        with medir("conteo", m):
+            try:
+                m["filas"] = df.select(pl.len()).collect().item() if isinstance(df, pl.LazyFrame) else df.height
+            except Exception:
+                m["filas"] = None
+    return columnas_obs, datos_obs
+
+def ejecutar_validacion(upload_path, filename, ext, streaming=False, modo=MODO_COMPLETO, muestra_filas=None,
+                        medicion=None, incremental=False, dataset=None, perfil=False, parcial=None) -> dict:
+    """
+    Corre los cuatro validadores sobre el upload guardado y regresa FINAL.
+    Con 'medicion' (dict) deja ahí la duración de cada etapa, filas y columnas del archivo.
+    incremental: CSV en modo completo reutiliza los veredictos de la versión anterior del
+    mismo 'dataset' (ver validar_datos_incremental); el resultado es idéntico.
+    perfil: agrega a "datos" los hallazgos de perfilar_datos (todas las filas, en cualquier modo).
+    parcial: revisiones hechas mientras llegaban las partes de una carga (ver revisiones_carga).
+    """
+    m = {} if medicion is None else medicion
+    parcial = parcial or {}
+    try:
+        with medir("carga", m):
+            formato_obs, df = validar_formato_y_carga(upload_path, filename, ext, streaming=streaming,
+                                                      codificacion=parcial.get("codificacion"))
+        with medir("archivo", m):
+            archivo_obs = validar_nombre_archivo(os.path.splitext(filename)[0], m)
+        try:
+            columnas_obs, datos_obs = _validar_contenido(df, upload_path, filename, ext, modo, muestra_filas, m,
+                                                         incremental, dataset, perfil, parcial)
+        except pl.exceptions.PolarsError as e:
+            # pl.scan_csv solo lee encabezados al cargar: un renglón irregular o un binario falla
+            # aquí. Misma observación de formato que la lectura completa de validar_formato_y_carga
+            if not isinstance(df, pl.LazyFrame):
+                raise
+            formato_obs.append(f"No fue posible leer el CSV: {e}")
+            m.pop("filas", None)
+            columnas_obs, datos_obs = _validar_contenido(pl.DataFrame(), upload_path, filename, ext, modo,
+                                                         muestra_filas, m, False, dataset, perfil, {})
+    finally:
+        if os.path.exists(ruta_utf8(upload_path)):
+            os.remove(ruta_utf8(upload_path))
+    return {"formato": formato_obs, "archivo": archivo_obs, "columnas": columnas_obs, "datos": datos_obs}
+
+def revisar_modo(modo, nombre):
+    """
+    ValueError si el modo no aplica al archivo: un Excel se carga completo antes de validar,
+    así que la muestra no ahorra tiempo y solo se ofrece para CSV (ver _muestra_csv).
+    """
+    if modo == MODO_MUESTRA and nombre and nombre.lower().endswith((".xls", ".xlsx")):
+        raise ValueError("El modo muestra solo aplica a archivos CSV; para Excel use completo o primer-hallazgo.")
+
+def opciones_validacion(valores, nombre=None) -> dict:
+    """
+    Opciones de ejecutar_validacion a partir de los campos del formulario/API:
+    modo (completo | primer-hallazgo | muestra), muestra (filas), incremental (1), dataset
+    (nombre lógico para incremental; por defecto el nombre del archivo) y perfil (1).
+    ValueError si no son válidos (o si el modo no aplica a nombre, ver revisar_modo).
+    """
+    modo = (valores.get("modo") or MODO_COMPLETO).lower()
+    if modo not in MODOS_VALIDACION:
+        raise ValueError(f"Modo de validación no válido. Use: {', '.join(MODOS_VALIDACION)}.")
+    revisar_modo(modo, nombre)
+    muestra_filas = None
+    if modo == MODO_MUESTRA:
+        try:
+            muestra_filas = int(valores.get("muestra") or app.config["MUESTRA_FILAS"])
+        except ValueError:
+            raise ValueError("El tamaño de muestra debe ser un número entero.")
+        if muestra_filas < 1:
+            raise ValueError("El tamaño de muestra debe ser mayor a cero.")
+    incremental = str(valores.get("incremental", "")).lower() in ("1", "true", "si", "sí")
+    perfil = str(valores.get("perfil", "")).lower() in ("1", "true", "si", "sí")
+    return {"streaming": app.config["VALIDACION_STREAMING"], "modo": modo, "muestra_filas": muestra_filas,
+            "incremental": incremental, "dataset": valores.get("dataset") or None, "perfil": perfil}
+
+def pasa_validacion(FINAL) -> bool:
+    for key in ("formato", "archivo", "columnas", "datos"):
+        lst = FINAL.get(key, [])
+        if len(lst) > 1 or (len(lst) == 1 and not str(lst[0]).startswith("No se encontraron")):
+            return False
+    return True
+
+def nuevo_token() -> str:
+    return datetime.now().strftime("%Y%m%d%H%M%S%f")
+
+def _escribir_json(path, data):
+    """Escritura atómica: los lectores de otros workers nunca ven un JSON a medias."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def guardar_resultado(token, FINAL, medicion=None):
+    with medir("json", medicion):
+        get_resultados().guardar(token, RESULTADO_FINAL, FINAL)
+
+def leer_resultado(token):
+    return get_resultados().leer(token, RESULTADO_FINAL)
+
+def registrar_validacion(ip_address, filename, file_size_kb, processing_time, FINAL, cache="-", medicion=None):
+    """
+    Log mensual + reporte semanal + métricas. FINAL=None registra un ERROR. cache: HIT, MISS o '-'.
+    medicion: etapas, filas y columnas de ejecutar_validacion (None en aciertos de caché).
+    """
+    if FINAL is None:
+        status, observations_count = "ERROR", 0
+    else:
+        status = "VÁLIDO" if pasa_validacion(FINAL) else "NO VÁLIDO"
+        observations_count = count_total_observations(FINAL)
+    medicion = medicion or {}
+    etapas = medicion.get("etapas", {})
+    t_validacion = sum(etapas.get(e, 0) for e in ETAPAS_VALIDACION)
+    if t_validacion > 0:
+        medicion["bytes_por_s"] = round(file_size_kb * 1024 / t_validacion)
+    with medir("auditoria"):
+        write_to_log(ip_address, filename, file_size_kb, processing_time, status, cache)
+        update_weekly_report(ip_address, filename, file_size_kb, processing_time, status, observations_count,
+                             cache, medicion)
+    registrar_metricas(processing_time, status, cache, file_size_kb, medicion)
+
+def registrar_metricas(processing_time, status, cache, file_size_kb, medicion):
+    for etapa, segundos in medicion.get("etapas", {}).items():
+        METRICAS.observar("validador_etapa_segundos", segundos, etapa=etapa)
+    for regla, segundos in medicion.get("reglas", {}).items():
+        METRICAS.observar("validador_regla_segundos", segundos, regla=regla)
+    for nombre, clave in (("validador_filas", "filas"), ("validador_columnas", "columnas"),
+                          ("validador_bytes_por_segundo", "bytes_por_s")):
+        if medicion.get(clave) is not None:
+            METRICAS.observar(nombre, medicion[clave])
+    METRICAS.observar("validador_validacion_segundos", processing_time, cache=cache)
+    METRICAS.incrementar("validador_validaciones_total", estado=status, cache=cache)
+    METRICAS.incrementar("validador_bytes_total", round(file_size_kb * 1024))
+    get_volcado_metricas()  # el volcado a disco lo hace su hilo, fuera de la petición
+
+# ---------------- ALMACÉN DE RESULTADOS ----------------
+# FINAL y el estado de los trabajos asíncronos, por token, hasta la descarga del PDF o hasta
+# vencer (RESULTADOS_TTL_H). Los vencidos nunca se devuelven; un hilo por proceso los borra
+# cada RESULTADOS_PURGA_S. Backends en ALMACENES_RESULTADOS, elegido con RESULTADOS_BACKEND.
+RESULTADO_FINAL, RESULTADO_JOB = "final", "job"
+ALMACENES_RESULTADOS = {}
+
+def registrar_almacen(nombre):
+    def deco(cls):
+        ALMACENES_RESULTADOS[nombre] = cls
+        return cls
+    return deco
+
+@registrar_almacen("sqlite")
+class AlmacenSQLite:
+    """
+    Una tabla (token, tipo) -> JSON + vencimiento en un archivo SQLite en modo WAL, compartido
+    por los workers de gunicorn: las lecturas no esperan a las escrituras de otro proceso.
+    Una conexión por hilo (sqlite3 no permite compartirlas).
+    """
+    def __init__(self, ttl_s):
+        self.path = app.config["RESULTADOS_DB"]
+        self.ttl_s = ttl_s
+        self._local = threading.local()
+        con = self._conexion()
+        con.execute("CREATE TABLE IF NOT EXISTS resultados (token TEXT NOT NULL, tipo TEXT NOT NULL, "
+                    "datos TEXT NOT NULL, expira REAL NOT NULL, PRIMARY KEY (token, tipo)) WITHOUT ROWID")
+        con.execute("CREATE INDEX IF NOT EXISTS resultados_expira ON resultados (expira)")
+
+    def _conexion(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            # Autocommit: cada sentencia es su propia transacción salvo BEGIN explícito
+            con = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")  # en WAL solo un corte de luz pierde lo último
+            self._local.con = con
+        return con
+
+    def guardar(self, token, tipo, datos):
+        self._conexion().execute(
+            "INSERT OR REPLACE INTO resultados (token, tipo, datos, expira) VALUES (?, ?, ?, ?)",
+            (token, tipo, json.dumps(datos, ensure_ascii=False), time.time() + self.ttl_s))
+
+    def leer(self, token, tipo):
+        fila = self._conexion().execute(
+            "SELECT datos FROM resultados WHERE token = ? AND tipo = ? AND expira > ?",
+            (token, tipo, time.time())).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def actualizar(self, token, tipo, campos):
+        """Mezcla 'campos' en el JSON guardado (o lo crea) dentro de una sola transacción."""
+        con = self._conexion()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            datos = self.leer(token, tipo) or {}
+            datos.update(campos)
+            self.guardar(token, tipo, datos)
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return datos
+
+    def eliminar(self, token):
+        self._conexion().execute("DELETE FROM resultados WHERE token = ?", (token,))
+
+    def purgar(self) -> int:
+        return self._conexion().execute("DELETE FROM resultados WHERE expira <= ?", (time.time(),)).rowcount
+
+@registrar_almacen("memoria")
+class AlmacenMemoria:
+    """Sustituto local en memoria del proceso: solo sirve con un worker (desarrollo)."""
+    def __init__(self, ttl_s):
+        self.ttl_s = ttl_s
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def guardar(self, token, tipo, datos):
+        with self._lock:
+            self._datos[(token, tipo)] = (json.dumps(datos, ensure_ascii=False), time.time() + self.ttl_s)
+
+    def leer(self, token, tipo):
+        with self._lock:
+            datos, expira = self._datos.get((token, tipo), (None, 0))
+        return json.loads(datos) if datos is not None and expira > time.time() else None
+
+    def actualizar(self, token, tipo, campos):
+        with self._lock:
+            datos, expira = self._datos.get((token, tipo), (None, 0))
+            datos = json.loads(datos) if datos is not None and expira > time.time() else {}
+            datos.update(campos)
+            self._datos[(token, tipo)] = (json.dumps(datos, ensure_ascii=False), time.time() + self.ttl_s)
+        return datos
+
+    def eliminar(self, token):
+        with self._lock:
+            for clave in [c for c in self._datos if c[0] == token]:
+                del self._datos[clave]
+
+    def purgar(self) -> int:
+        ahora = time.time()
+        with self._lock:
+            vencidos = [c for c, (_, expira) in self._datos.items() if expira <= ahora]
+            for clave in vencidos:
+                del self._datos[clave]
+        return len(vencidos)
+
+class PurgaResultados(threading.Thread):
+    """Hilo por proceso que borra los resultados vencidos cada 'intervalo_s'."""
+    def __init__(self, almacen, intervalo_s):
+        super().__init__(name="purga-resultados", daemon=True)
+        self.almacen = almacen
+        self.intervalo_s = intervalo_s
+        self._alto = threading.Event()
+
+    def run(self):
+        while not self._alto.wait(self.intervalo_s):
+            try:
+                self.almacen.purgar()
+            except Exception as e:
+                app.logger.warning(f"Error al purgar resultados vencidos: {e}")
+
+    def detener(self):
+        self._alto.set()
+
+_resultados = None
+_resultados_lock = threading.Lock()
+
+def get_resultados():
+    """Almacén del proceso actual (se recrea tras un fork: conexiones e hilos no se heredan)."""
+    global _resultados
+    with _resultados_lock:
+        if _resultados is None or _resultados.pid != os.getpid():
+            almacen = ALMACENES_RESULTADOS[app.config["RESULTADOS_BACKEND"]](app.config["RESULTADOS_TTL_H"] * 3600)
+            almacen.pid = os.getpid()
+            almacen.purga = PurgaResultados(almacen, app.config["RESULTADOS_PURGA_S"])
+            almacen.purga.start()
+            _resultados = almacen
+        return _resultados
+
+# ---------------- CACHÉ DE RESULTADOS ----------------
+class CacheDisco:
+    """
+    Caché LRU en disco compartida por los workers de gunicorn (un archivo por entrada).
+    El mtime marca el último uso; al escribir se desalojan las entradas menos recientes
+    hasta respetar max_entradas y max_bytes.
+    """
+    def __init__(self, folder, max_entradas, max_bytes):
+        self.folder = folder
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+
+    def _ruta(self, clave, ext):
+        return os.path.join(self.folder, f"{clave}.{ext}")
+
+    def _leer(self, clave, ext):
+        path = self._ruta(clave, ext)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def _escribir(self, clave, ext, data: bytes):
+        path = self._ruta(clave, ext)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._desalojar()
+
+    def _desalojar(self):
+        entradas = []
+        for e in os.scandir(self.folder):
+            if e.is_file() and not e.name.endswith(".tmp"):
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                entradas.append((st.st_mtime, st.st_size, e.path))
+        total = sum(size for _, size, _ in entradas)
+        entradas.sort()
+        while entradas and (len(entradas) > self.max_entradas or total > self.max_bytes):
+            _, size, path = entradas.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def get_json(self, clave):
+        data = self._leer(clave, "json")
+        return json.loads(data) if data is not None else None
+
+    def put_json(self, clave, obj):
+        self._escribir(clave, "json", json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+    def get_bytes(self, clave, ext):
+        return self._leer(clave, ext)
+
+    def put_bytes(self, clave, data: bytes, ext):
+        self._escribir(clave, ext, data)
+
+_cache = None
+
+def get_cache():
+    """CacheDisco del proceso, o None si está deshabilitada."""
+    global _cache
+    if not app.config["CACHE_HABILITADA"]:
+        return None
+    if _cache is None:
+        _cache = CacheDisco(CACHE_FOLDER, app.config["CACHE_MAX_ENTRADAS"],
+                            app.config["CACHE_MAX_MB"] * 1024 * 1024)
+    return _cache
+
+def clave_resultado(sha256_hex, filename, ext, opciones=None) -> str:
+    """FINAL depende del contenido, del nombre (validar_nombre_archivo), del modo, del perfil y de las reglas."""
+    opciones = opciones or {}
+    modo = f"{opciones.get('modo', MODO_COMPLETO)}:{opciones.get('muestra_filas') or ''}"
+    if opciones.get("perfil"):
+        modo += ":perfil"
+    base = f"{VERSION_REGLAS}|{get_reglas().huella}|{ext}|{filename}|{modo}|{sha256_hex}"
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+def consultar_cache(sha256_hex, filename, ext, opciones=None):
+    """Regresa (cache, clave, FINAL o None). cache y clave son None si está deshabilitada."""
+    cache = get_cache()
+    if cache is None:
+        return None, None, None
+    clave = clave_resultado(sha256_hex, filename, ext, opciones)
+    return cache, clave, cache.get_json(clave)
+
+# ---------------- VALIDACIÓN INCREMENTAL ----------------
+# Cada versión de un dataset se parte en bloques de filas (~INCREMENTAL_BLOQUE_MB, cortados
+# en fin de línea y fuera de comillas). En la caché queda, por dataset, el sha256 de cada
+# bloque con sus filas y las columnas con espacios que tuvo; al volver a subir el archivo
+# solo se leen los bloques cuyo hash no estaba. Sirve mientras no cambien encabezado y tipos.
+def clave_incremental(dataset) -> str:
+    return hashlib.sha256(f"incremental|{VERSION_REGLAS}|{dataset}".encode("utf-8")).hexdigest()
+
+def _fin_de_linea(mm, desde) -> int:
+    fin = mm.find(b"\n", desde)
+    return len(mm) if fin == -1 else fin + 1
+
+def _columnas_texto(schema) -> list:
+    """Índices de las columnas que revisa _columnas_con_espacios; sin ninguna, la primera para contar filas."""
+    return [i for i, dt in enumerate(schema.dtypes()) if not (dt.is_numeric() or dt == pl.Boolean)] or [0]
+
+def _validar_bloque(datos, schema, leer) -> tuple:
+    """(filas, índices de columnas con espacios) de un bloque de filas completas sin encabezado."""
+    df_bloque = pl.read_csv(datos, has_header=False, schema=schema, columns=leer, ignore_errors=True)
+    nombres, _ = _columnas_con_espacios(df_bloque)
+    columnas = schema.names()
+    return df_bloque.height, [columnas.index(c) for c in nombres]
+
+def _obs_espacios(columnas, indices, filas) -> list:
+    if filas == 0:
+        return ["No se encontraron observaciones sobre los datos."]
+    obs = [f"La columna {columnas[i]} tiene valores con espacios al inicio o final." for i in sorted(indices)]
+    return obs or ["No se encontraron observaciones sobre los datos."]
+
+def validar_datos_incremental(path, schema, dataset, medicion=None):
+    """
+    validar_datos en modo completo, bloque por bloque, reutilizando los veredictos guardados
+    de la versión anterior del dataset. Regresa None si no aplica (caché deshabilitada o un
+    bloque que no se pudo leer): el llamador valida de la forma normal.
+    """
+    cache = get_cache()
+    if cache is None or os.path.getsize(path) == 0:
+        return None
+    clave = clave_incremental(dataset)
+    columnas = schema.names()
+    tipos = [str(t) for t in schema.dtypes()]
+    objetivo = max(1, int(app.config["INCREMENTAL_BLOQUE_MB"] * 1024 * 1024))
+    leer = _columnas_texto(schema)  # solo las columnas de texto
+    previo = cache.get_json(clave) or {}
+    bloques, reutilizados = [], 0
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        n = len(mm)
+        inicio = _fin_de_linea(mm, 0)
+        if inicio >= n:
+            return None
+        encabezado = hashlib.sha256(mm[:inicio]).hexdigest()
+        anteriores = {}
+        if previo.get("encabezado") == encabezado and previo.get("tipos") == tipos:
+            anteriores = {h: (filas, hits) for h, filas, hits in previo["bloques"]}
+        hay_comillas = mm.find(b'"', inicio) != -1
+        while inicio < n:
+            fin = _fin_de_linea(mm, min(inicio + objetivo, n - 1))
+            h = None
+            if anteriores:
+                with memoryview(mm)[inicio:fin] as vista:
+                    h = hashlib.sha256(vista).hexdigest()
+            if h in anteriores:
+                # Mismo contenido que un bloque ya cortado fuera de comillas: se reutiliza sin leerlo
+                filas, hits = anteriores[h]
+                reutilizados += 1
+            else:
+                datos, extendido, comillas = _bloque_csv(mm, inicio, objetivo, hay_comillas)
+                if extendido != fin:  # el corte quedó dentro de un campo: otro contenido, otro hash
+                    fin, h = extendido, None
+                try:
+                    filas, hits = _validar_bloque(datos, schema, leer)
+                except Exception:
+                    return None
+                # Comillas sin cerrar (solo al final del archivo): ese bloque no se reutiliza
+                if comillas % 2:
+                    h = ""
+                elif h is None:
+                    h = hashlib.sha256(datos).hexdigest()
+            bloques.append([h, filas, hits])
+            inicio = fin
+    cache.put_json(clave, {"encabezado": encabezado, "tipos": tipos, "bloques": bloques})
+
+    filas = sum(b[1] for b in bloques)
+    if medicion is not None:
+        medicion["filas"] = filas
+        medicion["incremental"] = {"bloques": len(bloques), "reutilizados": reutilizados}
+    return _obs_espacios(columnas, set().union(*(b[2] for b in bloques)), filas)
+
+# ---------------- CARGAS POR PARTES ----------------
+# Archivos grandes en redes lentas: POST /api/v1/cargas (nombre, tamano y las opciones de
+# /api/v1/validar) -> PUT /api/v1/cargas/<id>?offset=N con los bytes de cada parte, en orden
+# -> POST /api/v1/cargas/<id>/finalizar. Tras un corte, GET /api/v1/cargas/<id> dice desde qué
+# offset reanudar; lo que alcanzó a llegar de una parte interrumpida se conserva.
+# Las partes se escriben en UPLOAD_FOLDER y cada PUT avanza las revisiones sobre lo recibido:
+# UTF-8, encabezado y tipos (con las primeras FILAS_INFERENCIA filas) y los espacios de cada
+# bloque de filas completas, como la validación incremental. Al finalizar solo queda la cola.
+# El estado vive en el almacén de resultados (tipo RESULTADO_CARGA) para que cada parte pueda
+# llegar a otro worker; un flock sobre el archivo ordena las partes de una misma carga.
+RESULTADO_CARGA = "carga"
+_RE_ID_CARGA = re.compile(r"^[A-Za-z0-9_-]{24}$")
+# sha256 en curso por carga: (offset, hash). Solo vale en el worker que recibió la parte
+# anterior; si otro la recibió, el hash se calcula al finalizar
+_hashes_carga = {}
+_hashes_carga_lock = threading.Lock()
+
+class OffsetCarga(ValueError):
+    """La parte no empieza en lo recibido hasta ahora: el cliente debe reanudar desde 'recibido'."""
+    def __init__(self, recibido):
+        super().__init__(f"La parte debe empezar en el byte {recibido}.")
+        self.recibido = recibido
+
+def ruta_carga(carga_id) -> str:
+    return os.path.join(UPLOAD_FOLDER, f"carga_{carga_id}")
+
+def iniciar_carga(nombre, tamano, opciones, pdf, ip_address) -> str:
+    carga_id = secrets.token_urlsafe(18)
+    open(ruta_carga(carga_id), "wb").close()
+    ext = nombre.rsplit(".", 1)[1].lower()
+    es_csv = ext == "csv"
+    get_resultados().guardar(carga_id, RESULTADO_CARGA, {
+        "nombre": nombre, "ext": ext, "tamano": tamano, "recibido": 0, "opciones": opciones, "pdf": pdf,
+        "ip": ip_address, "creado": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "segundos_partes": 0.0,
+        "utf8": {"hasta": 0, "lineas": 0, "invalido": None, "linea": None, "multibyte": False, "c1": []}
+        if es_csv else None,
+        "datos": {"hasta": None, "esquema": None, "columnas": None, "tipos": None, "filas": 0, "hits": []}
+        if es_csv else None,
+    })
+    return carga_id
+
+def leer_carga(carga_id):
+    return get_resultados().leer(carga_id, RESULTADO_CARGA) if _RE_ID_CARGA.match(carga_id) else None
+
+@contextmanager
+def _bloqueo_carga(carga_id):
+    """Archivo de la carga abierto y bloqueado; FileNotFoundError si ya no existe."""
+    with open(ruta_carga(carga_id), "r+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)  # se libera al cerrar
+        yield f
+
+def _tomar_hash(carga_id, offset):
+    with _hashes_carga_lock:
+        previo = _hashes_carga.pop(carga_id, None)
+    if offset == 0:
+        return hashlib.sha256()
+    return previo[1] if previo and previo[0] == offset else None
+
+def recibir_parte(carga_id, offset, stream) -> dict:
+    """
+    Escribe la parte en 'offset' y avanza las revisiones; regresa el estado actualizado.
+    None si la carga no existe; OffsetCarga u otro ValueError si la parte no corresponde.
+    """
+    try:
+        with _bloqueo_carga(carga_id) as f:
+            estado = leer_carga(carga_id)
+            if estado is None:
+                return None
+            if offset != estado["recibido"]:
+                raise OffsetCarga(estado["recibido"])
+            t0 = time.perf_counter()
+            h = _tomar_hash(carga_id, offset)
+            f.seek(offset)
+            escritos = 0
+            try:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if offset + escritos + len(chunk) > estado["tamano"]:
+                        f.truncate(offset)
+                        raise ValueError("La parte excede el tamaño declarado de la carga.")
+                    f.write(chunk)
+                    if h is not None:
+                        h.update(chunk)
+                    escritos += len(chunk)
+            except ClientDisconnected:
+                pass  # se conserva lo que llegó; el cliente reanuda desde el nuevo offset
+            f.truncate(offset + escritos)
+            f.flush()
+            estado["recibido"] = offset + escritos
+            if h is not None:
+                with _hashes_carga_lock:
+                    _hashes_carga[carga_id] = (estado["recibido"], h)
+            revisiones_carga(f, estado, final=estado["recibido"] == estado["tamano"])
+            estado["segundos_partes"] += time.perf_counter() - t0
+            get_resultados().guardar(carga_id, RESULTADO_CARGA, estado)
+            return estado
+    except FileNotFoundError:
+        return None
+
+def revisiones_carga(f, estado, final=False):
+    """Avanza UTF-8 y datos sobre lo recibido (solo CSV); final=True cuando ya llegó todo."""
+    if estado["ext"] != "csv" or estado["recibido"] == 0:
+        return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        _avanzar_utf8(mm, estado["utf8"], final)
+        if estado["datos"] is not None:
+            estado["datos"] = _avanzar_datos(mm, f.name, estado, final)
+
+def _avanzar_utf8(mm, u, final):
+    """Como _inspeccionar_buffer, retomando desde u["hasta"] con el estado de la parte anterior."""
+    n = len(mm)
+    with memoryview(mm) as mv:
+        offset = u["hasta"]
+        while u["invalido"] is None and offset < n:
+            fin = min(offset + CHUNK_SIZE, n)
+            with mv[offset:fin] as bloque:
+                try:
+                    # final=False: una secuencia cortada al final de lo recibido espera la siguiente parte
+                    texto, consumidos = codecs.utf_8_decode(bloque, "strict", final and fin >= n)
+                except UnicodeDecodeError as e:
+                    previo = bloque[:e.start].tobytes()
+                    u["invalido"], u["linea"] = offset + e.start, u["lineas"] + previo.count(b"\n") + 1
+                    u["multibyte"] = u["multibyte"] or not previo.isascii()
+                    offset = u["invalido"]
+                    break
+            if not consumidos:
+                break
+            u["multibyte"] = u["multibyte"] or not texto.isascii()
+            u["lineas"] += texto.count("\n")
+            offset += consumidos
+        if u["invalido"] is not None and not u["multibyte"]:
+            # Bytes C1 desde el primer inválido: distinguen CP1252 de Latin-1 (mensaje_codificacion)
+            c1 = set(u["c1"])
+            for a in range(offset, n, CHUNK_SIZE):
+                c1.update(mv[a:a + CHUNK_SIZE].tobytes().translate(None, _SIN_C1))
+            u["c1"], offset = sorted(c1), n
+        u["hasta"] = offset
+
+def codificacion_carga(u) -> dict:
+    """El resultado de inspeccionar_codificacion a partir del estado de _avanzar_utf8."""
+    if u["invalido"] is None:
+        return {"utf8": True, "offset": None, "linea": None, "encoding": "utf-8"}
+    encoding = None
+    if not u["multibyte"]:
+        c1 = set(u["c1"])
+        encoding = "cp1252" if c1 and not (c1 & _C1_NO_CP1252) else "latin-1"
+    return {"utf8": False, "offset": u["invalido"], "linea": u["linea"], "encoding": encoding}
+
+@lru_cache(maxsize=64)
+def _esquema_prefijo(path, fin):
+    """Tipos que infiere validar_formato_y_carga, leídos del inicio del archivo (no cambia al llegar más)."""
+    with open(path, "rb") as f:
+        return pl.read_csv(f.read(fin), infer_schema_length=FILAS_INFERENCIA, ignore_errors=True).schema
+
+def _avanzar_datos(mm, path, estado, final):
+    """
+    Valida los bloques de filas completas (UTF-8 ya revisado, cortes fuera de comillas) que
+    llegaron desde la parte anterior. None cuando ya no aplica: codificación distinta de UTF-8,
+    sin filas o un bloque que no se pudo leer; al finalizar se valida de la forma normal.
+    """
+    d, u = estado["datos"], estado["utf8"]
+    if u["invalido"] is not None:
+        return None
+    n = len(mm)
+    limite = n if final and u["hasta"] == n else mm.rfind(b"\n", 0, u["hasta"]) + 1
+    if d["hasta"] is None:
+        inicio = mm.find(b"\n", 0, limite)
+        if inicio == -1:
+            return None if final else d
+        d["hasta"] = inicio + 1
+    if d["esquema"] is None:
+        fin, lineas = d["hasta"], 0
+        while lineas < FILAS_INFERENCIA and fin < limite:
+            fin, lineas = _fin_de_linea(mm, fin), lineas + 1
+        if lineas < FILAS_INFERENCIA and not final:
+            return d
+        d["esquema"] = fin
+    try:
+        schema = _esquema_prefijo(path, d["esquema"])
+    except Exception:
+        return None
+    d["columnas"], d["tipos"] = schema.names(), [str(t) for t in schema.dtypes()]
+    leer = _columnas_texto(schema)
+    objetivo = max(1, int(app.config["INCREMENTAL_BLOQUE_MB"] * 1024 * 1024))
+    inicio, hits = d["hasta"], set(d["hits"])
+    while inicio < limite and (final or limite - inicio >= objetivo):
+        fin = _fin_de_linea(mm, min(inicio + objetivo, limite - 1))
+        datos = mm[inicio:fin]
+        comillas = datos.count(b'"')
+        while comillas % 2 and fin < limite:  # el corte quedó dentro de un campo: se extiende
+            extra = mm[fin:_fin_de_linea(mm, fin)]
+            comillas += extra.count(b'"')
+            datos += extra
+            fin += len(extra)
+        if comillas % 2 and not final:
+            break
+        try:
+            filas, columnas = _validar_bloque(datos, schema, leer)
+        except Exception:
+            return None
+        d["filas"] += filas
+        hits.update(columnas)
+        inicio = fin
+    d["hasta"], d["hits"] = inicio, sorted(hits)
+    return d
+
+def datos_de_partes(d, schema, medicion=None):
+    """FINAL["datos"] con los bloques validados al llegar; None si el esquema del archivo completo es otro."""
+    if d["columnas"] != schema.names() or d["tipos"] != [str(t) for t in schema.dtypes()]:
+        return None
+    if medicion is not None:
+        medicion["filas"] = d["filas"]
+    return _obs_espacios(d["columnas"], d["hits"], d["filas"])
+
+def cerrar_carga(carga_id, f, estado) -> tuple:
+    """(sha256 hex, parcial de ejecutar_validacion) de una carga completa y bloqueada."""
+    h = _tomar_hash(carga_id, estado["tamano"])
+    if h is None:
+        h = hashlib.sha256()
+        f.seek(0)
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    parcial = {}
+    if estado["utf8"] is not None:
+        parcial["codificacion"] = codificacion_carga(estado["utf8"])
+        d = estado["datos"]
+        if d is not None and d["hasta"] == estado["tamano"]:
+            parcial["datos"] = d
+    return h.hexdigest(), parcial
+
+def cancelar_carga(carga_id):
+    with _hashes_carga_lock:
+        _hashes_carga.pop(carga_id, None)
+    get_resultados().eliminar(carga_id)
+    try:
+        os.remove(ruta_carga(carga_id))
+    except OSError:
+        pass
+
+# ---------------- ANALÍTICA DE REPORTES ----------------
+# Cada reporte semanal se compacta a un Parquet tipado en ANALITICA_FOLDER; el manifiesto
+# guarda tamaño y mtime del CSV de origen, así solo se reconvierten los reportes que cambiaron
+# (en la práctica, el de la semana en curso). Las consultas leen los Parquet con scan_parquet.
+TIPOS_REPORTE = {  # columnas numéricas de REPORT_HEADER; el resto queda como texto
+    "Peso_KB": "Float64", "Tiempo_Procesamiento_s": "Float64", "Cantidad_Observaciones": "Int64",
+    "Filas": "Int64", "Columnas": "Int64", "Bytes_por_s": "Float64", "T_Carga_s": "Float64",
+    "T_Archivo_s": "Float64", "T_Columnas_s": "Float64", "T_Datos_s": "Float64", "T_JSON_s": "Float64",
+}
+RANGOS_TAMANO_KB = ((100, "<100KB"), (1024, "100KB-1MB"), (10 * 1024, "1-10MB"), (100 * 1024, "10-100MB"),
+                    (None, ">=100MB"))
+PERCENTILES_ANALITICA = (0.5, 0.9, 0.95, 0.99)
+
+def _reporte_lazy(path):
+    """
+    Un reporte como LazyFrame con todas las columnas de REPORT_HEADER tipadas. Los reportes
+    anteriores traen menos columnas (o filas más cortas que el encabezado migrado): van en null.
+    """
+    lf = pl.scan_csv(path, infer_schema=False, truncate_ragged_lines=True)
+    presentes = set(lf.collect_schema().names())
+    columnas = []
+    for c in REPORT_HEADER:
+        col = pl.col(c) if c in presentes else pl.lit(None, pl.Utf8)
+        if c == "Fecha":
+            col = col.str.to_date("%Y-%m-%d", strict=False)
+        elif c in TIPOS_REPORTE:
+            col = col.cast(getattr(pl, TIPOS_REPORTE[c]), strict=False)
+        columnas.append(col.alias(c))
+    return lf.select(columnas)
+
+def actualizar_rollup() -> list:
+    """Convierte a Parquet los reportes nuevos o modificados; regresa los Parquet vigentes."""
+    if _escritor is not None and _escritor.pid == os.getpid():
+        _escritor.flush()  # lo encolado por este worker entra en la consulta
+    path_manifiesto = os.path.join(ANALITICA_FOLDER, "manifiesto.json")
+    try:
+        with open(path_manifiesto, "r", encoding="utf-8") as f:
+            manifiesto = json.load(f)
+    except (OSError, ValueError):
+        manifiesto = {}
+    vigente, rutas = {}, []
+    for nombre in sorted(os.listdir(REPORTS_FOLDER)):
+        if not (nombre.startswith("reporte_") and nombre.endswith(".csv")):
+            continue
+        origen = os.path.join(REPORTS_FOLDER, nombre)
+        destino = os.path.join(ANALITICA_FOLDER, nombre[:-4] + ".parquet")
+        st = os.stat(origen)
+        firma = [st.st_size, st.st_mtime_ns]  # antes de leer: si crece mientras tanto se reconvierte luego
+        if manifiesto.get(nombre) != firma or not os.path.exists(destino):
+            tmp = f"{destino}.{os.getpid()}.tmp"
+            _reporte_lazy(origen).sink_parquet(tmp)
+            os.replace(tmp, destino)
+        vigente[nombre] = firma
+        rutas.append(destino)
+    for nombre in set(manifiesto) - set(vigente):  # reportes borrados o movidos
+        try:
+            os.remove(os.path.join(ANALITICA_FOLDER, nombre[:-4] + ".parquet"))
+        except OSError:
+            pass
+    if vigente != manifiesto:
+        _escribir_json(path_manifiesto, vigente)
+    return rutas
+
+def _rango_tamano():
+    """Índice de RANGOS_TAMANO_KB según Peso_KB."""
+    expr = pl.lit(len(RANGOS_TAMANO_KB) - 1)
+    for i, (limite, _) in reversed(list(enumerate(RANGOS_TAMANO_KB[:-1]))):
+        expr = pl.when(pl.col("Peso_KB") < limite).then(pl.lit(i)).otherwise(expr)
+    return expr
+
+def _latencia(col="Tiempo_Procesamiento_s"):
+    return [pl.col(col).quantile(q, "linear").round(6).alias(f"p{round(q * 100)}") for q in PERCENTILES_ANALITICA]
+
+def analitica_reportes(desde, hasta, top=10) -> dict:
+    """Agregados de los reportes entre 'desde' y 'hasta' (date, inclusive) sobre el rollup."""
+    rutas = actualizar_rollup()
+    if rutas:
+        base = pl.scan_parquet(rutas)
+    else:
+        base = pl.LazyFrame(schema={c: pl.Date if c == "Fecha" else getattr(pl, TIPOS_REPORTE.get(c, "Utf8"))
+                                    for c in REPORT_HEADER})
+    return {"desde": desde.isoformat(), "hasta": hasta.isoformat(), "reportes": len(rutas),
+            **agregados_reportes(base.filter(pl.col("Fecha").is_between(desde, hasta)), top)}
+
+def agregados_reportes(lf, top=10) -> dict:
+    """
+    Resumen con tasa de error y rendimiento, percentiles de tiempo (sin los ERROR), rangos de
+    tamaño, IPs con más validaciones y serie diaria; lf con las columnas de _reporte_lazy.
+    """
+    data = {}
+    ok = lf.filter(pl.col("Estado") != "ERROR")
+    es_error = (pl.col("Estado") == "ERROR")
+    mb = pl.col("Peso_KB") / 1024
+
+    resumen, latencia, tamanos, ips, dias = pl.collect_all([
+        lf.select(
+            pl.len().alias("validaciones"),
+            es_error.sum().alias("errores"),
+            (pl.col("Estado") == "VÁLIDO").sum().alias("validos"),
+            (pl.col("Estado") == "NO VÁLIDO").sum().alias("no_validos"),
+            (pl.col("Cache") == "HIT").sum().alias("aciertos_cache"),
+            mb.sum().round(3).alias("mb_total"),
+            mb.filter(~es_error).sum().alias("mb_ok"),
+            pl.col("Tiempo_Procesamiento_s").filter(~es_error).sum().alias("t_ok"),
+            pl.col("Fecha").n_unique().alias("dias"),
+        ),
+        ok.select(_latencia()),
+        ok.group_by(_rango_tamano().alias("rango")).agg(
+            pl.len().alias("validaciones"),
+            *_latencia(),
+            (mb.sum() / pl.col("Tiempo_Procesamiento_s").sum()).round(3).alias("mb_por_s"),
+        ).sort("rango"),
+        lf.group_by("IP").agg(
+            pl.len().alias("validaciones"),
+            pl.col("Archivo").n_unique().alias("archivos"),
+            es_error.sum().alias("errores"),
+        ).sort(["validaciones", "IP"], descending=[True, False]).head(top),
+        lf.group_by("Fecha").agg(
+            pl.len().alias("validaciones"),
+            es_error.sum().alias("errores"),
+            pl.col("Tiempo_Procesamiento_s").filter(~es_error).quantile(0.95, "linear").round(6).alias("p95"),
+        ).sort("Fecha"),
+    ])
+    r = resumen.row(0, named=True)
+    data["resumen"] = {
+        **{k: r[k] for k in ("validaciones", "errores", "validos", "no_validos", "aciertos_cache")},
+        "tasa_error": round(r["errores"] / r["validaciones"], 4) if r["validaciones"] else 0.0,
+        "mb_total": r["mb_total"] or 0.0,
+        "mb_por_s": round(r["mb_ok"] / r["t_ok"], 3) if r["t_ok"] else None,
+        "validaciones_por_dia": round(r["validaciones"] / r["dias"], 2) if r["dias"] else 0.0,
+    }
+    data["latencia_s"] = latencia.row(0, named=True)
+    data["por_tamano"] = [{**fila, "rango": RANGOS_TAMANO_KB[fila["rango"]][1]} for fila in tamanos.to_dicts()]
+    data["top_ips"] = ips.to_dicts()
+    data["por_dia"] = [{**fila, "Fecha": fila["Fecha"].isoformat()} for fila in dias.to_dicts()]
+    return data
+
+# ---------------- TRABAJOS ASÍNCRONOS ----------------
+# El estado vive en el almacén de resultados (tipo RESULTADO_JOB) para que cualquier worker de
+# gunicorn pueda responder /estado/<token>; la cola y los procesos hijos son locales al worker.
+JOB_EN_COLA, JOB_PROCESANDO, JOB_LISTO, JOB_ERROR = "en_cola", "procesando", "listo", "error"
+
+def leer_job(token):
+    """
+    Estado guardado del trabajo. Solo el hilo del worker que lo aceptó aplica el timeout: si ese
+    worker murió (reinicio, OOM), el trabajo quedaría en cola o procesando para siempre. Pasado
+    su 'vence' más JOBS_MARGEN_S se marca error aquí y se borra el upload que dejó.
+    """
+    job = get_resultados().leer(token, RESULTADO_JOB)
+    if (job and job.get("estado") in (JOB_EN_COLA, JOB_PROCESANDO)
+            and time.time() > job.get("vence", float("inf")) + app.config["JOBS_MARGEN_S"]):
+        job = _actualizar_job(token, estado=JOB_ERROR,
+                              error="La validación no terminó en el tiempo máximo. Intente de nuevo.")
+        if job.get("archivo"):
+            for ruta in (job["archivo"], ruta_utf8(job["archivo"])):
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+    return job
+
+def _actualizar_job(token, **campos):
+    return get_resultados().actualizar(token, RESULTADO_JOB, campos)
+
+def _proceso_validacion(conn, upload_path, filename, ext, opciones):
+    """Punto de entrada del proceso hijo: regresa ("ok", (FINAL, medicion)) o ("error", mensaje)."""
+    try:
+        medicion = {}
+        FINAL = ejecutar_validacion(upload_path, filename, ext, **opciones, medicion=medicion)
+        conn.send(("ok", (FINAL, medicion)))
+    except Exception as e:
+        conn.send(("error", str(e)))
+    finally:
+        conn.close()
+
+class ColaValidacion:
+    """
+    Pool acotado de procesos para validar fuera del hilo de la petición.
+    Cada trabajo corre en su propio proceso (forkserver) para poder terminarlo al vencer
+    el timeout; un semáforo limita los simultáneos y 'max_pendientes' la profundidad total.
+    """
+    def __init__(self, max_workers, max_pendientes, timeout_s):
+        self.timeout_s = timeout_s
+        self.max_workers = max_workers
+        self.max_pendientes = max_pendientes
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._lock = threading.Lock()
+        self._pendientes = 0
+        metodos = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context("forkserver" if "forkserver" in metodos else "spawn")
+
+    @property
+    def pendientes(self):
+        return self._pendientes
+
+    def enviar(self, token, upload_path, filename, ext, ip_address, file_size_kb, opciones,
+               clave_cache=None) -> bool:
+        """Encola el trabajo; False si la cola está llena (el llamador responde 429)."""
+        with self._lock:
+            if self._pendientes >= self.max_pendientes:
+                return False
+            self._pendientes += 1
+            turnos = -(-self._pendientes // self.max_workers)  # peor caso: los de adelante agotan su timeout
+        # 'vence' y 'archivo' permiten a leer_job cerrar el trabajo si este worker muere
+        _actualizar_job(token, estado=JOB_EN_COLA, nombre_archivo=filename, archivo=upload_path,
+                        creado=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        vence=time.time() + turnos * self.timeout_s)
+        threading.Thread(
+            target=self._correr, name=f"validacion-{token}", daemon=True,
+            args=(token, upload_path, filename, ext, ip_address, file_size_kb, opciones, clave_cache),
+        ).start()
+        return True
+
+    def _correr(self, token, upload_path, filename, ext, ip_address, file_size_kb, opciones, clave_cache):
+        start_time = datetime.now()
+        FINAL, medicion = None, None
+        try:
+            with self._slots:
+                _actualizar_job(token, estado=JOB_PROCESANDO, vence=time.time() + self.timeout_s)
+                start_time = datetime.now()
+                recv_conn, send_conn = self._ctx.Pipe(duplex=False)
+                proc = self._ctx.Process(target=_proceso_validacion,
+                                         args=(send_conn, upload_path, filename, ext, opciones))
+                proc.start()
+                send_conn.close()
+                try:
+                    if recv_conn.poll(self.timeout_s):
+                        resultado, payload = recv_conn.recv()
+                    else:
+                        resultado, payload = "error", f"La validación excedió el tiempo máximo de {self.timeout_s}s."
+                except EOFError:
+                    resultado, payload = "error", "El proceso de validación terminó inesperadamente."
+                finally:
+                    recv_conn.close()
+                    if proc.is_alive():
+                        proc.terminate()
+                    proc.join()
+
+            if resultado == "ok":
+                FINAL, medicion = payload
+                guardar_resultado(token, FINAL, medicion)
+                cache = get_cache()
+                if cache is not None and clave_cache:
+                    cache.put_json(clave_cache, FINAL)
+                _actualizar_job(token, estado=JOB_LISTO, pasa=pasa_validacion(FINAL))
+            else:
+                _actualizar_job(token, estado=JOB_ERROR, error=payload)
+        except Exception as e:
+            app.logger.exception(f"Error en trabajo de validación [{token}]")
+            _actualizar_job(token, estado=JOB_ERROR, error=str(e))
+        finally:
+            with self._lock:
+                self._pendientes -= 1
+            try:
+                os.remove(upload_path)
+            except OSError:
+                pass
+            processing_time = (datetime.now() - start_time).total_seconds()
+            registrar_validacion(ip_address, filename, file_size_kb, processing_time, FINAL,
+                                 "MISS" if clave_cache else "-", medicion)
+
+_cola = None
+_cola_lock = threading.Lock()
+
+def get_cola() -> ColaValidacion:
+    """Cola por proceso, creada en el primer uso (después del fork de gunicorn)."""
+    global _cola
+    with _cola_lock:
+        if _cola is None:
+            _cola = ColaValidacion(app.config["JOBS_MAX_WORKERS"], app.config["JOBS_MAX_PENDIENTES"],
+                                   app.config["JOBS_TIMEOUT_S"])
+        return _cola
+
+# ---------------- VALIDACIÓN POR LOTES ----------------
+def _validar_con_tiempo(upload_path, filename, ext, opciones):
+    """Se ejecuta en el pool de procesos; regresa (FINAL, segundos de ese archivo, medicion)."""
+    t0 = time.perf_counter()
+    medicion = {}
+    FINAL = ejecutar_validacion(upload_path, filename, ext, **opciones, medicion=medicion)
+    return FINAL, round(time.perf_counter() - t0, 6), medicion
+
+_pool_lote = None
+
+def get_pool_lote() -> ProcessPoolExecutor:
+    global _pool_lote
+    with _cola_lock:
+        if _pool_lote is None:
+            from concurrent.futures import ProcessPoolExecutor
+            metodos = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context("forkserver" if "forkserver" in metodos else "spawn")
+            _pool_lote = ProcessPoolExecutor(max_workers=app.config["LOTE_MAX_WORKERS"], mp_context=ctx)
+        return _pool_lote
+
+def reiniciar_pool_lote(roto):
+    """Descarta un pool con un worker muerto (BrokenProcessPool); get_pool_lote crea otro."""
+    global _pool_lote
+    with _cola_lock:
+        if _pool_lote is roto:
+            _pool_lote = None
+    roto.shutdown(wait=False, cancel_futures=True)
+
+def enviar_lote(*args):
+    """
+    _validar_con_tiempo(*args) en el pool de lotes; regresa (pool, futuro). Si el pool quedó
+    roto por una petición anterior se rehace una vez en lugar de fallar todo el lote.
+    """
+    from concurrent.futures.process import BrokenProcessPool
+    pool = get_pool_lote()
+    try:
+        return pool, pool.submit(_validar_con_tiempo, *args)
+    except BrokenProcessPool:
+        reiniciar_pool_lote(pool)
+        pool = get_pool_lote()
+        return pool, pool.submit(_validar_con_tiempo, *args)
+
+def esperar_lote(pool, futuro, timeout_s):
+    """
+    futuro.result() con tiempo máximo. Una tarea en curso de ProcessPoolExecutor no se puede
+    cancelar: al vencer se terminan los procesos del pool y se descarta; los demás archivos
+    pendientes reciben BrokenProcessPool y validar_lote los reintenta en un pool nuevo.
+    """
+    from concurrent.futures import TimeoutError as TiempoAgotado
+    try:
+        return futuro.result(timeout=timeout_s)
+    except TiempoAgotado:
+        for proceso in list((pool._processes or {}).values()):
+            proceso.terminate()
+        reiniciar_pool_lote(pool)
+        raise RuntimeError(f"La validación excedió el tiempo máximo de {timeout_s}s.")
+
+class LoteExcedido(ValueError):
+    """El lote (partes más archivos dentro de los ZIP) pasa de LOTE_MAX_ARCHIVOS."""
+    def __init__(self, maximo):
+        super().__init__(f"El lote excede {maximo} archivos.")
+
+def extraer_zip(zip_path, limite_bytes, max_archivos):
+    """
+    Copia a UPLOAD_FOLDER los CSV/XLSX del ZIP (ignora carpetas y __MACOSX). Regresa
+    ([(nombre, ruta, bytes, sha256)], [miembros con otra extensión]). Cuenta y tamaño salen
+    de infolist() antes de extraer nada: LoteExcedido si son más de max_archivos, ValueError
+    si el contenido pasa de limite_bytes.
+    """
+    permitidos, rechazados = [], []
+    with zipfile.ZipFile(zip_path) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                continue
+            nombre = secure_filename(os.path.basename(info.filename))
+            if allowed_file(nombre):
+                permitidos.append((nombre, info))
+            else:
+                rechazados.append(info.filename)
+        if len(permitidos) > max_archivos:
+            raise LoteExcedido(app.config["LOTE_MAX_ARCHIVOS"])
+        if sum(info.file_size for _, info in permitidos) > limite_bytes:
+            raise ValueError("El contenido descomprimido del ZIP excede el límite permitido.")
+        archivos = []
+        try:
+            for nombre, info in permitidos:
+                with zf.open(info) as src:
+                    archivos.append((nombre, *guardar_upload(src)))
+        except Exception:
+            for _, path, _, _ in archivos:
+                os.remove(path)
+            raise
+    return archivos, rechazados
+
 # ---------------- FLASK ROUTES ----------------
 @app.route("/", methods=["GET"])
 def index():
@@ -436,65 +2719,469 @@ def validar():
     if not allowed_file(file.filename):
         return render_template("index.html", error="Formato no permitido. Use CSV/XLSX.")
 
+    try:
+        opciones = opciones_validacion(request.form, file.filename)
+    except ValueError as e:
+        return render_template("index.html", error=str(e))
+
     filename = secure_filename(file.filename)
     ext = filename.rsplit(".", 1)[1].lower()
 
-    # IP y tamaño
+    # IP y tamaño (el upload se copia a disco por bloques, nunca completo en memoria)
     ip_address = request.remote_addr or "-"
-    file_content = file.read()
-    file_size_kb = round(len(file_content) / 1024, 2)
-    contenido = io.BytesIO(file_content)
-    contenido.seek(0)
-
+    upload_path, file_size, sha256_hex = guardar_upload(file)
+    file_size_kb = round(file_size / 1024, 2)
+
+    # Mismo contenido + nombre + modo + reglas: se reutiliza FINAL sin volver a leer el archivo
+    cache, clave_cache, FINAL = consultar_cache(sha256_hex, filename, ext, opciones)
+    if FINAL is not None:
+        os.remove(upload_path)
+        token = nuevo_token()
+        guardar_resultado(token, FINAL)
+        processing_time = (datetime.now() - start_time).total_seconds()
+        registrar_validacion(ip_address, filename, file_size_kb, processing_time, FINAL, "HIT")
+        return render_template("resultados.html", token=token, FINAL=FINAL, nombre_archivo=filename,
+                               pasa=pasa_validacion(FINAL))
+    cache_status = "MISS" if cache is not None else "-"
+
+    # Modo trabajo: regresa el token de inmediato y valida en la cola de procesos
+    if request.form.get("asincrono") == "1":
+        token = nuevo_token()
+        if not get_cola().enviar(token, upload_path, filename, ext, ip_address, file_size_kb, opciones,
+                                 clave_cache):
+            os.remove(upload_path)
+            resp = current_app.make_response((
+                render_template("index.html", error="El servicio está ocupado. Intente de nuevo en unos minutos."), 429))
+            resp.headers["Retry-After"] = "30"
+            return resp
+        return render_template("procesando.html", token=token, nombre_archivo=filename), 202
+
+    medicion = {}
     try:
-        formato_obs, df   = validar_formato_y_carga(contenido, filename, ext)
-        archivo_obs       = validar_nombre_archivo(os.path.splitext(filename)[0])
-        columnas_obs      = validar_nombres_columnas(df)
-        datos_obs         = validar_datos(df)
-
-        FINAL = {"formato": formato_obs, "archivo": archivo_obs, "columnas": columnas_obs, "datos": datos_obs}
-        token = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        FINAL = ejecutar_validacion(upload_path, filename, ext, **opciones, medicion=medicion)
+        token = nuevo_token()
 
         # Guardar JSON temporal
-        with open(os.path.join(RESULTS_FOLDER, f"final_{token}.json"), "w", encoding="utf-8") as f:
-            json.dump(FINAL, f, ensure_ascii=False)
-
-        # ¿Pasa validación?
-        def pasa_validacion():
-            for key in ("formato", "archivo", "columnas", "datos"):
-                lst = FINAL.get(key, [])
-                if len(lst) > 1 or (len(lst) == 1 and not str(lst[0]).startswith("No se encontraron")):
-                    return False
-            return True
+        guardar_resultado(token, FINAL, medicion)
+        if cache is not None:
+            cache.put_json(clave_cache, FINAL)
 
-        pasa = pasa_validacion()
+        pasa = pasa_validacion(FINAL)
         processing_time = (datetime.now() - start_time).total_seconds()
-        status = "VÁLIDO" if pasa else "NO VÁLIDO"
-        observations_count = count_total_observations(FINAL)
 
         # Logs + reporte
-        write_to_log(ip_address, filename, file_size_kb, processing_time, status)
-        update_weekly_report(ip_address, filename, file_size_kb, processing_time, status, observations_count)
+        registrar_validacion(ip_address, filename, file_size_kb, processing_time, FINAL, cache_status, medicion)
 
         return render_template("resultados.html", token=token, FINAL=FINAL, nombre_archivo=filename, pasa=pasa)
 
     except Exception as e:
         processing_time = (datetime.now() - start_time).total_seconds()
-        write_to_log(request.remote_addr or "-", filename, file_size_kb, processing_time, "ERROR")
-        update_weekly_report(request.remote_addr or "-", filename, file_size_kb, processing_time, "ERROR", 0)
+        registrar_validacion(ip_address, filename, file_size_kb, processing_time, None, cache_status, medicion)
         current_app.logger.exception("Error en /validar")
         return render_template("index.html", error=f"Error al procesar el archivo: {str(e)}")
+    finally:
+        try:
+            os.remove(upload_path)
+        except OSError:
+            pass
+
+@app.route("/validar/lote", methods=["POST"])
+def validar_lote():
+    """
+    Varios archivos en partes 'archivo' y/o dentro de ZIPs, validados en paralelo.
+    formato=json (por defecto) regresa el resumen; formato=pdf un PDF con todos los
+    acuses; formato=zip un ZIP con un PDF por archivo.
+    """
+    start_time = datetime.now()
+    formato = (request.values.get("formato") or "json").lower()
+    if formato not in ("json", "pdf", "zip"):
+        return jsonify({"error": "formato debe ser json, pdf o zip."}), 400
+    partes = [f for f in request.files.getlist("archivo") if f.filename]
+    if not partes:
+        return jsonify({"error": "No se adjuntó archivo."}), 400
+
+    try:
+        opciones = opciones_validacion(request.values)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    from concurrent.futures.process import BrokenProcessPool
+    ip_address = request.remote_addr or "-"
+    limite_bytes = app.config["LOTE_MAX_MB_DESCOMPRIMIDOS"] * 1024 * 1024
+    max_archivos = app.config["LOTE_MAX_ARCHIVOS"]
+    timeout_s = app.config["JOBS_TIMEOUT_S"]
+    archivos, rechazados = [], []
+    try:
+        for parte in partes:
+            nombre = secure_filename(parte.filename)
+            if nombre.lower().endswith(".zip"):
+                zip_path, _, _ = guardar_upload(parte)
+                try:
+                    extraidos, otros = extraer_zip(zip_path, limite_bytes, max_archivos - len(archivos))
+                    archivos.extend(extraidos)
+                    rechazados.extend({"archivo": f"{nombre}/{miembro}", "estado": "ERROR",
+                                       "error": "Formato no permitido. Use CSV/XLSX."} for miembro in otros)
+                except LoteExcedido as e:
+                    return jsonify({"error": str(e)}), 413
+                except (zipfile.BadZipFile, ValueError) as e:
+                    rechazados.append({"archivo": nombre, "estado": "ERROR", "error": str(e)})
+                finally:
+                    os.remove(zip_path)
+            elif allowed_file(nombre):
+                if len(archivos) >= max_archivos:
+                    return jsonify({"error": str(LoteExcedido(max_archivos))}), 413
+                archivos.append((nombre, *guardar_upload(parte)))
+            else:
+                rechazados.append({"archivo": nombre, "estado": "ERROR",
+                                   "error": "Formato no permitido. Use CSV/XLSX."})
+
+        # Caché primero; solo los faltantes van al pool de procesos
+        pendientes = {}
+        resultados_lote = [None] * len(archivos)
+        for i, (nombre, path, size, sha) in enumerate(archivos):
+            ext = nombre.rsplit(".", 1)[1].lower()
+            try:
+                revisar_modo(opciones["modo"], nombre)
+            except ValueError as e:
+                resultados_lote[i] = (None, 0.0, "-", str(e), None)
+                continue
+            cache, clave, FINAL = consultar_cache(sha, nombre, ext, opciones)
+            if FINAL is not None:
+                resultados_lote[i] = (FINAL, 0.0, "HIT", None, None)
+                continue
+            args = (path, nombre, ext, opciones)
+            try:
+                pendientes[i] = (*enviar_lote(*args), args, clave)
+            except Exception as e:
+                resultados_lote[i] = (None, 0.0, "-", str(e), None)
+        for i, (pool, futuro, args, clave) in pendientes.items():
+            cache_status = "MISS" if clave is not None else "-"
+            try:
+                try:
+                    FINAL, segundos, medicion = esperar_lote(pool, futuro, timeout_s)
+                except BrokenProcessPool:
+                    # Un worker murió (memoria, señal, timeout de otro archivo) y el pool tumbó todo
+                    # lo pendiente: se rehace y este archivo se reintenta solo, así la falla queda
+                    # en el archivo que la causó
+                    reiniciar_pool_lote(pool)
+                    pool, futuro = enviar_lote(*args)
+                    try:
+                        FINAL, segundos, medicion = esperar_lote(pool, futuro, timeout_s)
+                    except BrokenProcessPool:
+                        reiniciar_pool_lote(pool)
+                        raise RuntimeError("El proceso que validaba el archivo terminó inesperadamente.")
+                if clave is not None:
+                    get_cache().put_json(clave, FINAL)
+                resultados_lote[i] = (FINAL, segundos, cache_status, None, medicion)
+            except Exception as e:
+                resultados_lote[i] = (None, 0.0, cache_status, str(e), None)
+
+        detalle, informes = [], []
+        for (nombre, _, size, _), (FINAL, segundos, cache_status, error, medicion) in zip(archivos, resultados_lote):
+            registrar_validacion(ip_address, nombre, round(size / 1024, 2), segundos, FINAL, cache_status, medicion)
+            if FINAL is None:
+                detalle.append({"archivo": nombre, "estado": "ERROR", "error": error, "tiempo_s": segundos})
+                continue
+            token = nuevo_token()
+            guardar_resultado(token, FINAL)
+            pasa = pasa_validacion(FINAL)
+            informes.append((FINAL, nombre, token))
+            detalle.append({
+                "archivo": nombre, "estado": "VÁLIDO" if pasa else "NO VÁLIDO", "pasa": pasa,
+                "observaciones": count_total_observations(FINAL), "tiempo_s": segundos,
+                "cache": cache_status, "token": token,
+                "pdf": url_for("descargar_pdf", token=token, nombre=nombre), "resultado": FINAL,
+            })
+        detalle.extend(rechazados)
+    finally:
+        for _, path, _, _ in archivos:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    lote_token = nuevo_token()
+    if formato == "pdf":
+        pdf_bytes = construir_pdf_lote([(FINAL, nombre) for FINAL, nombre, _ in informes])
+        return send_file_compat(io.BytesIO(pdf_bytes), f"informe_lote_{lote_token}.pdf", mimetype="application/pdf")
+    if formato == "zip":
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+            for FINAL, nombre, token in informes:
+                zf.writestr(f"informe_{os.path.splitext(nombre)[0]}_{token}.pdf",
+                            construir_pdf(FINAL, nombre))
+        buf.seek(0)
+        return send_file_compat(buf, f"informes_lote_{lote_token}.zip", mimetype="application/zip")
+
+    estados = [d["estado"] for d in detalle]
+    return jsonify({
+        "token": lote_token,
+        "resumen": {
+            "total": len(detalle), "validos": estados.count("VÁLIDO"),
+            "no_validos": estados.count("NO VÁLIDO"), "errores": estados.count("ERROR"),
+            "tiempo_s": (datetime.now() - start_time).total_seconds(),
+        },
+        "archivos": detalle,
+    })
+
+@app.route("/api/v1/validar", methods=["POST"])
+def api_validar():
+    """
+    Validación para integraciones automatizadas: el mismo FINAL que /validar en JSON,
+    sin plantillas ni JSON temporal. pdf=1 incluye el acuse en base64 (pdf_base64).
+    """
+    t_inicio = time.perf_counter()
+    file = request.files.get("archivo")
+    if file is None or file.filename == "":
+        return jsonify({"error": "No se adjuntó archivo."}), 400
+    if not allowed_file(file.filename):
+        return jsonify({"error": "Formato no permitido. Use CSV/XLSX."}), 400
+    try:
+        opciones = opciones_validacion(request.values, file.filename)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    filename = secure_filename(file.filename)
+    upload_path, file_size, sha256_hex = guardar_upload(file)
+    tiempos = {"carga_s": round(time.perf_counter() - t_inicio, 6)}
+    pdf = request.values.get("pdf", "").lower() in ("1", "true", "si", "sí")
+    return responder_api(upload_path, filename, file_size, sha256_hex, opciones, pdf, request.remote_addr or "-",
+                         t_inicio, tiempos)
+
+def responder_api(upload_path, filename, file_size, sha256_hex, opciones, pdf, ip_address, t_inicio, tiempos,
+                  parcial=None):
+    """Valida el upload ya guardado (lo borra al terminar) y arma la respuesta de /api/v1/validar."""
+    ext = filename.rsplit(".", 1)[1].lower()
+    file_size_kb = round(file_size / 1024, 2)
+    cache, clave_cache, FINAL = consultar_cache(sha256_hex, filename, ext, opciones)
+    cache_status = "HIT" if FINAL is not None else ("MISS" if cache is not None else "-")
+    medicion = {}
+    try:
+        if FINAL is None:
+            t0 = time.perf_counter()
+            FINAL = ejecutar_validacion(upload_path, filename, ext, **opciones, medicion=medicion, parcial=parcial)
+            tiempos["validacion_s"] = round(time.perf_counter() - t0, 6)
+            tiempos["etapas"] = medicion["etapas"]
+            tiempos["reglas"] = medicion.get("reglas", {})
+            if cache is not None:
+                cache.put_json(clave_cache, FINAL)
+    except Exception as e:
+        registrar_validacion(ip_address, filename, file_size_kb, time.perf_counter() - t_inicio, None, cache_status,
+                             medicion)
+        current_app.logger.exception(f"Error en {request.path}")
+        return jsonify({"archivo": filename, "estado": "ERROR", "error": f"Error al procesar el archivo: {e}"}), 422
+    finally:
+        try:
+            os.remove(upload_path)
+        except OSError:
+            pass
+
+    pasa = pasa_validacion(FINAL)
+    processing_time = round(time.perf_counter() - t_inicio, 6)
+    registrar_validacion(ip_address, filename, file_size_kb, processing_time, FINAL, cache_status, medicion)
+
+    data = {
+        "archivo": filename,
+        "pasa": pasa,
+        "estado": "VÁLIDO" if pasa else "NO VÁLIDO",
+        "observaciones": FINAL,
+        "conteos": {**{k: count_total_observations({k: v}) for k, v in FINAL.items()},
+                    "total": count_total_observations(FINAL)},
+        "peso_kb": file_size_kb,
+        "filas": medicion.get("filas"),
+        "columnas": medicion.get("columnas"),
+        "modo": opciones["modo"],
+        "perfil": opciones["perfil"],
+        "cache": cache_status,
+        "tiempos": tiempos,
+    }
+    if pdf:
+        t0 = time.perf_counter()
+        pdf_bytes = construir_pdf(FINAL, filename)
+        data["pdf_base64"] = base64.b64encode(pdf_bytes).decode("ascii")
+        tiempos["pdf_s"] = round(time.perf_counter() - t0, 6)
+    tiempos["total_s"] = round(time.perf_counter() - t_inicio, 6)
+    return jsonify(data)
+
+@app.route("/api/v1/cargas", methods=["POST"])
+def api_carga_iniciar():
+    """
+    Inicia una carga por partes (ver CARGAS POR PARTES): nombre, tamano en bytes y las
+    opciones de /api/v1/validar (incluido pdf=1), como formulario o JSON.
+    """
+    valores = request.get_json(silent=True) or request.values
+    nombre = secure_filename(str(valores.get("nombre") or ""))
+    if not nombre:
+        return jsonify({"error": "No se indicó el nombre del archivo."}), 400
+    if not allowed_file(nombre):
+        return jsonify({"error": "Formato no permitido. Use CSV/XLSX."}), 400
+    try:
+        tamano = int(valores.get("tamano"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "El tamaño debe ser un número entero de bytes."}), 400
+    if tamano < 1:
+        return jsonify({"error": "El archivo está vacío."}), 400
+    if tamano > app.config["CARGA_MAX_MB"] * 1024 * 1024:
+        return jsonify({"error": f"El archivo excede el máximo de {app.config['CARGA_MAX_MB']} MB."}), 413
+    try:
+        opciones = opciones_validacion(valores, nombre)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    pdf = str(valores.get("pdf", "")).lower() in ("1", "true", "si", "sí")
+    carga_id = iniciar_carga(nombre, tamano, opciones, pdf, request.remote_addr or "-")
+    url = url_for("api_carga_estado", carga_id=carga_id)
+    return jsonify({"carga": carga_id, "offset": 0, "tamano": tamano, "url": url,
+                    "parte_bytes": app.config["CARGA_PARTE_MB"] * 1024 * 1024}), 201, {"Location": url}
+
+def _estado_carga_api(carga_id, estado) -> dict:
+    data = {"carga": carga_id, "archivo": estado["nombre"], "offset": estado["recibido"],
+            "tamano": estado["tamano"], "completa": estado["recibido"] == estado["tamano"]}
+    if estado["utf8"] is not None:
+        # Lo que ya se sabe antes de finalizar: codificación y encabezado
+        data["utf8"] = estado["utf8"]["invalido"] is None
+        if estado["datos"] and estado["datos"]["columnas"]:
+            data["columnas"] = estado["datos"]["columnas"]
+    return data
+
+@app.route("/api/v1/cargas/<carga_id>", methods=["GET"])
+def api_carga_estado(carga_id):
+    """Offset recibido (desde dónde reanudar) y lo revisado hasta ahora."""
+    estado = leer_carga(carga_id)
+    if estado is None:
+        return jsonify({"error": "No existe la carga"}), 404
+    return jsonify(_estado_carga_api(carga_id, estado))
+
+@app.route("/api/v1/cargas/<carga_id>", methods=["PUT"])
+def api_carga_parte(carga_id):
+    """Bytes crudos de una parte en ?offset=N (lo recibido hasta ahora); 409 con el offset correcto si no."""
+    offset = request.args.get("offset", type=int)
+    if offset is None:
+        return jsonify({"error": "Indique el offset de la parte (?offset=N)."}), 400
+    try:
+        estado = recibir_parte(carga_id, offset, request.stream) if _RE_ID_CARGA.match(carga_id) else None
+    except OffsetCarga as e:
+        return jsonify({"error": str(e), "offset": e.recibido}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 413
+    if estado is None:
+        return jsonify({"error": "No existe la carga"}), 404
+    return jsonify(_estado_carga_api(carga_id, estado))
+
+@app.route("/api/v1/cargas/<carga_id>", methods=["DELETE"])
+def api_carga_cancelar(carga_id):
+    if leer_carga(carga_id) is None:
+        return jsonify({"error": "No existe la carga"}), 404
+    cancelar_carga(carga_id)
+    return "", 204
+
+@app.route("/api/v1/cargas/<carga_id>/finalizar", methods=["POST"])
+def api_carga_finalizar(carga_id):
+    """
+    Valida la carga completa y responde como /api/v1/validar; tiempos.partes_s es lo que
+    tomaron las revisiones mientras llegaban las partes.
+    """
+    t_inicio = time.perf_counter()
+    if not _RE_ID_CARGA.match(carga_id):
+        return jsonify({"error": "No existe la carga"}), 404
+    try:
+        with _bloqueo_carga(carga_id) as f:
+            estado = leer_carga(carga_id)
+            if estado is None:
+                return jsonify({"error": "No existe la carga"}), 404
+            if estado["recibido"] != estado["tamano"]:
+                return jsonify({"error": "Faltan partes de la carga.", "offset": estado["recibido"]}), 409
+            sha256_hex, parcial = cerrar_carga(carga_id, f, estado)
+            tiempos = {"partes_s": round(estado["segundos_partes"], 6),
+                       "carga_s": round(time.perf_counter() - t_inicio, 6)}
+            respuesta = responder_api(ruta_carga(carga_id), estado["nombre"], estado["tamano"], sha256_hex,
+                                      estado["opciones"], estado["pdf"], estado["ip"], t_inicio, tiempos, parcial)
+    except FileNotFoundError:
+        return jsonify({"error": "No existe la carga"}), 404
+    cancelar_carga(carga_id)
+    return respuesta
+
+@app.route("/api/v1/analitica")
+def api_analitica():
+    """
+    Agregados de los reportes semanales (ver analitica_reportes). Requiere ANALITICA_TOKEN en
+    el header X-Analitica. ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD (por omisión los últimos
+    ANALITICA_DIAS días) y ?top=N IPs.
+    """
+    token = app.config.get("ANALITICA_TOKEN")
+    if not token or not hmac.compare_digest(request.headers.get("X-Analitica", ""), token):
+        return jsonify({"error": "No existe el recurso"}), 404
+    try:
+        hasta = datetime.strptime(request.args["hasta"], "%Y-%m-%d").date() if "hasta" in request.args \
+            else datetime.now().date()
+        desde = datetime.strptime(request.args["desde"], "%Y-%m-%d").date() if "desde" in request.args \
+            else hasta - timedelta(days=app.config["ANALITICA_DIAS"] - 1)
+    except ValueError:
+        return jsonify({"error": "Fechas inválidas: use AAAA-MM-DD."}), 400
+    top = min(max(request.args.get("top", 10, type=int), 1), 100)
+    return jsonify(analitica_reportes(desde, hasta, top))
+
+@app.route("/metrics")
+def metrics():
+    """Histogramas por etapa y contadores de todos los workers (formato de texto de Prometheus)."""
+    get_volcado_metricas().volcar()  # lo de este worker, al día; los demás, de su último volcado
+    consolidar_metricas()
+    return current_app.response_class(exponer_metricas(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/estado/<token>")
+def estado(token):
+    """
+    Estado del trabajo. ?esperar=N espera hasta N segundos (máx. 30) a que termine; con workers
+    sync de gunicorn eso ocupa el worker, por eso procesando.html consulta sin esperar.
+    """
+    esperar = min(request.args.get("esperar", 0, type=float), 30.0)
+    limite = time.monotonic() + esperar
+    job = leer_job(token)
+    while job and job.get("estado") in (JOB_EN_COLA, JOB_PROCESANDO) and time.monotonic() < limite:
+        time.sleep(0.25)
+        job = leer_job(token)
+    if job is None:
+        return jsonify({"error": "No existe el recurso"}), 404
+
+    data = {"token": token, "estado": job.get("estado"), "nombre_archivo": job.get("nombre_archivo")}
+    if job.get("estado") == JOB_LISTO:
+        data["pasa"] = job.get("pasa")
+        data["resultados"] = url_for("resultados", token=token)
+        data["pdf"] = url_for("descargar_pdf", token=token, nombre=job.get("nombre_archivo"))
+    elif job.get("estado") == JOB_ERROR:
+        data["error"] = job.get("error")
+    return jsonify(data)
+
+@app.route("/resultados/<token>")
+def resultados(token):
+    job = leer_job(token)
+    if job is None:
+        return "No existe el recurso", 404
+    if job.get("estado") in (JOB_EN_COLA, JOB_PROCESANDO):
+        return render_template("procesando.html", token=token, nombre_archivo=job.get("nombre_archivo")), 202
+    if job.get("estado") == JOB_ERROR:
+        return render_template("index.html", error=f"Error al procesar el archivo: {job.get('error')}")
+    FINAL = leer_resultado(token)
+    if FINAL is None:
+        return "No existe el recurso", 404
+    return render_template("resultados.html", token=token, FINAL=FINAL,
+                           nombre_archivo=job.get("nombre_archivo"), pasa=pasa_validacion(FINAL))
 
 @app.route("/descargar/pdf/<token>")
 def descargar_pdf(token):
-    path_json = os.path.join(RESULTS_FOLDER, f"final_{token}.json")
-    if not os.path.exists(path_json):
+    FINAL = leer_resultado(token)
+    if FINAL is None:
+        job = leer_job(token)
+        if job and job.get("estado") in (JOB_EN_COLA, JOB_PROCESANDO):
+            return "La validación sigue en proceso", 409
         return "No existe el recurso", 404
-    with open(path_json, "r", encoding="utf-8") as f:
-        FINAL = json.load(f)
 
     nombre_archivo = request.args.get("nombre", "archivo_validado")
-    pdf_bytes = construir_pdf(FINAL, nombre_archivo, token)
+    # El acuse se dibuja en cada descarga: lleva la fecha y hora de la petición y no se guarda en caché
+    if app.config["PDF_STREAMING"]:
+        # Se sirve por ruta (por bloques o sendfile); el archivo ya abierto sobrevive a la limpieza
+        origen = construir_pdf_archivo(FINAL, nombre_archivo, ruta_informe(token))
+    else:
+        origen = io.BytesIO(construir_pdf(FINAL, nombre_archivo, token))
 
     # Limpieza después de enviar respuesta
     @after_this_request
@@ -505,25 +3192,28 @@ def descargar_pdf(token):
             current_app.logger.warning(f"Error en limpieza automática [{token}]: {e}")
         return response
 
-    buf = io.BytesIO(pdf_bytes)
-    buf.seek(0)
     # Cache off para evitar PDFs viejos
-    resp = send_file_compat(buf, f"informe_{token}.pdf", mimetype="application/pdf")
+    resp = send_file_compat(origen, f"informe_{token}.pdf", mimetype="application/pdf")
     resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
     return resp
 
 # ---------------- Limpieza de temporales viejos ----------------
 def cleanup_old_temp_files(hours_old=24):
-    """Elimina archivos temporales más viejos que 'hours_old' horas."""
+    """
+    Elimina PDFs de auditoría, uploads huérfanos y cargas por partes abandonadas (el ctime
+    cambia con cada parte) más viejos que 'hours_old' horas.
+    Los resultados y el estado de los trabajos vencen solos en el almacén (PurgaResultados).
+    """
     try:
         current_time = datetime.now()
-        for filename in os.listdir(RESULTS_FOLDER):
-            if filename.startswith(("final_", "informe_")):
-                file_path = os.path.join(RESULTS_FOLDER, filename)
-                file_time = datetime.fromtimestamp(os.path.getctime(file_path))
-                if (current_time - file_time).total_seconds() > (hours_old * 3600):
-                    os.remove(file_path)
-                    # logging opcional: current_app.logger.info(...)
+        for folder, prefixes in ((RESULTS_FOLDER, ("informe_",)), (UPLOAD_FOLDER, ("upload_", "carga_"))):
+            for filename in os.listdir(folder):
+                if filename.startswith(prefixes):
+                    file_path = os.path.join(folder, filename)
+                    file_time = datetime.fromtimestamp(os.path.getctime(file_path))
+                    if (current_time - file_time).total_seconds() > (hours_old * 3600):
+                        os.remove(file_path)
+                        # logging opcional: current_app.logger.info(...)
     except Exception as e:
         # logging opcional: current_app.logger.warning(...)
         print(f"Error en limpieza de temporales: {e}")
@@ -540,8 +3230,62 @@ def _run_startup_once():
         finally:
             _startup_done = True
 
+# ---------------- PERFILADO POR PETICIÓN (ADMIN) ----------------
+@app.before_request
+def _iniciar_perfil():
+    """Con PERFILADO_TOKEN configurado y el header X-Perfilar correcto, perfila la petición."""
+    token = app.config.get("PERFILADO_TOKEN")
+    if not token or not hmac.compare_digest(request.headers.get("X-Perfilar", ""), token):
+        return
+    perfil = cProfile.Profile()
+    try:
+        perfil.enable()
+    except ValueError:  # ya hay otro perfilador activo en este proceso
+        return
+    g.perfil = perfil
+
+@app.after_request
+def _guardar_perfil(response):
+    perfil = g.pop("perfil", None)
+    if perfil is None:
+        return response
+    perfil.disable()
+    nombre = f"perfil_{nuevo_token()}_{request.endpoint}.prof"
+    try:
+        perfil.dump_stats(os.path.join(PERFILES_FOLDER, nombre))
+        response.headers["X-Perfil"] = nombre  # abrir con: python -m pstats perfiles/<nombre>
+    except OSError as e:
+        current_app.logger.warning(f"No fue posible guardar el perfil: {e}")
+    return response
+
+@app.teardown_request
+def _detener_perfil(_exc):
+    perfil = g.pop("perfil", None)  # la petición terminó en excepción antes de after_request
+    if perfil is not None:
+        perfil.disable()
+
+# ---------------- PRECARGA (gunicorn --preload) ----------------
+def precargar():
+    """
+    Importa polars, el lector de Excel y reportlab y decodifica los logos del PDF. Con gunicorn --preload
+    corre una vez en el maestro y los workers lo heredan por fork (páginas copy-on-write).
+    No ejecuta consultas de polars: su pool de hilos no debe arrancar antes del fork.
+    """
+    importlib.import_module("fastexcel" if app.config["EXCEL_BACKEND"] == "calamine" else "openpyxl")
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    pl.DataFrame  # noqa: B018 - el primer atributo importa polars
+    definir_encabezado_pie(canvas.Canvas(io.BytesIO(), pagesize=letter))
+    _has_download_name()
+
+if os.environ.get("VALIDADOR_PRECARGA") == "1":
+    precargar()
+
 # ---------------- DEV LOCAL (opcional) ----------------
 if __name__ == "__main__":
     # Para correr en local (Gunicorn no usa este bloque)
+    # HTTP/1.1 para conexiones persistentes de clientes de /api/v1/validar
+    from werkzeug.serving import WSGIRequestHandler
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
     cleanup_old_temp_files()
     app.run(host="0.0.0.0", port=8081, debug=True)
\ No newline at end of file
@@ -0,0 +1,1023 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks del API-Validador-Formatos-Datos-Abiertos.
+
+Uso:
+    python benchmark.py datos [--filas 1000000]
+    python benchmark.py memoria [--filas 5000000]
+    python benchmark.py excel [--filas 50000]
+    python benchmark.py pdf [--observaciones 1000]
+    python benchmark.py pdfdescarga [--observaciones 20000]
+    python benchmark.py modos [--filas 2000000]
+    python benchmark.py auditoria [--procesos 4] [--hilos 8] [--entradas 2000]
+    python benchmark.py codificacion [--filas 1000000]
+    python benchmark.py reglas [--columnas 5000]
+    python benchmark.py incremental [--filas 1000000] [--cambios 3]
+    python benchmark.py resultados [--procesos 4] [--tokens 2000] [--viejos 20000]
+    python benchmark.py arranque [--repeticiones 5]
+    python benchmark.py analitica [--semanas 104] [--filas 20000]
+    python benchmark.py perfil [--filas 1000000]
+    python benchmark.py cargas [--filas 1000000] [--parte-mb 8]
+    python benchmark.py suite [--perfil rapido|completo] [--salida r.json] [--comparar base.json] [--umbral 0.25]
+
+"suite" genera archivos sintéticos (CSV/XLSX, 1K-10M filas, 5-500 columnas, encabezados con
+acentos, celdas con espacios, UTF-8/Latin-1/CP1252), cronometra cada validador, construir_pdf
+y la ruta /validar (mediana de --repeticiones), escribe los tiempos en JSON y, con --comparar,
+termina con código 1 si alguna medición es más lenta que la línea base por encima del umbral
+y de --minimo-s.
+"""
+import argparse, codecs, csv, io, json, multiprocessing, os, platform, re, resource, shutil, statistics, subprocess, sys, tempfile, threading, time, tracemalloc
+from datetime import datetime, timedelta
+import polars as pl
+
+import app
+
+
+# ---------------- DATOS SINTÉTICOS ----------------
+def df_sintetico(filas: int, columnas: int = 8, sucias: float = 0.001) -> pl.DataFrame:
+    """DataFrame de texto con una fracción de celdas con espacio al inicio/final."""
+    base = pl.int_range(0, filas, eager=True)
+    data = {}
+    for j in range(columnas):
+        valores = ("valor_" + base.cast(pl.Utf8) + f"_{j}")
+        if j % 2 == 0 and sucias > 0:
+            paso = max(int(1 / sucias), 1)
+            mask = (base % paso) == (j % paso)
+            valores = pl.select(pl.when(mask).then(" " + valores).otherwise(valores)).to_series()
+        data[f"col_{j}"] = valores
+    data["numero"] = base
+    return pl.DataFrame(data)
+
+
+ENCABEZADOS_ACENTOS = ("año", "descripción", "núm_de_registro_del_catálogo_de_obras", "ubicación geográfica",
+                       "población_indígena", "teléfono")
+TEXTOS_ACENTOS = ("José Pérez", "Peñón de los Baños", "Distrito Federal", "Mérida, Yucatán", "Ñuñoa", "Texto simple")
+
+
+def df_abierto(filas: int, columnas: int, acentos: bool = False, sucias: float = 0.001) -> pl.DataFrame:
+    """
+    Tabla tipo datos abiertos: ciclo texto / entero / decimal / fecha por columna. Con
+    'acentos' los encabezados llevan tildes, ñ, espacios o más de 5 palabras y el texto
+    caracteres fuera de ASCII; 'sucias' es la fracción de celdas de texto con espacio al inicio.
+    """
+    base = pl.int_range(0, filas, eager=True)
+    textos = pl.Series(TEXTOS_ACENTOS if acentos else ("texto", "valor", "registro", "dato", "campo", "otro"))
+    data = {}
+    for j in range(columnas):
+        nombre = f"{ENCABEZADOS_ACENTOS[j % len(ENCABEZADOS_ACENTOS)]}_{j}" if acentos else f"campo_{j}"
+        tipo = j % 4
+        if tipo == 0:
+            valores = textos.gather(base % len(textos)) + "_" + base.cast(pl.Utf8)
+            if sucias > 0:
+                paso = max(int(1 / sucias), 1)
+                valores = pl.select(pl.when((base % paso) == (j % paso)).then(" " + valores)
+                                    .otherwise(valores)).to_series()
+        elif tipo == 1:
+            valores = base * (j + 1)
+        elif tipo == 2:
+            valores = base.cast(pl.Float64) / 7
+        else:
+            valores = pl.select((pl.date(2020, 1, 1) + pl.duration(days=base % 2000))
+                                .dt.strftime("%Y-%m-%d")).to_series()
+        data[nombre] = valores
+    return pl.DataFrame(data)
+
+
+def escribir_archivo(df: pl.DataFrame, path: str, formato: str, encoding: str = "utf-8"):
+    """CSV en la codificación pedida (se transcodifica por bloques) o XLSX en modo write_only."""
+    if formato == "xlsx":
+        import openpyxl
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(df.columns)
+        for fila in df.iter_rows():
+            ws.append(fila)
+        wb.save(path)
+        return
+    if encoding == "utf-8":
+        df.write_csv(path)
+        return
+    tmp = path + ".utf8"
+    df.write_csv(tmp)
+    try:
+        with open(tmp, "r", encoding="utf-8", newline="") as src, \
+                open(path, "w", encoding=encoding, errors="replace", newline="") as dst:
+            while True:
+                bloque = src.read(app.CHUNK_SIZE)
+                if not bloque:
+                    break
+                dst.write(bloque)
+    finally:
+        os.remove(tmp)
+
+
+# ---------------- RUTA ANTERIOR (referencia) ----------------
+def validar_datos_legacy(df: pl.DataFrame):
+    """Implementación previa con map_elements, se conserva solo para comparar."""
+    if df.is_empty():
+        return ["No se encontraron observaciones sobre los datos."]
+    obs = []
+    for c in df.columns:
+        try:
+            serie_str = df[c].cast(pl.Utf8, strict=False)
+            has_spaces = serie_str.drop_nulls().map_elements(
+                lambda x: bool(re.match(r'^\s|\s$', str(x))) if x is not None else False,
+                return_dtype=pl.Boolean
+            ).any()
+            if has_spaces:
+                obs.append(f"La columna {c} tiene valores con espacios al inicio o final.")
+        except Exception:
+            continue
+    return obs or ["No se encontraron observaciones sobre los datos."]
+
+
+def validar_nombre_archivo_legacy(nom_arch: str):
+    obs = []
+    if re.search(r"[ñáéíóúüÑÁÉÍÓÚÜ]", nom_arch):
+        obs.append("El nombre del archivo contiene caracteres especiales (ñ, tildes, diéresis).")
+    if " " in nom_arch:
+        obs.append("El nombre del archivo no debe tener espacios. Se recomienda usar guiones bajos para separar palabras.")
+    return obs or ["No se encontraron observaciones con el nombre del archivo."]
+
+
+def validar_nombres_columnas_legacy(df):
+    """Reglas en línea con re.search por columna, antes de reglas.json."""
+    if df.is_empty():
+        return ["No se encontraron observaciones de los nombres de las columnas."]
+    obs = []
+    especiales = [c for c in df.columns if re.search(r"[ñáéíóúüÑÁÉÍÓÚÜ]", c or "")]
+    if especiales:
+        obs.append("Nombre de columnas con caracteres especiales: " + " | ".join(especiales))
+    largas = [c for c in df.columns if len([p for p in (c or "").split("_") if p]) > 5]
+    if largas:
+        obs.append("Nombre de columnas con más de 5 palabras: " + " | ".join(largas))
+    return obs or ["No se encontraron observaciones de los nombres de las columnas."]
+
+
+def nombres_aleatorios(n: int, semilla: int = 0) -> list:
+    import random
+    rnd = random.Random(semilla)
+    piezas = ["año", "dato", "_", "__", "x", "Ñ", "ü", " ", "clave", "é", "a_b_c", "", "1"]
+    nombres = set()
+    while len(nombres) < n:
+        nombres.add("".join(rnd.choice(piezas) for _ in range(rnd.randint(1, 12))) + f"{len(nombres)}")
+    return sorted(nombres)
+
+
+def leer_excel_legacy(origen):
+    """Conversión previa: list(ws.values) + bucle Python celda por celda."""
+    import openpyxl
+    wb = openpyxl.load_workbook(origen, read_only=True, data_only=True)
+    ws = wb[wb.sheetnames[0]]
+    rows = list(ws.values)
+    if not rows:
+        return None
+    headers = [str(h) if h is not None else "" for h in rows[0]]
+    data = rows[1:] if len(rows) > 1 else []
+    safe_data = []
+    for row in data:
+        safe_row = []
+        for cell in row:
+            if cell is None:
+                safe_row.append("")
+            elif isinstance(cell, datetime):
+                safe_row.append(cell.strftime('%Y-%m-%d %H:%M:%S'))
+            else:
+                safe_row.append(str(cell))
+        safe_data.append(safe_row)
+    return pl.DataFrame(safe_data, schema=headers, orient="row") if headers else pl.DataFrame()
+
+
+def xlsx_sintetico(path: str, filas: int):
+    """Hoja con texto, enteros, flotantes, fechas, booleanos, vacíos y una columna mixta."""
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["clave", "descripción", "monto", "fecha", "activo", "nota", "mixta"])
+    base = datetime(2024, 1, 1)
+    for i in range(filas):
+        ws.append([
+            i, f"registro {i}" if i % 50 else f" registro {i}", i * 1.25,
+            base + timedelta(minutes=i), i % 3 == 0, None if i % 7 else "x",
+            [i, "t", "", base, 2.5][i % 5],  # sin None al final: la ruta previa fallaba con filas cortas
+        ])
+    wb.save(path)
+
+
+def is_utf8_legacy(path: str) -> bool:
+    """Ruta previa: bytes completos en memoria y decode() a un str que se descarta."""
+    with open(path, "rb") as f:
+        file_bytes = f.read()
+    try:
+        file_bytes.decode("utf-8")
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def validar_csv_en_memoria(path: str):
+    """Ruta previa de /validar: bytes completos -> is_utf8 -> BytesIO -> read_csv."""
+    with open(path, "rb") as f:
+        contenido = io.BytesIO(f.read())
+    _, df = app.validar_formato_y_carga(contenido, os.path.basename(path), "csv")
+    return app.validar_datos(df)
+
+
+def cronometrar(fn, *args, repeticiones=3, agregado=min):
+    """(agregado de los tiempos, último resultado); la suite usa la mediana en lugar del mejor."""
+    tiempos, resultado = [], None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultado = fn(*args)
+        tiempos.append(time.perf_counter() - t0)
+    return agregado(tiempos), resultado
+
+
+# ---------------- CASOS ----------------
+def bench_datos(filas: int):
+    casos = {
+        "limpio": df_sintetico(filas, sucias=0),
+        "sucio": df_sintetico(filas),
+        "bordes": pl.DataFrame({
+            "a": [" x", "y ", "\tz", None, "\x1cw", "　v"],
+            "b": ["ok", "", " ", "\n", "a\n", "b"],
+            "c": [1, 2, 3, 4, 5, 6],
+        }),
+    }
+    for nombre, df in casos.items():
+        t_old, r_old = cronometrar(validar_datos_legacy, df)
+        t_new, r_new = cronometrar(app.validar_datos, df)
+        assert r_old == r_new, f"Diferencia en '{nombre}': {r_old} != {r_new}"
+        print(f"validar_datos[{nombre}] filas={df.height} anterior={t_old:.4f}s "
+              f"nuevo={t_new:.4f}s x{t_old / max(t_new, 1e-9):.1f}")
+
+
+def bench_excel(filas: int):
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        xlsx_sintetico(path, filas)
+        size_kb = os.path.getsize(path) / 1024
+        t_old, df_old = cronometrar(leer_excel_legacy, path)
+        linea = f"excel filas={filas} archivo={size_kb:.0f}KB anterior={t_old:.3f}s"
+        for nombre, lector in app.EXCEL_LECTORES.items():
+            try:
+                t_new, df_new = cronometrar(lector, path)
+            except ImportError:
+                continue  # backend opcional no instalado
+            assert df_old.columns == df_new.columns, (nombre, df_old.columns, df_new.columns)
+            assert df_old.cast(pl.Utf8).equals(df_new), f"Diferencia en el contenido del Excel ({nombre})"
+            linea += f" {nombre}={t_new:.3f}s x{t_old / max(t_new, 1e-9):.2f}"
+        print(linea)
+    finally:
+        os.remove(path)
+
+
+def final_sintetico(observaciones: int) -> dict:
+    """FINAL con muchas columnas observadas (nombres largos para forzar el ajuste de línea)."""
+    columnas = [f"columna_{i}_con_nombre_bastante_largo_para_el_reporte" for i in range(observaciones)]
+    return {
+        "formato": [],
+        "archivo": ["No se encontraron observaciones con el nombre del archivo."],
+        "columnas": ["Nombre de columnas con más de 5 palabras: " + " | ".join(columnas[:200])],
+        "datos": [f"La columna {c} tiene valores con espacios al inicio o final." for c in columnas],
+    }
+
+
+def bench_pdf(observaciones: int):
+    FINAL = final_sintetico(observaciones)
+    t0 = time.perf_counter()
+    pdf = app.construir_pdf(FINAL, "benchmark.csv", "benchmark")
+    t_frio = time.perf_counter() - t0  # incluye decodificar logos y llenar la caché de anchos
+    t_tibio, _ = cronometrar(app.construir_pdf, FINAL, "benchmark.csv", "benchmark")
+    os.remove(os.path.join(app.RESULTS_FOLDER, "informe_benchmark.pdf"))
+    print(f"pdf observaciones={observaciones} tamaño={len(pdf) / 1024:.0f}KB "
+          f"primera={t_frio:.3f}s siguientes={t_tibio:.3f}s")
+
+
+def _descargar_pdf(cliente, token: str) -> int:
+    """Una descarga de /descargar/pdf consumida por bloques (como la envía el servidor); regresa los bytes."""
+    resp = cliente.get(f"/descargar/pdf/{token}?nombre=benchmark.csv", buffered=False)
+    try:
+        return sum(len(bloque) for bloque in resp.response)
+    finally:
+        resp.close()
+
+
+def bench_pdfdescarga(observaciones: int):
+    """Pico de memoria de /descargar/pdf: PDF en bytes (BytesIO) vs. escrito a disco y servido por ruta."""
+    FINAL = final_sintetico(observaciones)
+    cliente = app.app.test_client()
+    streaming_previo = app.app.config["PDF_STREAMING"]
+
+    def descarga(streaming, final_dict, medir=True):
+        app.app.config["PDF_STREAMING"] = streaming
+        token = app.nuevo_token()
+        app.guardar_resultado(token, final_dict)
+        return pico_python(_descargar_pdf, cliente, token) if medir else _descargar_pdf(cliente, token)
+
+    descarga(True, final_sintetico(1), medir=False)  # logos, fuentes e imports fuera de la medición
+    try:
+        for streaming in (False, True):
+            t, pico, n = descarga(streaming, FINAL)
+            print(f"pdfdescarga[{'streaming' if streaming else 'bytes'}] observaciones={observaciones} "
+                  f"pdf={n / 1024 / 1024:.1f}MB pico={pico:.1f}MB tiempo={t:.3f}s")
+    finally:
+        app.app.config["PDF_STREAMING"] = streaming_previo
+
+def bench_modos(filas: int):
+    """
+    validar_datos por modo, en memoria y sobre pl.scan_csv (columnas sucias desde el inicio, y
+    el mismo CSV limpio: el peor caso de primer-hallazgo). Sobre el CSV, muestra lee solo sus
+    bloques del archivo (_muestra_csv).
+    """
+    df = df_sintetico(filas)
+    limpio = df_sintetico(filas, sucias=0)
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        for modo in app.MODOS_VALIDACION:
+            t, _ = cronometrar(app.validar_datos, df, modo, repeticiones=1)
+            print(f"modo[{modo}] origen=memoria filas={filas} tiempo={t:.3f}s")
+        for origen, datos in (("scan_csv", df), ("scan_csv limpio", limpio)):
+            datos.write_csv(path)
+            _, lf = app.validar_formato_y_carga(path, os.path.basename(path), "csv", streaming=True)
+            for modo in app.MODOS_VALIDACION:
+                t, _ = cronometrar(lambda: app.validar_datos(lf, modo, fuente=path), repeticiones=1)
+                print(f"modo[{modo}] origen={origen} filas={filas} tiempo={t:.3f}s")
+    finally:
+        os.remove(path)
+
+
+def _escribir_auditoria(hilos: int, entradas: int, asincrona: bool):
+    """Un worker: 'hilos' peticiones simultáneas que registran 'entradas' validaciones cada una."""
+    app.app.config["AUDITORIA_ASINCRONA"] = asincrona
+
+    def peticion(h):
+        for i in range(entradas):
+            app.write_to_log("127.0.0.1", f"archivo_{os.getpid()}_{h}_{i}.csv", 12.5, 0.01, "OK", "MISS")
+            app.update_weekly_report("127.0.0.1", f"archivo_{os.getpid()}_{h}_{i}.csv", 12.5, 0.01, "OK", 0, "MISS")
+
+    ts = [threading.Thread(target=peticion, args=(h,)) for h in range(hilos)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    if asincrona:
+        app.get_escritor().flush()
+
+
+def bench_auditoria(procesos: int, hilos: int, entradas: int):
+    """Escritura directa (un open/write por entrada) vs. EscritorAuditoria, con varios workers."""
+    ctx = multiprocessing.get_context("fork")  # los hijos heredan las carpetas temporales
+    total = procesos * hilos * entradas
+    for asincrona in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            app.LOGS_FOLDER = app.REPORTS_FOLDER = tmp
+            t0 = time.perf_counter()
+            ps = [ctx.Process(target=_escribir_auditoria, args=(hilos, entradas, asincrona))
+                  for _ in range(procesos)]
+            for p in ps:
+                p.start()
+            for p in ps:
+                p.join()
+            elapsed = time.perf_counter() - t0
+            with open(app.get_current_log_file(), encoding="utf-8") as f:
+                lineas_log = f.read().splitlines()
+            with open(app.get_current_report_file(), encoding="utf-8") as f:
+                filas = list(csv.reader(f))
+            assert len(lineas_log) == total and all(l.endswith("Cache=MISS") for l in lineas_log)
+            assert filas[0] == app.REPORT_HEADER and len(filas) == total + 1
+            assert all(len(r) == len(app.REPORT_HEADER) for r in filas[1:]), "Filas mezcladas en el reporte"
+        modo = "asincrona" if asincrona else "directa"
+        print(f"auditoria[{modo}] procesos={procesos} hilos={hilos} entradas={total} "
+              f"tiempo={elapsed:.3f}s {total / elapsed:.0f} entradas/s")
+
+
+FINAL_EJEMPLO = {"formato": [], "archivo": ["No se encontraron observaciones con el nombre del archivo."],
+                 "columnas": ["Nombre de columnas con caracteres especiales: año, descripción"],
+                 "datos": ["La columna año tiene valores con espacios al inicio o final."]}
+
+
+def _resultados_por_archivo(folder: str, tokens: int):
+    """Ruta previa: final_{token}.json escrito, leído (descarga) y borrado por petición."""
+    for i in range(tokens):
+        path = os.path.join(folder, f"final_{os.getpid()}_{i}.json")
+        app._escribir_json(path, FINAL_EJEMPLO)
+        with open(path, "r", encoding="utf-8") as f:
+            assert json.load(f) == FINAL_EJEMPLO
+        os.remove(path)
+
+
+def _resultados_en_almacen(tokens: int):
+    almacen = app.get_resultados()
+    for i in range(tokens):
+        token = f"{os.getpid()}_{i}"
+        almacen.guardar(token, app.RESULTADO_FINAL, FINAL_EJEMPLO)
+        assert almacen.leer(token, app.RESULTADO_FINAL) == FINAL_EJEMPLO
+        almacen.eliminar(token)
+
+
+def bench_resultados(procesos: int, tokens: int, viejos: int):
+    """final_{token}.json + barrido de la carpeta vs. almacén SQLite (WAL) con vencimiento, con varios workers."""
+    ctx = multiprocessing.get_context("fork")
+    total = procesos * tokens
+    with tempfile.TemporaryDirectory() as tmp:
+        app.app.config["RESULTADOS_BACKEND"] = "sqlite"
+        app.app.config["RESULTADOS_DB"] = os.path.join(tmp, "resultados.sqlite3")
+        for modo in ("archivos", "sqlite"):
+            objetivo, args = ((_resultados_por_archivo, (tmp, tokens)) if modo == "archivos"
+                              else (_resultados_en_almacen, (tokens,)))
+            t0 = time.perf_counter()
+            ps = [ctx.Process(target=objetivo, args=args) for _ in range(procesos)]
+            for p in ps:
+                p.start()
+            for p in ps:
+                p.join()
+            elapsed = time.perf_counter() - t0
+            assert all(p.exitcode == 0 for p in ps), "Falló un worker"
+            print(f"resultados[{modo}] procesos={procesos} tokens={total} tiempo={elapsed:.3f}s "
+                  f"{total / elapsed:.0f} resultados/s")
+
+        # Limpieza de vencidos con 'viejos' resultados abandonados (nunca descargados)
+        for i in range(viejos):
+            with open(os.path.join(tmp, f"final_{i}.json"), "w", encoding="utf-8") as f:
+                json.dump(FINAL_EJEMPLO, f)
+        carpetas = app.RESULTS_FOLDER, app.UPLOAD_FOLDER
+        app.RESULTS_FOLDER = app.UPLOAD_FOLDER = tmp
+        try:
+            # Ruta previa: mismo barrido con los final_*.json incluidos; hours_old=0 los borra todos
+            def barrido_previo():
+                for nombre in os.listdir(tmp):
+                    if nombre.startswith("final_"):
+                        os.path.getctime(os.path.join(tmp, nombre))
+                        os.remove(os.path.join(tmp, nombre))
+                app.cleanup_old_temp_files(hours_old=0)
+            t_scan, _ = cronometrar(barrido_previo, repeticiones=1)
+        finally:
+            app.RESULTS_FOLDER, app.UPLOAD_FOLDER = carpetas
+        almacen = app.get_resultados()
+        almacen.ttl_s = -1  # todo lo que se guarde ya está vencido
+        for i in range(viejos):
+            almacen.guardar(f"viejo_{i}", app.RESULTADO_FINAL, FINAL_EJEMPLO)
+        t_purga, borrados = cronometrar(almacen.purgar, repeticiones=1)
+        print(f"limpieza viejos={viejos} barrido_carpeta={t_scan:.3f}s purga_sqlite={t_purga:.3f}s "
+              f"({borrados} borrados; el barrido corre en la petición, la purga en su hilo)")
+
+
+# Corre en un intérprete nuevo por repetición: tiempo de 'import app' y de la primera petición a cada ruta
+SCRIPT_ARRANQUE = r"""
+import io, json, re, sys, time
+t0 = time.perf_counter()
+import app
+tiempos = {"import": time.perf_counter() - t0}
+nombre = f"arranque_{time.time_ns()}.csv"  # nombre único: sin aciertos de caché de resultado ni de PDF
+client = app.app.test_client()
+def primera(nombre, fn):
+    t = time.perf_counter()
+    resp = fn()
+    assert resp.status_code == 200, (nombre, resp.status_code)
+    tiempos[nombre] = time.perf_counter() - t
+    return resp
+primera("/", lambda: client.get("/"))
+resp = primera("/validar", lambda: client.post(
+    "/validar", data={"archivo": (io.BytesIO(b"clave,nombre\n1,uno\n2, dos\n"), nombre)},
+    content_type="multipart/form-data"))
+token = re.search(r"/descargar/pdf/(\d+)", resp.get_data(as_text=True)).group(1)
+primera("/descargar/pdf/<token>", lambda: client.get(f"/descargar/pdf/{token}?nombre={nombre}"))
+tiempos["heredados"] = sorted(m for m in ("polars", "reportlab.pdfgen.canvas", "openpyxl") if m in sys.modules)
+print(json.dumps(tiempos))
+"""
+
+
+def bench_arranque(repeticiones: int):
+    """Arranque en frío de un worker: import, primera petición a / y a validar, y primer PDF."""
+    for precarga in ("0", "1"):
+        env = dict(os.environ, VALIDADOR_PRECARGA=precarga)
+        corridas = [json.loads(subprocess.run([sys.executable, "-c", SCRIPT_ARRANQUE], env=env, cwd=app.BASE_DIR,
+                                              capture_output=True, text=True, check=True).stdout)
+                    for _ in range(repeticiones)]
+        rutas = [k for k in corridas[0] if k != "heredados"]
+        medianas = {k: sorted(c[k] for c in corridas)[len(corridas) // 2] for k in rutas}
+        detalle = " ".join(f"{k}={v * 1000:.0f}ms" for k, v in medianas.items())
+        print(f"arranque[precarga={precarga}] {detalle} total={sum(medianas.values()) * 1000:.0f}ms")
+
+
+def escribir_reporte_sintetico(path: str, semana: int, filas: int, anterior: bool):
+    """Reporte semanal con el formato de update_weekly_report; 'anterior' usa el encabezado de 8 columnas."""
+    base = pl.int_range(0, filas, eager=True)
+    inicio = datetime(2024, 1, 1) + timedelta(weeks=semana)
+    df = pl.DataFrame({
+        "Fecha": [(inicio + timedelta(days=d)).strftime("%Y-%m-%d") for d in (base % 7).to_list()],
+        "Hora": "10:00:00",
+        "IP": "10.0." + (base % 7).cast(pl.Utf8) + "." + (base % 251).cast(pl.Utf8),
+        "Archivo": "archivo_" + (base % 500).cast(pl.Utf8) + ".csv",
+        "Peso_KB": ((base * 7919) % 300_000).cast(pl.Float64) / 3,
+        "Tiempo_Procesamiento_s": ((base * 104729) % 5000).cast(pl.Float64) / 1000,
+        "Estado": pl.Series(["VÁLIDO", "NO VÁLIDO", "NO VÁLIDO", "ERROR"]).gather(base % 4),
+        "Cantidad_Observaciones": base % 5,
+    })
+    if not anterior:
+        df = df.with_columns(Cache=pl.lit("MISS"), Filas=base * 10, Columnas=base % 40,
+                             Bytes_por_s=base * 1000, **{c: pl.lit(0.001) for c in app.REPORT_HEADER[12:]})
+    df.write_csv(path)
+
+
+def bench_analitica(semanas: int, filas: int):
+    """Consulta sobre todos los CSV en cada petición vs. rollup Parquet incremental."""
+    carpetas = app.REPORTS_FOLDER, app.ANALITICA_FOLDER
+    with tempfile.TemporaryDirectory() as tmp:
+        app.REPORTS_FOLDER, app.ANALITICA_FOLDER = os.path.join(tmp, "reportes"), os.path.join(tmp, "analitica")
+        os.makedirs(app.REPORTS_FOLDER)
+        os.makedirs(app.ANALITICA_FOLDER)
+        try:
+            for s in range(semanas):
+                escribir_reporte_sintetico(os.path.join(app.REPORTS_FOLDER, f"reporte_{s:04d}.csv"), s, filas,
+                                           anterior=s < semanas // 3)
+            csv_mb = sum(e.stat().st_size for e in os.scandir(app.REPORTS_FOLDER)) / 1024 / 1024
+            desde, hasta = datetime(2024, 1, 1).date(), datetime(2030, 1, 1).date()
+
+            def sin_rollup():
+                rutas = sorted(os.path.join(app.REPORTS_FOLDER, n) for n in os.listdir(app.REPORTS_FOLDER))
+                return app.agregados_reportes(pl.concat([app._reporte_lazy(r) for r in rutas]))
+
+            t_csv, r_csv = cronometrar(sin_rollup, repeticiones=1)
+            t_primera, r_primera = cronometrar(app.analitica_reportes, desde, hasta, repeticiones=1)
+            t_repetida, _ = cronometrar(app.analitica_reportes, desde, hasta)
+            assert all(r_csv[k] == r_primera[k] for k in r_csv), "Agregados distintos"
+            # La semana en curso recibe más validaciones: solo ese Parquet se reconvierte
+            with open(os.path.join(app.REPORTS_FOLDER, f"reporte_{semanas - 1:04d}.csv"), "a", encoding="utf-8") as f:
+                f.write(app._linea_csv(["2030-01-01", "10:00:00", "10.0.0.1", "nuevo.csv", 1.0, 0.5,
+                                        "VÁLIDO", 0, "MISS"]))
+            t_nueva, r_nueva = cronometrar(app.analitica_reportes, desde, hasta, repeticiones=1)
+            assert r_nueva["resumen"]["validaciones"] == semanas * filas + 1
+            parquet_mb = sum(e.stat().st_size for e in os.scandir(app.ANALITICA_FOLDER)) / 1024 / 1024
+            print(f"analitica semanas={semanas} filas={semanas * filas} csv={csv_mb:.0f}MB parquet={parquet_mb:.0f}MB")
+            print(f"  sobre los CSV en cada consulta={t_csv:.3f}s | rollup: primera (convierte todo)={t_primera:.3f}s "
+                  f"repetida={t_repetida:.3f}s tras agregar a la semana en curso={t_nueva:.3f}s")
+        finally:
+            app.REPORTS_FOLDER, app.ANALITICA_FOLDER = carpetas
+
+
+def df_con_problemas(filas: int) -> pl.DataFrame:
+    """df_abierto con lo que busca perfilar_datos: vacíos, números y fechas como texto, mezclas y duplicados."""
+    df = df_abierto(filas, 8)
+    base = pl.int_range(0, filas, eager=True)
+    return df.with_columns(
+        pl.when(base % 3 == 0).then(pl.col("campo_0")).otherwise(None).alias("campo_0"),
+        (" " + pl.col("campo_1").cast(pl.Utf8)).alias("campo_1"),  # el espacio impide inferir entero
+        pl.when(base % 1000 == 7).then(pl.lit("s/d")).otherwise(pl.col("campo_5").cast(pl.Utf8)).alias("campo_5"),
+        pl.when(base % 50 == 0).then(pl.col("campo_3").str.replace(r"^(\d{4})-(\d{2})-(\d{2})$", "$3/$2/$1"))
+        .otherwise(pl.col("campo_3")).alias("campo_3"),
+    ).with_columns(pl.when(base % 10_000 == 1).then(pl.col(c).shift(1)).otherwise(pl.col(c)).alias(c)
+                   for c in df.columns)
+
+
+def _conteo_y_filas(mascara: pl.DataFrame) -> tuple:
+    indice = mascara.with_row_index("__fila")
+    return indice.select(pl.col("m").sum(), pl.col("__fila").filter(pl.col("m")).min().alias("min"),
+                         pl.col("__fila").filter(pl.col("m")).max().alias("max")).row(0)
+
+
+def bench_perfil(filas: int):
+    """perfilar_datos: una lectura con todas las revisiones vs. una pasada por revisión."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "perfil.csv")
+        df_con_problemas(filas).write_csv(path)
+        mb = os.path.getsize(path) / 1024 / 1024
+
+        def lazy():
+            return pl.scan_csv(path, infer_schema_length=10000)
+
+        def por_separado():
+            lf = lazy()
+            schema = lf.collect_schema()
+            stats = {}
+            for a, e in app._revisiones_perfil(schema).items():
+                fila = _conteo_y_filas(lf.select(e.alias("m")).collect(streaming=True))
+                stats[a] = (fila[0] or 0, fila[1], fila[2])
+            repetida = ~pl.struct(*(pl.nth(i) for i in range(len(schema)))).hash(seed=0).is_first_distinct()
+            mascara = lf.select(repetida.alias("m")).collect(streaming=True)
+            fila = _conteo_y_filas(mascara)
+            stats["__duplicadas"], stats["__filas"] = (fila[0] or 0, fila[1], fila[2]), len(mascara)
+            return stats
+
+        def una_lectura():
+            lf = lazy()
+            return app._estadisticas_perfil(lf, app._revisiones_perfil(lf.collect_schema()))
+
+        t_datos, _ = cronometrar(lambda: app.validar_datos(lazy()), repeticiones=1)
+        t_sep, r_sep = cronometrar(por_separado, repeticiones=1)
+        t_una, r_una = cronometrar(una_lectura, repeticiones=1)
+        assert r_sep == r_una, "Estadísticas distintas"
+        hallazgos = app.perfilar_datos(lazy())
+        print(f"perfil filas={filas} csv={mb:.0f}MB revisiones={len(r_una) - 2} hallazgos={len(hallazgos)}")
+        print(f"  validar_datos={t_datos:.3f}s | perfil: una pasada por revisión={t_sep:.3f}s "
+              f"una lectura={t_una:.3f}s ({t_sep / t_una:.1f}x)")
+        for h in hallazgos:
+            print(f"    {h}")
+
+
+def bench_cargas(filas: int, parte_mb: int):
+    """Veredicto tras el último byte: upload completo + /api/v1/validar vs. carga por partes + finalizar."""
+    cliente = app.app.test_client()
+    habilitada = app.app.config["CACHE_HABILITADA"]
+    app.app.config["CACHE_HABILITADA"] = False  # mismo contenido en ambas rutas: sin caché se valida las dos veces
+    try:
+        data = df_abierto(filas, 12, acentos=True).write_csv().encode("utf-8")
+        parte = parte_mb * 1024 * 1024
+        t0 = time.perf_counter()
+        directo = cliente.post("/api/v1/validar", data={"archivo": (io.BytesIO(data), "cargas.csv")},
+                               content_type="multipart/form-data").get_json()
+        t_directo = time.perf_counter() - t0
+
+        carga = cliente.post("/api/v1/cargas", json={"nombre": "cargas.csv", "tamano": len(data)}).get_json()
+        url, offset, por_parte = carga["url"], 0, []
+        while offset < len(data):
+            if offset and len(por_parte) == 2:
+                # Corte de red a media parte: solo llegó la mitad y el cliente reanuda con GET
+                cliente.put(f"{url}?offset={offset}", data=data[offset:offset + parte // 2])
+                assert cliente.put(f"{url}?offset={offset}", data=data[offset:offset + parte]).status_code == 409
+                offset = cliente.get(url).get_json()["offset"]
+            t0 = time.perf_counter()
+            r = cliente.put(f"{url}?offset={offset}", data=data[offset:offset + parte])
+            por_parte.append(time.perf_counter() - t0)
+            offset = r.get_json()["offset"]
+        t0 = time.perf_counter()
+        final = cliente.post(f"{url}/finalizar").get_json()
+        t_final = time.perf_counter() - t0
+        assert final["observaciones"] == directo["observaciones"], "Observaciones distintas"
+        print(f"cargas filas={filas} csv={len(data) / 1024 / 1024:.0f}MB partes={len(por_parte)} de {parte_mb}MB")
+        print(f"  upload + /api/v1/validar={t_directo:.3f}s | por partes: finalizar={t_final:.3f}s "
+              f"revisión por parte media={sum(por_parte) / len(por_parte):.3f}s máx={max(por_parte):.3f}s")
+    finally:
+        app.app.config["CACHE_HABILITADA"] = habilitada
+
+
+# ---------------- SUITE CON LÍNEA BASE ----------------
+# (formato, filas, columnas, acentos, sucias, encoding). XLSX llega hasta 1,048,576 filas por hoja.
+PERFILES_SUITE = {
+    "rapido": [
+        ("csv", 1_000, 5, False, 0.0, "utf-8"),
+        ("csv", 100_000, 20, True, 0.001, "utf-8"),
+        ("csv", 100_000, 20, True, 0.001, "cp1252"),
+        ("csv", 10_000, 500, True, 0.01, "utf-8"),
+        ("xlsx", 10_000, 20, True, 0.001, "utf-8"),
+    ],
+    "completo": [
+        ("csv", 1_000, 5, False, 0.0, "utf-8"),
+        ("csv", 100_000, 20, True, 0.001, "utf-8"),
+        ("csv", 1_000_000, 50, True, 0.001, "utf-8"),
+        ("csv", 1_000_000, 5, True, 0.001, "latin-1"),
+        ("csv", 1_000_000, 20, True, 0.001, "cp1252"),
+        ("csv", 10_000_000, 10, False, 0.0001, "utf-8"),
+        ("csv", 100_000, 500, True, 0.01, "utf-8"),
+        ("xlsx", 10_000, 20, True, 0.001, "utf-8"),
+        ("xlsx", 100_000, 50, True, 0.001, "utf-8"),
+    ],
+}
+ETAPAS_SUITE = ("validar_formato_y_carga", "validar_nombres_columnas", "validar_datos", "construir_pdf", "ruta_validar")
+
+
+def nombre_caso(formato, filas, columnas, acentos, sucias, encoding) -> str:
+    return f"{formato}_{filas}x{columnas}_{'acentos' if acentos else 'ascii'}_{encoding}"
+
+
+def medir_caso(path: str, nombre_archivo: str, repeticiones: int) -> dict:
+    """Mediana de 'repeticiones' por etapa: el mejor tiempo de pocas corridas deja pasar ruido a la comparación."""
+    ext = nombre_archivo.rsplit(".", 1)[1]
+    streaming = app.app.config["VALIDACION_STREAMING"]
+    r = {}
+
+    def mediana(fn, *args):
+        return cronometrar(fn, *args, repeticiones=repeticiones, agregado=statistics.median)
+    r["validar_formato_y_carga"], (_, df) = mediana(app.validar_formato_y_carga, path, nombre_archivo, ext, streaming)
+    r["validar_nombres_columnas"], _ = mediana(app.validar_nombres_columnas, df)
+    r["validar_datos"], _ = mediana(app.validar_datos, df)
+    FINAL = app.ejecutar_validacion(path, nombre_archivo, ext, streaming=streaming)
+    r["construir_pdf"], _ = mediana(app.construir_pdf, FINAL, nombre_archivo, "benchmark")
+
+    # La ruta completa: el test client arma el multipart en memoria, así que solo hasta MAX_CONTENT_LENGTH
+    if os.path.getsize(path) < app.app.config["MAX_CONTENT_LENGTH"]:
+        client = app.app.test_client()
+
+        def ruta():
+            with open(path, "rb") as f:
+                resp = client.post("/validar", data={"archivo": (f, nombre_archivo)},
+                                   content_type="multipart/form-data")
+            assert resp.status_code == 200, resp.status_code
+        r["ruta_validar"], _ = mediana(ruta)
+    return {k: round(v, 6) for k, v in r.items()}
+
+
+def bench_suite(perfil: str, repeticiones: int, salida: str, comparar: str, umbral: float, minimo_s: float):
+    # Carpetas de trabajo temporales y sin caché de resultados: cada repetición valida de verdad
+    tmp = tempfile.mkdtemp(prefix="bench_suite_")
+    for attr in ("UPLOAD_FOLDER", "RESULTS_FOLDER", "LOGS_FOLDER", "REPORTS_FOLDER", "METRICAS_FOLDER",
+                 "CACHE_FOLDER"):
+        setattr(app, attr, tmp)
+    app.app.config["CACHE_HABILITADA"] = False
+    app.app.config["RESULTADOS_DB"] = os.path.join(tmp, "resultados.sqlite3")  # no el almacén real
+    app._resultados = None
+
+    resultados = {
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"), "perfil": perfil,
+            "repeticiones": repeticiones, "agregado": "mediana", "python": platform.python_version(), "polars": pl.__version__,
+            "plataforma": platform.platform(), "cpus": os.cpu_count(), "version_reglas": app.VERSION_REGLAS,
+        },
+        "casos": {},
+    }
+    try:
+        app.construir_pdf(final_sintetico(1), "calentamiento.csv")  # logos y fuentes fuera de la medición
+        for caso in PERFILES_SUITE[perfil]:
+            formato, filas, columnas, acentos, sucias, encoding = caso
+            nombre = nombre_caso(*caso)
+            path = os.path.join(tmp, f"{nombre}.{formato}")
+            t0 = time.perf_counter()
+            escribir_archivo(df_abierto(filas, columnas, acentos, sucias), path, formato, encoding)
+            generado = time.perf_counter() - t0
+            size = os.path.getsize(path)
+            tiempos = medir_caso(path, os.path.basename(path), repeticiones)
+            os.remove(path)
+            resultados["casos"][nombre] = {"bytes": size, "tiempos": tiempos}
+            print(f"{nombre} ({size / 1024 / 1024:.1f}MB, generado en {generado:.1f}s): "
+                  + " ".join(f"{k}={v:.4f}s" for k, v in tiempos.items()))
+        if app.app.config["AUDITORIA_ASINCRONA"]:
+            app.get_escritor().flush()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    print(f"Resultados en {salida}")
+    if comparar:
+        with open(comparar, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        regresiones = comparar_resultados(base, resultados, umbral, minimo_s)
+        if regresiones:
+            print(f"{len(regresiones)} regresión(es) por encima de {umbral:.0%}:")
+            for linea in regresiones:
+                print("  " + linea)
+            sys.exit(1)
+        print(f"Sin regresiones frente a {comparar} (umbral {umbral:.0%}).")
+
+
+def comparar_resultados(base: dict, actual: dict, umbral: float, minimo_s: float) -> list:
+    """
+    Mediciones más lentas que la base por más de 'umbral' (relativo) y de 'minimo_s'
+    (absoluto, para no reportar ruido en etapas de milisegundos).
+    """
+    for clave in ("cpus", "plataforma", "polars"):
+        if base.get("meta", {}).get(clave) != actual["meta"][clave]:
+            print(f"Aviso: la línea base se midió con otro {clave} ({base.get('meta', {}).get(clave)}).")
+    regresiones = []
+    for nombre, caso in actual["casos"].items():
+        caso_base = base.get("casos", {}).get(nombre)
+        if caso_base is None:
+            continue
+        for etapa, segundos in caso["tiempos"].items():
+            antes = caso_base["tiempos"].get(etapa)
+            if antes is None:
+                continue
+            if segundos > antes * (1 + umbral) and segundos - antes > minimo_s:
+                regresiones.append(f"{nombre} {etapa}: {antes:.4f}s -> {segundos:.4f}s (x{segundos / antes:.2f})")
+    return regresiones
+
+
+def bench_reglas(columnas: int):
+    """Reglas de nombres: re.search por columna vs. reglas.json sobre pl.Series; mensajes idénticos."""
+    for nombre in nombres_aleatorios(2000, semilla=1):
+        assert validar_nombre_archivo_legacy(nombre) == app.validar_nombre_archivo(nombre), nombre
+    for n in (10, 500, columnas):
+        df = pl.DataFrame({c: [1] for c in nombres_aleatorios(n)})
+        t_old, r_old = cronometrar(validar_nombres_columnas_legacy, df)
+        medicion = {}
+        t_new, r_new = cronometrar(app.validar_nombres_columnas, df, medicion)
+        assert r_old == r_new, "Diferencia en los mensajes de columnas"
+        reglas = " ".join(f"{k}={v:.5f}s" for k, v in medicion["reglas"].items())
+        print(f"reglas columnas={n} anterior={t_old:.5f}s nuevo={t_new:.5f}s x{t_old / max(t_new, 1e-9):.1f} [{reglas}]")
+
+
+def bench_incremental(filas: int, cambios: int):
+    """
+    Versión corregida de un dataset: validación completa vs. incremental (primera versión
+    sin estado y segunda reutilizando bloques). Los resultados deben ser idénticos.
+    """
+    v1 = df_abierto(filas, 10, acentos=True, sucias=0)
+    texto = v1.columns[0]
+    filas_cambio = [filas * (k + 1) // (cambios + 1) for k in range(cambios)]
+    v2 = v1.with_columns(pl.when(pl.int_range(0, pl.len()).is_in(filas_cambio))
+                         .then(" " + pl.col(texto)).otherwise(pl.col(texto)).alias(texto))
+    cache_folder = app.CACHE_FOLDER
+    with tempfile.TemporaryDirectory() as tmp:
+        app.CACHE_FOLDER, app._cache = os.path.join(tmp, "cache"), None
+        try:
+            rutas = {}
+            for nombre, df in (("v1", v1), ("v2", v2)):
+                rutas[nombre] = os.path.join(tmp, f"{nombre}.csv")
+                escribir_archivo(df, rutas[nombre], "csv", "utf-8")
+            size_mb = os.path.getsize(rutas["v2"]) / 1024 / 1024
+            for nombre in ("v1", "v2"):
+                completo, incremental = {}, {}
+                t0 = time.perf_counter()
+                r_completo = app.ejecutar_validacion(rutas[nombre], "datos.csv", "csv", streaming=True,
+                                                     medicion=completo)
+                t1 = time.perf_counter()
+                r_incremental = app.ejecutar_validacion(rutas[nombre], "datos.csv", "csv", streaming=True,
+                                                        medicion=incremental, incremental=True,
+                                                        dataset="benchmark")
+                t2 = time.perf_counter()
+                assert r_completo["datos"] == r_incremental["datos"], "Diferencia en las observaciones"
+                assert completo["filas"] == incremental["filas"], "Diferencia en el conteo de filas"
+                print(f"incremental[{nombre}] archivo={size_mb:.0f}MB completo={t1 - t0:.3f}s "
+                      f"(datos={completo['etapas']['datos']:.3f}s) incremental={t2 - t1:.3f}s "
+                      f"(datos={incremental['etapas']['datos']:.3f}s) {incremental.get('incremental')}")
+        finally:
+            app.CACHE_FOLDER, app._cache = cache_folder, None
+
+
+def pico_python(fn, *args):
+    """(segundos, pico de memoria asignada por Python en MB, resultado) vía tracemalloc."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    resultado = fn(*args)
+    elapsed = time.perf_counter() - t0
+    pico = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return elapsed, pico, resultado
+
+
+def bench_codificacion(filas: int):
+    """is_utf8 previo (archivo completo + decode) vs. inspeccionar_codificacion (mmap por bloques)."""
+    df = df_abierto(filas, 10, acentos=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        for encoding in ("utf-8", "cp1252"):
+            path = os.path.join(tmp, f"datos_{encoding}.csv")
+            escribir_archivo(df, path, "csv", encoding)
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            t_old, m_old, r_old = pico_python(is_utf8_legacy, path)
+            t_new, m_new, r_new = pico_python(app.inspeccionar_codificacion, path)
+            assert r_old == r_new["utf8"]
+            print(f"codificacion[{encoding}] archivo={size_mb:.0f}MB anterior={t_old:.3f}s/{m_old:.0f}MB "
+                  f"nuevo={t_new:.3f}s/{m_new:.1f}MB resultado={r_new}")
+            if encoding != "utf-8":
+                # Filas legibles: antes ignore_errors dejaba en null las filas con bytes inválidos
+                antes = pl.read_csv(path, infer_schema_length=10000, ignore_errors=True)
+                _, despues = app.validar_formato_y_carga(path, os.path.basename(path), "csv", streaming=False)
+                if os.path.exists(app.ruta_utf8(path)):
+                    os.remove(app.ruta_utf8(path))
+                col = antes.columns[0]
+                print(f"  filas con texto nulo en '{col}': anterior={antes[col].null_count()} "
+                      f"nuevo={despues[despues.columns[0]].null_count()}")
+
+
+def _rss_anon_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class MuestreoRSS(threading.Thread):
+    """
+    Pico de memoria anónima (heap) muestreado cada 5 ms. ru_maxrss también cuenta las
+    páginas del CSV mapeadas con mmap por Polars, que son caché de disco recuperable.
+    """
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.pico = 0.0
+        self._alto = threading.Event()
+
+    def run(self):
+        while not self._alto.is_set():
+            self.pico = max(self.pico, _rss_anon_mb())
+            time.sleep(0.005)
+
+    def detener(self) -> float:
+        self._alto.set()
+        self.join()
+        return max(self.pico, _rss_anon_mb())
+
+
+def _pico_rss(modo: str, path: str):
+    """Se ejecuta en un subproceso para que ru_maxrss refleje solo ese modo."""
+    muestreo = MuestreoRSS()
+    muestreo.start()
+    t0 = time.perf_counter()
+    if modo == "memoria":
+        validar_csv_en_memoria(path)
+    else:
+        _, df = app.validar_formato_y_carga(path, os.path.basename(path), "csv", streaming=True)
+        app.validar_datos(df)
+    elapsed = time.perf_counter() - t0
+    anon_mb = muestreo.detener()
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB en Linux
+    print(f"{rss_mb:.1f} {anon_mb:.1f} {elapsed:.3f}")
+
+
+def bench_memoria(filas: int):
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        df_sintetico(filas).write_csv(path)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        for modo in ("memoria", "streaming"):
+            out = subprocess.run([sys.executable, __file__, "_rss", modo, path],
+                                 capture_output=True, text=True, check=True).stdout.split()
+            print(f"csv[{modo}] archivo={size_mb:.1f}MB pico_rss={out[0]}MB "
+                  f"pico_anon={out[1]}MB tiempo={out[2]}s")
+    finally:
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="caso", required=True)
+    p = sub.add_parser("datos", help="validar_datos: ruta anterior vs. expresiones nativas")
+    p.add_argument("--filas", type=int, default=1_000_000)
+    p = sub.add_parser("memoria", help="pico de RSS: upload en memoria vs. streaming desde disco")
+    p.add_argument("--filas", type=int, default=5_000_000)
+    p = sub.add_parser("excel", help="lector Excel: conversión celda por celda vs. cada backend de EXCEL_LECTORES")
+    p.add_argument("--filas", type=int, default=50_000)
+    p = sub.add_parser("pdf", help="construir_pdf con muchas observaciones")
+    p.add_argument("--observaciones", type=int, default=1000)
+    p = sub.add_parser("pdfdescarga", help="pico de memoria de /descargar/pdf: bytes en memoria vs. archivo por ruta")
+    p.add_argument("--observaciones", type=int, default=20000)
+    p = sub.add_parser("modos", help="validar_datos: completo vs. primer-hallazgo vs. muestra")
+    p.add_argument("--filas", type=int, default=2_000_000)
+    p = sub.add_parser("auditoria", help="log/reporte: escritura directa vs. escritor en lotes con flock")
+    p.add_argument("--procesos", type=int, default=4)
+    p.add_argument("--hilos", type=int, default=8)
+    p.add_argument("--entradas", type=int, default=2000)
+    p = sub.add_parser("codificacion", help="is_utf8 en memoria vs. inspección por bloques sobre mmap")
+    p.add_argument("--filas", type=int, default=1_000_000)
+    p = sub.add_parser("reglas", help="reglas de nombres: re.search en línea vs. reglas.json vectorizadas")
+    p.add_argument("--columnas", type=int, default=5000)
+    p = sub.add_parser("incremental", help="versión corregida: validación completa vs. bloques reutilizados")
+    p.add_argument("--filas", type=int, default=1_000_000)
+    p.add_argument("--cambios", type=int, default=3)
+    p = sub.add_parser("resultados", help="final_{token}.json por petición vs. almacén SQLite con vencimiento")
+    p.add_argument("--procesos", type=int, default=4)
+    p.add_argument("--tokens", type=int, default=2000)
+    p.add_argument("--viejos", type=int, default=20000)
+    p = sub.add_parser("arranque", help="import de app y primera petición a /, validar y PDF en un proceso nuevo")
+    p.add_argument("--repeticiones", type=int, default=5)
+    p = sub.add_parser("analitica", help="agregados de reportes: CSV en cada consulta vs. rollup Parquet incremental")
+    p.add_argument("--semanas", type=int, default=104)
+    p.add_argument("--filas", type=int, default=20000)
+    p = sub.add_parser("perfil", help="perfilar_datos: una pasada por revisión vs. una sola lectura")
+    p.add_argument("--filas", type=int, default=1_000_000)
+    p = sub.add_parser("cargas", help="veredicto tras el último byte: /api/v1/validar vs. carga por partes")
+    p.add_argument("--filas", type=int, default=1_000_000, help="12 columnas: más de ~1.5M excede MAX_CONTENT_LENGTH")
+    p.add_argument("--parte-mb", type=int, default=8)
+    p = sub.add_parser("suite", help="archivos sintéticos por perfil, resultados JSON y comparación con línea base")
+    p.add_argument("--perfil", choices=sorted(PERFILES_SUITE), default="rapido")
+    p.add_argument("--repeticiones", type=int, default=5)
+    p.add_argument("--salida", default="benchmark_resultados.json")
+    p.add_argument("--comparar", help="JSON de una corrida anterior usado como línea base")
+    p.add_argument("--umbral", type=float, default=0.25, help="regresión relativa tolerada (0.25 = 25%%)")
+    p.add_argument("--minimo-s", type=float, default=0.05, help="diferencia absoluta mínima para contar")
+    p = sub.add_parser("_rss")  # interno: un modo por subproceso
+    p.add_argument("modo", choices=("memoria", "streaming"))
+    p.add_argument("ruta")
+    args = parser.parse_args()
+    if args.caso == "datos":
+        bench_datos(args.filas)
+    elif args.caso == "memoria":
+        bench_memoria(args.filas)
+    elif args.caso == "excel":
+        bench_excel(args.filas)
+    elif args.caso == "pdf":
+        bench_pdf(args.observaciones)
+    elif args.caso == "pdfdescarga":
+        bench_pdfdescarga(args.observaciones)
+    elif args.caso == "modos":
+        bench_modos(args.filas)
+    elif args.caso == "auditoria":
+        bench_auditoria(args.procesos, args.hilos, args.entradas)
+    elif args.caso == "codificacion":
+        bench_codificacion(args.filas)
+    elif args.caso == "reglas":
+        bench_reglas(args.columnas)
+    elif args.caso == "incremental":
+        bench_incremental(args.filas, args.cambios)
+    elif args.caso == "resultados":
+        bench_resultados(args.procesos, args.tokens, args.viejos)
+    elif args.caso == "arranque":
+        bench_arranque(args.repeticiones)
+    elif args.caso == "analitica":
+        bench_analitica(args.semanas, args.filas)
+    elif args.caso == "perfil":
+        bench_perfil(args.filas)
+    elif args.caso == "cargas":
+        bench_cargas(args.filas, args.parte_mb)
+    elif args.caso == "suite":
+        bench_suite(args.perfil, args.repeticiones, args.salida, args.comparar, args.umbral, args.minimo_s)
+    elif args.caso == "_rss":
+        _pico_rss(args.modo, args.ruta)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Carga por partes (/api/v1/cargas) frente a un solo POST a /api/v1/validar: mismas
+observaciones y filas, con partes que cortan campos entre comillas y archivos que no son UTF-8.
+"""
+import atexit
+import io
+import random
+
+import pytest
+
+import app
+
+CASOS = {
+    "simple.csv": b"a,b,c\n1, x,2\n2,y ,3\n",
+    "sin_salto.csv": b"a,b\n1,x\n2, y",
+    # Campos entre comillas con salto de línea: las partes los cortan a la mitad
+    "comillas.csv": b"a,b\n" + b"".join(b'%d,"%slinea\n%d"\n' % (i, b" " if i == 250 else b"", i)
+                                        for i in range(300)),
+    "cp1252.csv": ("a,b\n" + "".join(f"{i},“x” {i}\n" for i in range(200))).encode("cp1252"),
+    "latin1.csv": ("a,b\n" + "".join(f"{i},año {i}\n" for i in range(2000)) + "1, ñ\n").encode("latin-1"),
+    "mezcla.csv": ("a,b\n" + "".join(f"{i},ñ {i}\n" for i in range(2000))).encode() + b"1,\xe9\n",
+}
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    for carpeta in ("UPLOAD_FOLDER", "LOGS_FOLDER", "REPORTS_FOLDER", "METRICAS_FOLDER"):
+        (tmp_path / carpeta).mkdir()
+        monkeypatch.setattr(app, carpeta, str(tmp_path / carpeta))
+    monkeypatch.setitem(app.app.config, "RESULTADOS_BACKEND", "memoria")
+    monkeypatch.setitem(app.app.config, "CACHE_HABILITADA", False)
+    monkeypatch.setitem(app.app.config, "AUDITORIA_ASINCRONA", False)
+    monkeypatch.setitem(app.app.config, "INCREMENTAL_BLOQUE_MB", 0.001)  # varios bloques por parte
+    monkeypatch.setattr(app, "_resultados", None)
+    monkeypatch.setattr(app, "_volcado", None)
+    yield app.app.test_client()
+    if app._volcado is not None:  # hilo de esta prueba: vuelca en tmp_path y no al salir en METRICAS_FOLDER
+        atexit.unregister(app._volcado.detener)
+        app._volcado.detener()
+
+
+def directo(cliente, data, nombre):
+    return cliente.post("/api/v1/validar", data={"archivo": (io.BytesIO(data), nombre)},
+                        content_type="multipart/form-data").get_json()
+
+
+def por_partes(cliente, data, nombre, parte, corte=False):
+    r = cliente.post("/api/v1/cargas", json={"nombre": nombre, "tamano": len(data)})
+    assert r.status_code == 201, r.get_json()
+    url = f"/api/v1/cargas/{r.get_json()['carga']}"
+    rnd, offset = random.Random(parte), 0
+    while offset < len(data):
+        n = rnd.randint(1, parte)
+        if corte:
+            # Corte de red a media parte: llega la mitad, el reintento completo choca y se reanuda con GET
+            corte = False
+            cliente.put(f"{url}?offset={offset}", data=data[offset:offset + n // 2])
+            if n // 2:
+                assert cliente.put(f"{url}?offset={offset}", data=data[offset:offset + n]).status_code == 409
+            offset = cliente.get(url).get_json()["offset"]
+            continue
+        r = cliente.put(f"{url}?offset={offset}", data=data[offset:offset + n])
+        assert r.status_code == 200, r.get_json()
+        offset = r.get_json()["offset"]
+    return cliente.post(f"{url}/finalizar").get_json()
+
+
+# Partes de 7 bytes solo en los archivos chicos: miles de PUT por archivo
+@pytest.mark.parametrize("nombre,parte", [(n, p) for n, data in CASOS.items() for p in (7, 1000, 70_000)
+                                          if p > 7 or len(data) < 5000])
+def test_igual_que_un_solo_post(cliente, nombre, parte):
+    data = CASOS[nombre]
+    esperado = directo(cliente, data, nombre)
+    resultado = por_partes(cliente, data, nombre, parte)
+    assert resultado["observaciones"] == esperado["observaciones"]
+    assert resultado["filas"] == esperado["filas"]
+
+
+def test_reanuda_tras_corte(cliente):
+    data = CASOS["comillas.csv"]
+    esperado = directo(cliente, data, "comillas.csv")
+    assert por_partes(cliente, data, "comillas.csv", 500, corte=True)["observaciones"] == esperado["observaciones"]
+
+
+def test_casos_con_hallazgos(cliente):
+    """Que la paridad no sea solo entre dos respuestas vacías."""
+    assert directo(cliente, CASOS["comillas.csv"], "comillas.csv")["observaciones"]["datos"] == [
+        "La columna b tiene valores con espacios al inicio o final."]
+    for nombre in ("cp1252.csv", "latin1.csv", "mezcla.csv"):
+        assert "UTF-8" in directo(cliente, CASOS[nombre], nombre)["observaciones"]["formato"][0]
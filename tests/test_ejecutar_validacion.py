@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""ejecutar_validacion con CSV que Polars no puede leer: misma observación con y sin streaming."""
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize("contenido", [b"a,b\n1,2,3\n", b"a,b\n1,2\n3,4,\n"], ids=["campo_extra", "coma_final"])
+@pytest.mark.parametrize("streaming", [False, True], ids=["memoria", "streaming"])
+def test_csv_irregular(tmp_path, contenido, streaming):
+    ruta = tmp_path / "datos.csv"
+    ruta.write_bytes(contenido)
+    final = app.ejecutar_validacion(str(ruta), "datos.csv", "csv", streaming=streaming)
+    assert len(final["formato"]) == 1
+    assert final["formato"][0].startswith("No fue posible leer el CSV:")
+    assert final["datos"] == ["No se encontraron observaciones sobre los datos."]
+    assert not app.pasa_validacion(final)
+
+
+@pytest.mark.parametrize("modo", app.MODOS_VALIDACION[:2])
+def test_csv_irregular_igual_en_ambos_modos(tmp_path, modo):
+    ruta = tmp_path / "datos.csv"
+    ruta.write_bytes(b"a,b\n" + b"x,y\n" * 1000 + b"1,2,3\n")
+    finales = [app.ejecutar_validacion(str(ruta), "datos.csv", "csv", streaming=s, modo=modo, perfil=True)
+               for s in (False, True)]
+    assert finales[0] == finales[1]
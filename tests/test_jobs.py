@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""Trabajos asíncronos cuyo worker murió: /estado y /resultados los reportan como error."""
+import time
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setitem(app.app.config, "RESULTADOS_BACKEND", "memoria")
+    monkeypatch.setattr(app, "_resultados", None)
+    return app.app.test_client()
+
+
+@pytest.mark.parametrize("estado", [app.JOB_EN_COLA, app.JOB_PROCESANDO])
+def test_trabajo_vencido(cliente, tmp_path, estado):
+    upload = tmp_path / "upload.csv"
+    upload.write_bytes(b"a\n1\n")
+    vence = time.time() - app.app.config["JOBS_MARGEN_S"] - 1
+    app._actualizar_job("vencido", estado=estado, nombre_archivo="x.csv", archivo=str(upload), vence=vence)
+    app._actualizar_job("vigente", estado=estado, nombre_archivo="y.csv", archivo=str(upload),
+                        vence=time.time() + 60)
+
+    assert cliente.get("/estado/vigente").get_json()["estado"] == estado
+    assert cliente.get("/resultados/vigente").status_code == 202
+    assert upload.exists()
+
+    data = cliente.get("/estado/vencido").get_json()
+    assert data["estado"] == app.JOB_ERROR and "tiempo máximo" in data["error"]
+    assert not upload.exists()
+    assert "tiempo máximo" in cliente.get("/resultados/vencido").get_data(as_text=True)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""extraer_zip: miembros rechazados y límites revisados con infolist() antes de extraer."""
+import os
+import zipfile
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def zip_lote(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "UPLOAD_FOLDER", str(tmp_path / "uploads"))
+    os.makedirs(app.UPLOAD_FOLDER)
+    ruta = tmp_path / "lote.zip"
+    with zipfile.ZipFile(ruta, "w") as zf:
+        zf.writestr("datos/uno.csv", "a\n1\n")
+        zf.writestr("dos.xlsx", b"PK")
+        zf.writestr("notas.txt", "x")
+        zf.writestr("__MACOSX/._uno.csv", "x")
+        zf.writestr("vacia/", "")
+    return str(ruta)
+
+
+def test_rechaza_otras_extensiones(zip_lote):
+    archivos, rechazados = app.extraer_zip(zip_lote, 1024, 10)
+    assert [a[0] for a in archivos] == ["uno.csv", "dos.xlsx"]
+    assert rechazados == ["notas.txt"]
+    assert sorted(os.listdir(app.UPLOAD_FOLDER)) == sorted(os.path.basename(a[1]) for a in archivos)
+
+
+def test_limites_antes_de_extraer(zip_lote):
+    with pytest.raises(app.LoteExcedido):
+        app.extraer_zip(zip_lote, 1024, 1)
+    with pytest.raises(ValueError, match="excede el límite"):
+        app.extraer_zip(zip_lote, 5, 10)
+    assert os.listdir(app.UPLOAD_FOLDER) == []
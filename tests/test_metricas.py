@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Volcado de métricas por proceso y consolidación de los procesos que ya terminaron."""
+import json
+import os
+import subprocess
+import sys
+
+import app
+
+
+def _volcado(folder, nombre, validaciones):
+    with open(os.path.join(folder, nombre), "w", encoding="utf-8") as f:
+        json.dump([["validador_validaciones_total", {"cache": "-", "estado": "OK"}, [validaciones]]], f)
+
+
+def _total(folder):
+    linea = 'validador_validaciones_total{cache="-",estado="OK"} '
+    return float(next(l for l in app.exponer_metricas(folder).splitlines() if l.startswith(linea))[len(linea):])
+
+
+def test_volcar_solo_si_cambio(tmp_path):
+    metricas = app.Metricas(app.METRICAS_DEF)
+    metricas.volcar(str(tmp_path))
+    assert os.listdir(tmp_path) == []
+    metricas.incrementar("validador_validaciones_total", cache="-", estado="OK")
+    metricas.volcar(str(tmp_path))
+    (archivo,) = os.listdir(tmp_path)
+    assert app._RE_VOLCADO.match(archivo) and archivo.startswith(f"metricas_{os.getpid()}_")
+    os.remove(tmp_path / archivo)
+    metricas.volcar(str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_consolida_procesos_terminados_sin_bajar_contadores(tmp_path):
+    proceso = subprocess.Popen([sys.executable, "-c", "pass"])
+    proceso.wait()
+    folder = str(tmp_path)
+    _volcado(folder, f"metricas_{proceso.pid}_0a0a0a0a.json", 5)
+    _volcado(folder, f"metricas_{proceso.pid}.json", 2)  # nombre anterior, sin sufijo
+    _volcado(folder, f"metricas_{os.getpid()}_0b0b0b0b.json", 3)  # proceso vivo
+    assert _total(folder) == 10
+
+    app.consolidar_metricas(folder)
+    assert sorted(os.listdir(folder)) == sorted([".metricas.lock", app.METRICAS_HISTORICO,
+                                                 f"metricas_{os.getpid()}_0b0b0b0b.json"])
+    assert _total(folder) == 10
+    # Un proceso nuevo con el mismo pid escribe su propio archivo: suma, no reemplaza
+    _volcado(folder, f"metricas_{proceso.pid}_0c0c0c0c.json", 1)
+    assert _total(folder) == 11
+    app.consolidar_metricas(folder)
+    assert _total(folder) == 11
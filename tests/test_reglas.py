@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Paridad de las reglas de nombres (reglas.json evaluadas con Polars) con las reglas que
+estaban en el código: re.search por columna y mismos mensajes.
+"""
+import random
+import re
+
+import polars as pl
+import pytest
+
+import app
+
+PIEZAS = ["año", "dato", "_", "__", "x", "Ñ", "ü", " ", "clave", "é", "a_b_c", "", "1", "Á", "ú"]
+
+
+def validar_nombre_archivo_legacy(nom_arch: str):
+    obs = []
+    if re.search(r"[ñáéíóúüÑÁÉÍÓÚÜ]", nom_arch):
+        obs.append("El nombre del archivo contiene caracteres especiales (ñ, tildes, diéresis).")
+    if " " in nom_arch:
+        obs.append("El nombre del archivo no debe tener espacios. Se recomienda usar guiones bajos para separar palabras.")
+    return obs or ["No se encontraron observaciones con el nombre del archivo."]
+
+
+def validar_nombres_columnas_legacy(df):
+    if df.is_empty():
+        return ["No se encontraron observaciones de los nombres de las columnas."]
+    obs = []
+    especiales = [c for c in df.columns if re.search(r"[ñáéíóúüÑÁÉÍÓÚÜ]", c or "")]
+    if especiales:
+        obs.append("Nombre de columnas con caracteres especiales: " + " | ".join(especiales))
+    largas = [c for c in df.columns if len([p for p in (c or "").split("_") if p]) > 5]
+    if largas:
+        obs.append("Nombre de columnas con más de 5 palabras: " + " | ".join(largas))
+    return obs or ["No se encontraron observaciones de los nombres de las columnas."]
+
+
+def nombres_aleatorios(n, semilla):
+    rnd = random.Random(semilla)
+    nombres = set()
+    while len(nombres) < n:
+        nombres.add("".join(rnd.choice(PIEZAS) for _ in range(rnd.randint(1, 12))) + f"{len(nombres)}")
+    return sorted(nombres)
+
+
+BORDES = ["", " ", "_", "a_b_c_d_e", "a_b_c_d_e_f", "a__b__c__d__e__f", "_a_b_c_d_e_f_", "ñ", "Ü", "ç", "n\u0303",  # ñ descompuesta (NFD)
+          "año 2024", "reporte\tfinal", "a" * 300]
+
+
+@pytest.mark.parametrize("nombre", BORDES)
+def test_nombre_archivo(nombre):
+    assert app.validar_nombre_archivo(nombre) == validar_nombre_archivo_legacy(nombre)
+
+
+def test_nombres_de_archivo_aleatorios():
+    for nombre in nombres_aleatorios(2000, semilla=1):
+        assert app.validar_nombre_archivo(nombre) == validar_nombre_archivo_legacy(nombre), nombre
+
+
+@pytest.mark.parametrize("nombres", [
+    ["a"], BORDES[1:], nombres_aleatorios(10, semilla=2), nombres_aleatorios(500, semilla=3),
+], ids=["una", "bordes", "diez", "quinientas"])
+def test_nombres_columnas(nombres):
+    df = pl.DataFrame({c: [1] for c in nombres})
+    assert app.validar_nombres_columnas(df) == validar_nombres_columnas_legacy(df)
+    assert app.validar_nombres_columnas(df.lazy()) == validar_nombres_columnas_legacy(df)
+
+
+def test_sin_filas():
+    df = pl.DataFrame({"año": pl.Series([], dtype=pl.Int64)})
+    assert app.validar_nombres_columnas(df) == validar_nombres_columnas_legacy(df)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+r"""
+Paridad de validar_datos (expresiones de Polars) con la implementación histórica:
+map_elements + re.match(r'^\s|\s$') celda por celda.
+"""
+import re
+import sys
+from datetime import date, datetime
+
+import polars as pl
+import pytest
+
+import app
+
+SIN_OBSERVACIONES = ["No se encontraron observaciones sobre los datos."]
+# Todo lo que \s de Python reconoce en str (incluye \x1c-\x1f, NEL, NBSP, U+2000-U+200A, U+3000...)
+ESPACIOS = [chr(c) for c in range(sys.maxunicode + 1) if re.match(r"\s", chr(c))]
+# Parecidos a espacio que \s no reconoce: no deben reportarse
+NO_ESPACIOS = ["\u200b", "\u180e", "\ufeff", "\u2060", "x"]
+
+
+def validar_datos_legacy(df: pl.DataFrame):
+    if df.is_empty():
+        return ["No se encontraron observaciones sobre los datos."]
+    obs = []
+    for c in df.columns:
+        try:
+            serie_str = df[c].cast(pl.Utf8, strict=False)
+            has_spaces = serie_str.drop_nulls().map_elements(
+                lambda x: bool(re.match(r'^\s|\s$', str(x))) if x is not None else False,
+                return_dtype=pl.Boolean
+            ).any()
+            if has_spaces:
+                obs.append(f"La columna {c} tiene valores con espacios al inicio o final.")
+        except Exception:
+            continue
+    return obs or ["No se encontraron observaciones sobre los datos."]
+
+
+def assert_paridad(df: pl.DataFrame):
+    esperado = validar_datos_legacy(df)
+    assert app.validar_datos(df) == esperado
+    assert app.validar_datos(df.lazy()) == esperado
+    assert app.validar_datos(df, app.MODO_PRIMER_HALLAZGO) == esperado
+
+
+def test_cubre_todos_los_espacios_de_python():
+    assert len(ESPACIOS) == 29
+    assert {"\x1c", "\x85", "\xa0", "\u1680", "\u2028", "\u202f", "\u3000"} <= set(ESPACIOS)
+
+
+@pytest.mark.parametrize("espacio", ESPACIOS, ids=lambda c: f"U+{ord(c):04X}")
+def test_espacio_al_inicio_y_al_final(espacio):
+    df = pl.DataFrame({
+        "inicio": ["a", f"{espacio}b", None],
+        "final": ["a", f"b{espacio}", None],  # re.match solo evalúa la posición 0
+        "solo": ["a", espacio, "c"],
+        "interior": ["a", f"b{espacio}c", None],
+    })
+    assert_paridad(df)
+    assert app.validar_datos(df) == [
+        "La columna inicio tiene valores con espacios al inicio o final.",
+        "La columna solo tiene valores con espacios al inicio o final.",
+    ]
+
+
+@pytest.mark.parametrize("caracter", NO_ESPACIOS, ids=lambda c: f"U+{ord(c):04X}")
+def test_caracteres_que_no_son_espacio(caracter):
+    assert_paridad(pl.DataFrame({"c": [f"{caracter}a", "b"]}))
+
+
+def test_todas_las_celdas_en_una_columna():
+    assert_paridad(pl.DataFrame({"c": ["ok"] * 1000 + [f"{e}v" for e in ESPACIOS] + [None]}))
+
+
+def test_nulos():
+    assert_paridad(pl.DataFrame({
+        "todo_nulo": pl.Series([None, None], dtype=pl.Utf8),
+        "nulo_tipo_null": [None, None],
+        "con_nulos": [None, " x"],
+        "vacio": ["", None],
+    }))
+
+
+def test_tipos_no_texto():
+    assert_paridad(pl.DataFrame({
+        "entero": [1, -2, None],
+        "flotante": [1.5, float("nan"), None],
+        "booleano": [True, False, None],
+        "fecha": [date(2024, 1, 1), None, date(2024, 1, 2)],
+        "fecha_hora": [datetime(2024, 1, 1, 3, 4, 5), None, None],
+        "categoria": pl.Series(["a", " b", None], dtype=pl.Categorical),
+        "lista": [[1], [2, 3], None],
+        "texto": ["a", "b", "\tc"],
+    }))
+
+
+def test_sin_filas():
+    assert_paridad(pl.DataFrame({"c": pl.Series([], dtype=pl.Utf8)}))
+    assert app.validar_datos(pl.DataFrame()) == SIN_OBSERVACIONES
+
+
+def test_csv_en_disco(tmp_path):
+    """primer-hallazgo sobre el CSV (lotes de read_csv_batched) frente a la lectura completa."""
+    ruta = tmp_path / "datos.csv"
+    filas = ["a,b,n"] + [f"v{i},w{i},{i}" for i in range(200_000)] + ['"\u3000z","w ",1']
+    ruta.write_text("\n".join(filas) + "\n", encoding="utf-8")
+    esperado = validar_datos_legacy(pl.read_csv(ruta))
+    assert esperado == ["La columna a tiene valores con espacios al inicio o final."]
+    for modo in (app.MODO_COMPLETO, app.MODO_PRIMER_HALLAZGO):
+        assert app.validar_datos(pl.scan_csv(ruta), modo, fuente=str(ruta)) == esperado
+
+
+def test_muestra_csv_con_comillas(tmp_path):
+    """Los bloques de la muestra no empiezan dentro de un campo entre comillas con saltos de línea."""
+    ruta = tmp_path / "datos.csv"
+    # Un corte dentro de q dejaría ", z" como inicio de un valor: espacio que no existe
+    filas = ["a,q,n"] + [f'{" " if i % 1000 == 0 else ""}v{i},"l{i}\n, z",{i}' for i in range(300_000)]
+    ruta.write_text("\n".join(filas) + "\n", encoding="utf-8")
+    lf = pl.scan_csv(ruta)
+    indices, revisadas, estimadas = app._muestra_csv(str(ruta), lf.collect_schema(), 10_000)
+    assert indices == [0]
+    assert 8_000 <= revisadas <= 12_000 and estimadas > 250_000
+    obs = app.validar_datos(lf, app.MODO_MUESTRA, 10_000, fuente=str(ruta))
+    assert len(obs) == 1 and obs[0].startswith("La columna a tiene valores con espacios al inicio o final (muestra de")
+
+
+def test_muestra_csv_sin_hallazgos_y_archivo_chico(tmp_path):
+    ruta = tmp_path / "datos.csv"
+    ruta.write_text("a,n\n" + "".join(f"v{i},{i}\n" for i in range(50_000)) + " x,1\n", encoding="utf-8")
+    lf = pl.scan_csv(ruta)
+    obs = app.validar_datos(lf, app.MODO_MUESTRA, 1_000, fuente=str(ruta))
+    assert len(obs) == 1 and "con 95% de confianza" in obs[0]
+    # Sin más filas que la muestra se revisa todo
+    medicion = {}
+    obs = app.validar_datos(lf, app.MODO_MUESTRA, 100_000, medicion, fuente=str(ruta))
+    assert obs == ["La columna a tiene valores con espacios al inicio o final."] and medicion["filas"] == 50_001